@@ -0,0 +1,94 @@
+import logging
+import os
+import pandas as pd
+from config import CANDLE_STORE_DIR
+from utils import ensure_dir_exists
+
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+_EPOCH = pd.Timestamp(0)
+HOUR_MS = 60 * 60 * 1000
+# 由1h K线聚合的周期及其小时数，聚合规则与交易所一致
+DERIVED_TIMEFRAME_HOURS = {
+    '4h': 4,
+    '1d': 24,
+}
+AGGREGATION_RULES = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+}
+
+
+def to_epoch_ms(timestamps):
+    """把无时区的UTC时间列转换为毫秒时间戳（int64）"""
+    return ((timestamps - _EPOCH) // pd.Timedelta(milliseconds=1)).astype('int64')
+
+
+def get_candle_store_path(symbol, timeframe):
+    market = symbol.split(':')[0].replace('/', '').upper()
+    return os.path.join(CANDLE_STORE_DIR, f"{market}_{timeframe}.csv")
+
+
+def load_candles(symbol, timeframe):
+    """读取本地保存的K线，不存在或损坏时返回空DataFrame"""
+    path = get_candle_store_path(symbol, timeframe)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    try:
+        df = pd.read_csv(path)
+        if not set(CANDLE_COLUMNS).issubset(df.columns):
+            logging.warning(f"本地K线文件格式异常，忽略: {path}")
+            return pd.DataFrame(columns=CANDLE_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df[CANDLE_COLUMNS]
+    except Exception as e:
+        logging.warning(f"读取本地K线 {symbol} {timeframe} 失败，将重新全量抓取: {e}")
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+
+
+def save_candles(symbol, timeframe, df):
+    """原子写入本地K线（先写临时文件再替换）"""
+    path = get_candle_store_path(symbol, timeframe)
+    ensure_dir_exists(os.path.dirname(path))
+    out = df[CANDLE_COLUMNS].copy()
+    out['timestamp'] = to_epoch_ms(out['timestamp'])
+    tmp_path = f"{path}.tmp"
+    out.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def merge_candles(stored, fresh, max_rows):
+    """合并本地与新抓取的K线，同一时间戳以新数据为准（未收盘K线会被覆盖）"""
+    if stored is None or stored.empty:
+        merged = fresh
+    elif fresh is None or fresh.empty:
+        merged = stored
+    else:
+        merged = pd.concat([stored, fresh], ignore_index=True)
+    merged = (
+        merged.drop_duplicates(subset='timestamp', keep='last')
+        .sort_values('timestamp')
+        .tail(max_rows)
+        .reset_index(drop=True)
+    )
+    return merged[CANDLE_COLUMNS]
+
+
+def aggregate_candles(base, timeframe, offset_ms=0):
+    """
+    由1h K线聚合出4h/1d K线：周期起点按UTC对齐（offset_ms 为起点相对UTC零点的偏移，
+    如Bitget日线为16:00 UTC），开盘取首根、最高/最低取极值、收盘取末根、成交量求和。
+    基础数据开头不足一个完整周期的那根会被丢弃，最后一根未收盘K线保留（与交易所一致）
+    """
+    if base is None or base.empty:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    period = DERIVED_TIMEFRAME_HOURS[timeframe] * HOUR_MS
+    timestamps = to_epoch_ms(base['timestamp']).to_numpy()
+    buckets = (timestamps - offset_ms) // period * period + offset_ms
+    grouped = base[list(AGGREGATION_RULES)].groupby(buckets, sort=True).agg(AGGREGATION_RULES)
+    if timestamps[0] != buckets[0]:
+        grouped = grouped.iloc[1:]
+    grouped.insert(0, 'timestamp', pd.to_datetime(grouped.index, unit='ms'))
+    return grouped.reset_index(drop=True)[CANDLE_COLUMNS]
@@ -6,15 +6,103 @@ DATA_DIR = os.getenv('DATA_DIR', _DEFAULT_DATA_DIR)
 TMP_DIR = os.path.join(DATA_DIR, 'tmp')
 ALLOWED_USERS_FILE = os.path.join(DATA_DIR, 'allowed_users.txt')
 USER_SETTINGS_FILE = os.path.join(DATA_DIR, 'user_settings.json')
+USER_DB_FILE = os.path.join(DATA_DIR, 'users.db')
+OUTBOX_FILE = os.path.join(DATA_DIR, 'outbox.db')
 LOG_FILE = os.path.join(DATA_DIR, 'strategy.log')
+CANDLE_STORE_DIR = os.path.join(DATA_DIR, 'candles')
 
 LOGLEVEL = os.getenv('LOGLEVEL', 'INFO').upper()
 TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN', '')
 TG_CHAT_ID = os.getenv('TG_CHAT_ID', '')
 SYMBOLS = ['BTC/USDT:USDT']
 TIMEFRAMES = ['1h', '4h', '1d']
+# 调度：每个周期在K线收盘后延迟多少秒扫描（等交易所K线落定）
+CANDLE_CLOSE_GRACE_SECONDS = int(os.getenv('CANDLE_CLOSE_GRACE_SECONDS', 30))
+# 各周期收盘时刻相对UTC零点的偏移（秒）：Bitget日线按UTC+8划分，在UTC 16:00收盘
+CANDLE_CLOSE_OFFSETS = {
+    '1d': int(os.getenv('DAILY_CLOSE_UTC_HOUR', 16)) * 60 * 60,
+}
+# Yahoo Finance K线按UTC零点划分（日线在UTC 0点收盘）。收盘时刻与Bitget不同的周期，
+# 只用Yahoo数据的检测（海龟交易法、参标修）按Yahoo收盘单独调度，不跟随Bitget扫描
+YAHOO_CLOSE_OFFSETS = {timeframe: 0 for timeframe in TIMEFRAMES}
+YAHOO_SCHEDULED_TIMEFRAMES = [
+    timeframe for timeframe in TIMEFRAMES
+    if CANDLE_CLOSE_OFFSETS.get(timeframe, 0) != YAHOO_CLOSE_OFFSETS[timeframe]
+]
 DC_PERIOD = 28
 MAX_WORKERS = int(os.getenv('MAX_WORKERS', 8))
+# 扫描流水线：计算 / 推送阶段线程数，以及阶段间有界队列的容量
+COMPUTE_WORKERS = int(os.getenv('COMPUTE_WORKERS', 2))
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 64))
+FETCH_MODE = os.getenv('FETCH_MODE', 'thread').lower()
+ASYNC_FETCH_CONCURRENCY = int(os.getenv('ASYNC_FETCH_CONCURRENCY', 200))
+# K线数据来源：poll（按收盘定时REST抓取）/ stream（WebSocket实时推送，收盘即检测）
+INGESTION_MODE = os.getenv('INGESTION_MODE', 'poll').lower()
+# stream模式：单条WebSocket连接订阅的频道数（Bitget建议每条连接少于50个频道）、心跳间隔（秒）、收盘后等待其余币种推送到齐的秒数
+BITGET_WS_CHANNELS_PER_CONNECTION = int(os.getenv('BITGET_WS_CHANNELS_PER_CONNECTION', 40))
+BITGET_WS_PING_INTERVAL = int(os.getenv('BITGET_WS_PING_INTERVAL', 25))
+STREAM_SETTLE_SECONDS = float(os.getenv('STREAM_SETTLE_SECONDS', 3))
+# Bitget公共行情接口限流（每秒请求数），按接口分别限流
+BITGET_RATE_LIMITS = {
+    'candles': float(os.getenv('BITGET_CANDLES_RATE_LIMIT', 20)),
+    'contracts': float(os.getenv('BITGET_CONTRACTS_RATE_LIMIT', 20)),
+    'tickers': float(os.getenv('BITGET_TICKERS_RATE_LIMIT', 20)),
+}
+# 共享HTTP连接池：按主机设置最大连接数，超时单位为秒
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+HTTP_DEFAULT_POOL_SIZE = 10
+HTTP_POOL_SIZES = {
+    'api.bitget.com': int(os.getenv('BITGET_HTTP_POOL_SIZE', 32)),
+    'api.telegram.org': int(os.getenv('TELEGRAM_HTTP_POOL_SIZE', 50)),
+}
+# Telegram推送限流：全局 / 单个聊天每秒消息数（0为不限流），失败重试次数与指数退避基数（秒）
+TG_GLOBAL_RATE_LIMIT = float(os.getenv('TG_GLOBAL_RATE_LIMIT', 30))
+TG_CHAT_RATE_LIMIT = float(os.getenv('TG_CHAT_RATE_LIMIT', 1))
+TG_SEND_MAX_RETRIES = int(os.getenv('TG_SEND_MAX_RETRIES', 5))
+TG_RETRY_BACKOFF = float(os.getenv('TG_RETRY_BACKOFF', 1))
+# 进程内共用的Telegram发送线程数（群发、定向发送与发件箱共用）
+TG_SEND_WORKERS = int(os.getenv('TG_SEND_WORKERS', 16))
+# getUpdates长轮询：服务端最长挂起秒数、请求失败后的等待秒数、处理用户命令的线程数
+TG_POLL_TIMEOUT = int(os.getenv('TG_POLL_TIMEOUT', 50))
+TG_POLL_ERROR_DELAY = float(os.getenv('TG_POLL_ERROR_DELAY', 5))
+TG_COMMAND_WORKERS = int(os.getenv('TG_COMMAND_WORKERS', 4))
+# 用户消息接收方式：polling（getUpdates长轮询）/ webhook（进程内HTTP服务接收Telegram推送）
+TG_UPDATE_MODE = os.getenv('TG_UPDATE_MODE', 'polling').lower()
+# webhook模式：Telegram推送地址（公网HTTPS，反向代理到本地服务）、校验密钥、本地监听地址与路径
+TG_WEBHOOK_URL = os.getenv('TG_WEBHOOK_URL', '')
+TG_WEBHOOK_SECRET = os.getenv('TG_WEBHOOK_SECRET', '')
+TG_WEBHOOK_HOST = os.getenv('TG_WEBHOOK_HOST', '0.0.0.0')
+TG_WEBHOOK_PORT = int(os.getenv('TG_WEBHOOK_PORT', 8080))
+TG_WEBHOOK_PATH = os.getenv('TG_WEBHOOK_PATH', '/telegram/webhook')
+# Prometheus指标：开启后在 METRICS_HOST:METRICS_PORT 的 /metrics 提供扫描与推送指标
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+# 扫描追踪：开启后每轮扫描在 TRACE_DIR 写一个Chrome trace-event JSON，只保留最近 TRACE_KEEP 个
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TRACE_DIR = os.path.join(DATA_DIR, 'traces')
+TRACE_KEEP = int(os.getenv('TRACE_KEEP', 48))
+# 信号汇总模式：每轮扫描结束后给每个用户发一条合并消息，而不是每个信号单独推送
+SIGNAL_DIGEST_ENABLED = os.getenv('SIGNAL_DIGEST_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# 持久化发件箱：信号与群发消息先写入 DATA_DIR/outbox.db，由后台线程发送并在送达后确认
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Yahoo数据缓存有效期（秒），同一轮扫描内各策略共用同一份下载
+YAHOO_CACHE_TTL = int(os.getenv('YAHOO_CACHE_TTL', 600))
+CANDLE_STORE_ENABLED = os.getenv('CANDLE_STORE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# 本地聚合模式：每个币种只维护一份1h K线历史，4h/1d由其本地聚合，每小时只需一次增量请求
+DERIVED_CANDLES_ENABLED = os.getenv('DERIVED_CANDLES_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# 1h基础K线保留的根数（默认200天，足够聚合出200根日线）
+DERIVED_BASE_HOURS = int(os.getenv('DERIVED_BASE_HOURS', 200 * 24))
+# check_signal 指标计算方式：incremental（增量，状态跨扫描保留）/ full（每次全量计算）
+INDICATOR_MODE = os.getenv('INDICATOR_MODE', 'incremental').lower()
+# 信号时间的显示时区（指标计算内部统一使用UTC，只在生成信号时转换）
+DISPLAY_TIMEZONE = os.getenv('DISPLAY_TIMEZONE', 'Asia/Shanghai')
+# RSI6极值/五连阴检测方式：per_symbol（逐个币种）/ batch（抓取完成后按周期对全部币种批量计算）
+# / process（同batch，但通过共享内存分发到多进程计算）
+SIGNAL_EVAL_MODE = os.getenv('SIGNAL_EVAL_MODE', 'per_symbol').lower()
+SIGNAL_PROCESS_WORKERS = int(os.getenv('SIGNAL_PROCESS_WORKERS', os.cpu_count() or 1))
 MA_FAST = 5
 MA_MID = 10
 MA_SLOW = 20
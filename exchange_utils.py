@@ -1,16 +1,69 @@
+import aiohttp
+import asyncio
+import json
 import pandas as pd
 import logging
 import requests
 import yfinance as yf
+import threading
 import time
+from candle_store import (
+    DERIVED_TIMEFRAME_HOURS,
+    HOUR_MS,
+    aggregate_candles,
+    load_candles,
+    merge_candles,
+    save_candles,
+    to_epoch_ms,
+)
+from http_client import http_get
+from metrics import (
+    BITGET_FAILURES,
+    BITGET_RATE_LIMIT_WAITS,
+    BITGET_RATE_LIMIT_WAIT_SECONDS,
+    BITGET_REQUEST_DURATION,
+    BITGET_RETRIES,
+    YAHOO_CACHE_HITS,
+    YAHOO_FETCH_DURATION,
+)
+from config import (
+    ASYNC_FETCH_CONCURRENCY,
+    BITGET_RATE_LIMITS,
+    BITGET_WS_CHANNELS_PER_CONNECTION,
+    BITGET_WS_PING_INTERVAL,
+    CANDLE_CLOSE_OFFSETS,
+    CANDLE_STORE_ENABLED,
+    DERIVED_BASE_HOURS,
+    DERIVED_CANDLES_ENABLED,
+    YAHOO_CACHE_TTL,
+)
+from tracing import async_span, span
+from utils import TokenBucket
 
 BITGET_BASE_URL = "https://api.bitget.com"
+BITGET_WS_URL = "wss://ws.bitget.com/v2/ws/public"
 BITGET_PRODUCT_TYPE = "USDT-FUTURES"
 BITGET_TIMEFRAME_MAP = {
     '1h': '1H',
     '4h': '4H',
     '1d': '1D',
 }
+BITGET_TIMEFRAME_MS = {
+    '1h': 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+# WebSocket K线频道（与REST一致，1D按UTC+8划分）
+BITGET_WS_CHANNELS = {
+    '1h': 'candle1H',
+    '4h': 'candle4H',
+    '1d': 'candle1D',
+}
+BITGET_WS_SUBSCRIBE_BATCH = 50
+BITGET_WS_SEND_INTERVAL = 0.15
+# candles 接口单次最多返回的根数；更早的数据需要 history-candles 翻页（每页最多200根）
+BITGET_CANDLES_MAX_LIMIT = 1000
+BITGET_HISTORY_CANDLES_LIMIT = 200
 BITGET_CONTRACT_CACHE_TTL = 300
 DEFAULT_FALLBACK_SYMBOLS = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'BNB/USDT:USDT', 'ADA/USDT:USDT', 'SOL/USDT:USDT']
 RWA_FLAT_CANDLE_WINDOWS = {
@@ -19,6 +72,27 @@ RWA_FLAT_CANDLE_WINDOWS = {
     '1d': 2,
 }
 
+BITGET_ENDPOINTS = {
+    '/api/v2/mix/market/candles': 'candles',
+    '/api/v2/mix/market/history-candles': 'candles',
+    '/api/v2/mix/market/contracts': 'contracts',
+    '/api/v2/mix/market/tickers': 'tickers',
+}
+NETWORK_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError)
+
+# 进程内所有线程/协程共享的按接口令牌桶
+_rate_limiters = {
+    name: TokenBucket(rate)
+    for name, rate in BITGET_RATE_LIMITS.items()
+    if rate > 0
+}
+
+# 本地聚合模式：各币种1h基础K线的更新状态
+_base_refreshed = {}  # symbol -> 最近一次更新时所在的整点（毫秒）
+_base_backfilled = set()
+_base_locks = {}
+_base_locks_lock = threading.Lock()
+
 _contract_cache = {
     'loaded_at': 0.0,
     'contracts': {},
@@ -44,6 +118,18 @@ YAHOO_SYMBOL_MAP = {
     'ETC': 'ETC-USD',
 }
 
+# Yahoo下载计划：时间级别 -> (period, interval, 重采样规则)
+# 1h与4h共用1年的1小时数据（1h取最近limit根，4h重采样），日线单独下载一次
+YAHOO_FETCH_PLAN = {
+    '1h': ('1y', '1h', None),
+    '4h': ('1y', '1h', '4h'),
+    '1d': ('2y', '1d', None),
+}
+
+_yahoo_cache = {}
+_yahoo_key_locks = {}
+_yahoo_cache_lock = threading.Lock()
+
 def _normalize_symbol(base_coin, quote_coin='USDT', settle_coin='USDT'):
     return f"{base_coin.upper()}/{quote_coin.upper()}:{settle_coin.upper()}"
 
@@ -52,13 +138,31 @@ def _symbol_to_market_id(symbol):
     quote_coin = symbol.split('/')[1].split(':')[0].upper()
     return f"{base_coin}{quote_coin}"
 
+def _get_rate_limiter(path):
+    return _rate_limiters.get(BITGET_ENDPOINTS.get(path))
+
+def _record_rate_limit_wait(path, delay):
+    if delay:
+        BITGET_RATE_LIMIT_WAITS.inc(endpoint=path)
+        BITGET_RATE_LIMIT_WAIT_SECONDS.inc(delay, endpoint=path)
+
 def _bitget_get(path, params=None, timeout=30):
-    response = requests.get(f"{BITGET_BASE_URL}{path}", params=params, timeout=timeout)
-    response.raise_for_status()
-    payload = response.json()
-    if payload.get('code') != '00000':
-        raise ValueError(f"Bitget API错误 {payload.get('code')}: {payload.get('msg')}")
-    return payload.get('data') or []
+    limiter = _get_rate_limiter(path)
+    if limiter is not None:
+        _record_rate_limit_wait(path, limiter.acquire())
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        with span('bitget_request', endpoint=path):
+            response = http_get(f"{BITGET_BASE_URL}{path}", params=params, timeout=timeout)
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('code') != '00000':
+            raise ValueError(f"Bitget API错误 {payload.get('code')}: {payload.get('msg')}")
+        status = 'ok'
+        return payload.get('data') or []
+    finally:
+        BITGET_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=path, status=status)
 
 def _load_bitget_contracts(force_refresh=False):
     cache_age = time.time() - _contract_cache['loaded_at']
@@ -100,13 +204,15 @@ def _should_skip_flat_rwa_symbol(symbol, timeframe, df):
         logging.info(f"{symbol} {timeframe} 为RWA标的，最近{window}根K线价格完全不变，跳过本次统计")
     return is_flat
 
-def get_bitget_data(symbol, timeframe, limit=500, retry_count=5):
-    """从Bitget获取数据（用于其他指标）"""
-    # 对主要币种使用更长的延迟和更多重试
-    is_major_coin = symbol in ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'BNB/USDT:USDT']
-    if is_major_coin:
-        retry_count = max(retry_count, 5)  # 主要币种至少重试5次
+def _parse_bitget_candles(ohlcv):
+    df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'quote_volume'])
+    df['timestamp'] = pd.to_datetime(pd.to_numeric(df['timestamp'], errors='coerce'), unit='ms')
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].sort_values('timestamp').reset_index(drop=True)
 
+def _build_candle_params(symbol, timeframe, limit, start_time=None):
+    """构造K线请求参数，无法抓取时返回None"""
     contract = None
     try:
         contract = _get_contract(symbol)
@@ -115,82 +221,355 @@ def get_bitget_data(symbol, timeframe, limit=500, retry_count=5):
 
     if contract is None and _contract_cache['contracts']:
         logging.info(f"{symbol} 不在当前Bitget USDT永续合约列表中，跳过抓取")
-        return pd.DataFrame()
+        return None
 
     granularity = BITGET_TIMEFRAME_MAP.get(timeframe)
     if not granularity:
         logging.warning(f"Bitget不支持的时间级别: {timeframe}")
+        return None
+
+    params = {
+        'symbol': contract['symbol'] if contract else _symbol_to_market_id(symbol),
+        'granularity': granularity,
+        'limit': limit,
+        'productType': BITGET_PRODUCT_TYPE,
+    }
+    if start_time is not None:
+        params['startTime'] = int(start_time)
+    return params
+
+def _candle_error_reason(error):
+    """K线抓取失败原因分类，用作重试指标的标签"""
+    if error is None:
+        return 'empty'
+    if isinstance(error, NETWORK_ERRORS):
+        return 'network'
+    if isinstance(error, ValueError):
+        return 'rate_limit' if "rate limit" in str(error).lower() else 'exchange'
+    return 'other'
+
+def _candle_retry_delay(symbol, timeframe, error, attempt, retry_count):
+    """
+    K线抓取失败后的重试策略，返回等待秒数；返回None表示放弃并返回空数据。
+    error为None表示接口返回了空数据。同步与异步抓取共用此策略，并在这里记录重试 / 放弃次数
+    """
+    delay = _candle_retry_policy(symbol, timeframe, error, attempt, retry_count)
+    counter = BITGET_FAILURES if delay is None else BITGET_RETRIES
+    counter.inc(timeframe=timeframe, reason=_candle_error_reason(error))
+    return delay
+
+def _candle_retry_policy(symbol, timeframe, error, attempt, retry_count):
+    is_last_attempt = attempt >= retry_count - 1
+    if error is None:
+        if is_last_attempt:
+            return None
+        logging.warning(f"{symbol} {timeframe} 返回空数据，将重试")
+        return 1 + attempt
+    if isinstance(error, NETWORK_ERRORS):
+        base_delay = 2 ** attempt
+        logging.warning(f"Bitget网络错误 {symbol} {timeframe} (尝试 {attempt + 1}/{retry_count}): {error}")
+        if is_last_attempt:
+            logging.error(f"Bitget获取 {symbol} {timeframe} 最终失败: 网络连接问题")
+            return None
+        logging.info(f"等待 {base_delay:.1f}s 后重试...")
+        return base_delay
+    if isinstance(error, ValueError):
+        logging.warning(f"Bitget交易所错误 {symbol} {timeframe}: {error}")
+        error_text = str(error).lower()
+        if "40309" in error_text or "symbol not exist" in error_text:
+            return None
+        if not is_last_attempt and "rate limit" in error_text:
+            return 3 + attempt  # 限流错误等待更久
+        return None
+    logging.error(f"Bitget获取 {symbol} {timeframe} 数据失败: {error}")
+    if is_last_attempt:
+        return None
+    return 2 ** attempt
+
+def _fetch_bitget_candles(symbol, timeframe, limit=500, retry_count=5, start_time=None):
+    """抓取Bitget K线（不做RWA过滤），start_time为毫秒时间戳时只抓取该时间之后的K线"""
+    params = _build_candle_params(symbol, timeframe, limit, start_time)
+    if params is None:
         return pd.DataFrame()
 
-    market_id = contract['symbol'] if contract else _symbol_to_market_id(symbol)
-    
     for attempt in range(retry_count):
+        error = None
         try:
-            # 主要币种在重试前添加额外延迟
-            if is_major_coin and attempt > 0:
-                extra_delay = 1 + (attempt * 0.5)  # 额外延迟0.5-2秒
-                logging.debug(f"主要币种 {symbol} 重试前额外等待 {extra_delay:.1f}s")
-                time.sleep(extra_delay)
-            
             logging.debug(f"从Bitget获取 {symbol} {timeframe} 数据 (尝试 {attempt + 1}/{retry_count})")
-            ohlcv = _bitget_get(
-                '/api/v2/mix/market/candles',
-                {
-                    'symbol': market_id,
-                    'granularity': granularity,
-                    'limit': limit,
-                    'productType': BITGET_PRODUCT_TYPE,
-                },
-            )
-            
-            if not ohlcv or len(ohlcv) == 0:
-                if attempt < retry_count - 1:
-                    logging.warning(f"{symbol} {timeframe} 返回空数据，将重试")
-                    time.sleep(1 + attempt)
-                    continue
-                return pd.DataFrame()
-                
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'quote_volume'])
-            df['timestamp'] = pd.to_datetime(pd.to_numeric(df['timestamp'], errors='coerce'), unit='ms')
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].sort_values('timestamp').reset_index(drop=True)
-
-            if _should_skip_flat_rwa_symbol(symbol, timeframe, df):
-                return pd.DataFrame()
-
-            logging.debug(f"Bitget {symbol} {timeframe} 获取成功，数据量: {len(df)}")
-            return df
-            
-        except requests.RequestException as e:
-            base_delay = 2 ** attempt
-            if is_major_coin:
-                base_delay *= 1.5  # 主要币种延迟更长
-            
-            logging.warning(f"Bitget网络错误 {symbol} {timeframe} (尝试 {attempt + 1}/{retry_count}): {e}")
-            if attempt < retry_count - 1:
-                logging.info(f"等待 {base_delay:.1f}s 后重试...")
-                time.sleep(base_delay)
-                continue
-            else:
-                logging.error(f"Bitget获取 {symbol} {timeframe} 最终失败: 网络连接问题")
-                return pd.DataFrame()
-        except ValueError as e:
-            logging.warning(f"Bitget交易所错误 {symbol} {timeframe}: {e}")
-            error_text = str(e).lower()
-            if "40309" in error_text or "symbol not exist" in error_text:
-                return pd.DataFrame()
-            if attempt < retry_count - 1 and "rate limit" in error_text:
-                time.sleep(3 + attempt)  # 限流错误等待更久
-                continue
+            ohlcv = _bitget_get('/api/v2/mix/market/candles', params)
+            if ohlcv:
+                df = _parse_bitget_candles(ohlcv)
+                logging.debug(f"Bitget {symbol} {timeframe} 获取成功，数据量: {len(df)}")
+                return df
+        except Exception as e:
+            error = e
+
+        delay = _candle_retry_delay(symbol, timeframe, error, attempt, retry_count)
+        if delay is None:
             return pd.DataFrame()
+        time.sleep(delay)
+    return pd.DataFrame()
+
+def get_bitget_data(symbol, timeframe, limit=500, retry_count=5):
+    """从Bitget获取数据（用于其他指标）"""
+    df = _fetch_bitget_candles(symbol, timeframe, limit, retry_count)
+    if not df.empty and _should_skip_flat_rwa_symbol(symbol, timeframe, df):
+        return pd.DataFrame()
+    return df
+
+def _plan_incremental_fetch(symbol, timeframe, limit):
+    """
+    根据本地K线决定本次抓取范围，返回 (本地K线, 抓取数量, startTime)。
+    本地无数据或缺口超过limit时startTime为None，即全量抓取。
+    """
+    stored = load_candles(symbol, timeframe)
+    interval_ms = BITGET_TIMEFRAME_MS[timeframe]
+    if not stored.empty:
+        last_ts = int(to_epoch_ms(stored['timestamp']).iloc[-1])
+        missing = (int(time.time() * 1000) - last_ts) // interval_ms
+        if missing < limit - 2:
+            # 从倒数第二根开始重抓：覆盖上次未收盘的K线，并保证返回非空
+            return stored, int(missing) + 3, last_ts - interval_ms
+    return stored, limit, None
+
+def _finish_incremental_fetch(symbol, timeframe, limit, stored, start_time, fresh):
+    """合并增量数据、写回本地存储并做RWA过滤"""
+    if fresh.empty:
+        return pd.DataFrame()
+
+    df = merge_candles(stored if start_time is not None else None, fresh, limit)
+    try:
+        save_candles(symbol, timeframe, df)
+    except Exception as e:
+        logging.warning(f"保存本地K线 {symbol} {timeframe} 失败: {e}")
+
+    if start_time is not None:
+        logging.debug(f"Bitget {symbol} {timeframe} 增量抓取 {len(fresh)} 根，合并后 {len(df)} 根")
+
+    if _should_skip_flat_rwa_symbol(symbol, timeframe, df):
+        return pd.DataFrame()
+    return df
+
+def get_incremental_bitget_data(symbol, timeframe, limit=500, retry_count=5):
+    """
+    基于本地K线存储的增量抓取：
+    只向Bitget请求最后一根已保存K线之后的数据，与本地历史合并后返回并写回存储。
+    本地无数据或缺口超过limit时退化为全量抓取。
+    """
+    if timeframe not in BITGET_TIMEFRAME_MS:
+        return get_bitget_data(symbol, timeframe, limit, retry_count)
+
+    stored, fetch_limit, start_time = _plan_incremental_fetch(symbol, timeframe, limit)
+    fresh = _fetch_bitget_candles(symbol, timeframe, fetch_limit, retry_count, start_time=start_time)
+    return _finish_incremental_fetch(symbol, timeframe, limit, stored, start_time, fresh)
+
+def _fetch_bitget_history_candles(symbol, hours, retry_count=5):
+    """通过 history-candles 从当前时刻向前翻页回补最多hours根1h K线，返回按时间升序的DataFrame"""
+    params = _build_candle_params(symbol, '1h', BITGET_HISTORY_CANDLES_LIMIT)
+    if params is None:
+        return pd.DataFrame()
+
+    frames = []
+    total = 0
+    end_time = int(time.time() * 1000)
+    while total < hours:
+        page_params = dict(params, endTime=end_time)
+        ohlcv = None
+        for attempt in range(retry_count):
+            try:
+                ohlcv = _bitget_get('/api/v2/mix/market/history-candles', page_params)
+                break
+            except Exception as e:
+                delay = _candle_retry_delay(symbol, '1h', e, attempt, retry_count)
+                if delay is None:
+                    break
+                time.sleep(delay)
+        if not ohlcv:
+            break  # 没有更早的数据（或回补失败），保留已取到的部分
+        page = _parse_bitget_candles(ohlcv)
+        first_ts = int(to_epoch_ms(page['timestamp']).iloc[0])
+        frames.append(page)
+        total += len(page)
+        if first_ts >= end_time:
+            break
+        end_time = first_ts - 1
+
+    if not frames:
+        return pd.DataFrame()
+    logging.info(f"{symbol} 回补1h历史K线 {total} 根")
+    return merge_candles(None, pd.concat(frames, ignore_index=True), hours)
+
+def _get_base_lock(symbol):
+    with _base_locks_lock:
+        return _base_locks.setdefault(symbol, threading.Lock())
+
+def _refresh_base_candles(symbol, retry_count=5):
+    """
+    更新并返回某币种的1h基础K线（本地存储，保留DERIVED_BASE_HOURS根）。
+    同一个整点内只请求一次：同一轮扫描中1h/4h/1d共用这一次更新。
+    本地历史不足时先用 history-candles 回补一次，之后每小时只做一次小的增量请求。
+    """
+    with _get_base_lock(symbol):
+        current_hour = int(time.time() * 1000) // HOUR_MS * HOUR_MS
+        stored = load_candles(symbol, '1h')
+        if not stored.empty and _base_refreshed.get(symbol) == current_hour:
+            return stored
+
+        if symbol not in _base_backfilled and len(stored) < DERIVED_BASE_HOURS:
+            history = _fetch_bitget_history_candles(symbol, DERIVED_BASE_HOURS, retry_count)
+            _base_backfilled.add(symbol)
+            if not history.empty:
+                stored = merge_candles(history, stored, DERIVED_BASE_HOURS)
+
+        fetch_limit, start_time = min(DERIVED_BASE_HOURS, BITGET_CANDLES_MAX_LIMIT), None
+        if not stored.empty:
+            last_ts = int(to_epoch_ms(stored['timestamp']).iloc[-1])
+            missing = (int(time.time() * 1000) - last_ts) // HOUR_MS
+            if missing + 3 <= BITGET_CANDLES_MAX_LIMIT:
+                fetch_limit, start_time = int(missing) + 3, last_ts - HOUR_MS
+
+        fresh = _fetch_bitget_candles(symbol, '1h', fetch_limit, retry_count, start_time=start_time)
+        if fresh.empty:
+            return stored
+        df = merge_candles(stored, fresh, DERIVED_BASE_HOURS)
+        try:
+            save_candles(symbol, '1h', df)
         except Exception as e:
-            logging.error(f"Bitget获取 {symbol} {timeframe} 数据失败: {e}")
-            if attempt < retry_count - 1:
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                return pd.DataFrame()
+            logging.warning(f"保存本地K线 {symbol} 1h 失败: {e}")
+        _base_refreshed[symbol] = current_hour
+        return df
+
+def get_derived_bitget_data(symbol, timeframe, limit=500, retry_count=5):
+    """本地聚合模式：1h直接取基础K线，4h/1d由1h按Bitget的周期边界聚合"""
+    base = _refresh_base_candles(symbol, retry_count)
+    if base.empty:
+        return pd.DataFrame()
+    if timeframe == '1h':
+        df = base.tail(limit).reset_index(drop=True)
+    else:
+        offset_ms = CANDLE_CLOSE_OFFSETS.get(timeframe, 0) * 1000
+        df = aggregate_candles(base, timeframe, offset_ms).tail(limit).reset_index(drop=True)
+    if df.empty or _should_skip_flat_rwa_symbol(symbol, timeframe, df):
+        return pd.DataFrame()
+    return df
+
+def _uses_derived_candles(timeframe):
+    return DERIVED_CANDLES_ENABLED and (timeframe == '1h' or timeframe in DERIVED_TIMEFRAME_HOURS)
+
+async def _async_bitget_get(session, path, params=None, timeout=30):
+    limiter = _get_rate_limiter(path)
+    if limiter is not None:
+        delay = limiter.reserve()
+        _record_rate_limit_wait(path, delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        async with session.get(
+            f"{BITGET_BASE_URL}{path}",
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            response.raise_for_status()
+            payload = await response.json(content_type=None)
+        if payload.get('code') != '00000':
+            raise ValueError(f"Bitget API错误 {payload.get('code')}: {payload.get('msg')}")
+        status = 'ok'
+        return payload.get('data') or []
+    finally:
+        BITGET_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=path, status=status)
+
+async def _async_fetch_bitget_candles(session, symbol, timeframe, limit=500, retry_count=5, start_time=None):
+    """_fetch_bitget_candles 的异步版本，重试与错误处理语义保持一致"""
+    # 合约列表过期时会同步重新加载（含限流等待），放到线程里避免阻塞事件循环
+    params = await asyncio.to_thread(_build_candle_params, symbol, timeframe, limit, start_time)
+    if params is None:
+        return pd.DataFrame()
+
+    for attempt in range(retry_count):
+        error = None
+        try:
+            logging.debug(f"从Bitget异步获取 {symbol} {timeframe} 数据 (尝试 {attempt + 1}/{retry_count})")
+            ohlcv = await _async_bitget_get(session, '/api/v2/mix/market/candles', params)
+            if ohlcv:
+                df = _parse_bitget_candles(ohlcv)
+                logging.debug(f"Bitget {symbol} {timeframe} 获取成功，数据量: {len(df)}")
+                return df
+        except Exception as e:
+            error = e
+
+        delay = _candle_retry_delay(symbol, timeframe, error, attempt, retry_count)
+        if delay is None:
+            return pd.DataFrame()
+        await asyncio.sleep(delay)
+    return pd.DataFrame()
+
+async def _async_get_data(session, semaphore, symbol, timeframe, limit):
+    async with semaphore:
+        with async_span('fetch', symbol=symbol, timeframe=timeframe):
+            try:
+                if _uses_derived_candles(timeframe):
+                    # 本地聚合模式每个币种每小时只有一次小请求，放到线程里复用同步实现
+                    return symbol, timeframe, await asyncio.to_thread(get_derived_bitget_data, symbol, timeframe, limit)
+
+                # 本地存储的读写（CSV加载、原子重写与合并）在线程里执行，事件循环只负责网络请求
+                if CANDLE_STORE_ENABLED and timeframe in BITGET_TIMEFRAME_MS:
+                    stored, fetch_limit, start_time = await asyncio.to_thread(_plan_incremental_fetch, symbol, timeframe, limit)
+                    fresh = await _async_fetch_bitget_candles(session, symbol, timeframe, fetch_limit, start_time=start_time)
+                    df = await asyncio.to_thread(_finish_incremental_fetch, symbol, timeframe, limit, stored, start_time, fresh)
+                    return symbol, timeframe, df
+
+                df = await _async_fetch_bitget_candles(session, symbol, timeframe, limit)
+                if not df.empty and await asyncio.to_thread(_should_skip_flat_rwa_symbol, symbol, timeframe, df):
+                    df = pd.DataFrame()
+                return symbol, timeframe, df
+            except Exception as e:
+                logging.error(f"异步获取 {symbol} {timeframe} 异常: {e}", exc_info=True)
+                return symbol, timeframe, pd.DataFrame()
+
+async def _async_get_all_data(pairs, limit, concurrency, on_result=None):
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, keepalive_timeout=60)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        if on_result is None:
+            tasks = [
+                _async_get_data(session, semaphore, symbol, timeframe, limit)
+                for symbol, timeframe in pairs
+            ]
+            return await asyncio.gather(*tasks)
+
+        pending = iter(pairs)
+        delivered = []
+
+        async def worker():
+            for symbol, timeframe in pending:
+                result = await _async_get_data(session, semaphore, symbol, timeframe, limit)
+                # 回调可能因下游队列已满而阻塞：放到线程里等待，本worker在交付前不再取新任务
+                await asyncio.to_thread(on_result, result)
+                delivered.append((symbol, timeframe))
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pairs)))))
+        return delivered
+
+def get_all_data_async(pairs, limit=500, concurrency=ASYNC_FETCH_CONCURRENCY, on_result=None):
+    """
+    异步批量抓取K线：所有 (symbol, timeframe) 共用一个keep-alive连接池，
+    最多concurrency个请求同时在途。返回 [(symbol, timeframe, df), ...]，失败项为空DataFrame。
+    传入on_result时每抓完一个就回调 on_result((symbol, timeframe, df))，不在内存中累积结果，
+    返回值只包含 (symbol, timeframe)。
+    """
+    if not pairs:
+        return []
+    start_time = time.time()
+    # 进入事件循环前先加载合约列表，抓取过程中构造请求参数时直接命中缓存
+    try:
+        _load_bitget_contracts()
+    except Exception as e:
+        logging.warning(f"预加载Bitget合约列表失败，抓取时将重试: {e}")
+    results = asyncio.run(_async_get_all_data(list(pairs), limit, max(1, concurrency), on_result))
+    logging.info(f"异步抓取完成: {len(results)} 个任务, 耗时: {time.time() - start_time:.2f}秒")
+    return results
 
 def get_data(symbol, timeframe, limit=500):
     """
@@ -198,12 +577,315 @@ def get_data(symbol, timeframe, limit=500):
     - 海龟交易法：严格只使用Yahoo Finance日线数据
     - 其他指标：使用Bitget数据
     """
-    # 其他指标使用Bitget数据（1h, 4h等）
+    # 其他指标使用Bitget数据（1h, 4h等），启用本地K线存储时只做增量抓取
+    if _uses_derived_candles(timeframe):
+        return get_derived_bitget_data(symbol, timeframe, limit)
+    if CANDLE_STORE_ENABLED:
+        return get_incremental_bitget_data(symbol, timeframe, limit)
     return get_bitget_data(symbol, timeframe, limit)
 
+class CandleStream:
+    """
+    Bitget公共WebSocket K线订阅：对给定币种/周期保持内存中的K线序列实时更新，
+    并记录每个周期的K线收盘（收到更新的新K线即视为上一根已收盘）。
+    在后台线程中运行自己的事件循环，按 channels_per_connection 把频道分到多条连接上；
+    连接断开或心跳超时后按指数退避重连并重新订阅全部频道。
+    """
+
+    def __init__(self, symbols, timeframes, url=None, max_rows=500,
+                 channels_per_connection=BITGET_WS_CHANNELS_PER_CONNECTION,
+                 ping_interval=BITGET_WS_PING_INTERVAL, reconnect_delay=1, max_reconnect_delay=60):
+        self.url = url or BITGET_WS_URL
+        self.max_rows = max_rows
+        self.channels_per_connection = max(1, channels_per_connection)
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.keys = [
+            (symbol, timeframe)
+            for symbol in symbols
+            for timeframe in timeframes
+            if timeframe in BITGET_WS_CHANNELS
+        ]
+        self._inst_ids = {symbol: _symbol_to_market_id(symbol) for symbol in symbols}
+        self._symbols_by_inst = {inst_id: symbol for symbol, inst_id in self._inst_ids.items()}
+        self._timeframes_by_channel = {channel: timeframe for timeframe, channel in BITGET_WS_CHANNELS.items()}
+        self._series = {}
+        self._last_ts = {}
+        self._closes = {}  # timeframe -> (最近一次收盘时间毫秒, 首次发现的monotonic时间)
+        self._popped = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._loop = None
+        self._tasks = []
+        self._thread = None
+        self.connections = 0  # 累计建立的连接数（含重连）
+
+    # ---- K线序列 ----
+
+    def apply_candles(self, symbol, timeframe, rows, detect_close=True):
+        """合并一批K线（Bitget格式 [ts, open, high, low, close, baseVolume, ...]），返回是否有K线收盘"""
+        if not rows:
+            return False
+        key = (symbol, timeframe)
+        closed = False
+        with self._lock:
+            series = self._series.setdefault(key, {})
+            previous_last = self._last_ts.get(key)
+            for row in rows:
+                series[int(row[0])] = [float(value) for value in row[1:6]]
+            last_ts = max(int(row[0]) for row in rows)
+            if previous_last is not None:
+                last_ts = max(last_ts, previous_last)
+            self._last_ts[key] = last_ts
+            if len(series) > self.max_rows:
+                for ts in sorted(series)[:len(series) - self.max_rows]:
+                    del series[ts]
+            if detect_close and previous_last is not None and last_ts > previous_last:
+                closed = True
+                recorded = self._closes.get(timeframe)
+                if recorded is None or last_ts > recorded[0]:
+                    self._closes[timeframe] = (last_ts, time.monotonic())
+        return closed
+
+    def seed(self, symbol, timeframe, df):
+        """用REST抓到的K线填充序列（不触发收盘事件）"""
+        if df is None or df.empty:
+            return
+        rows = zip(to_epoch_ms(df['timestamp']).tolist(), df['open'], df['high'], df['low'], df['close'], df['volume'])
+        self.apply_candles(symbol, timeframe, list(rows), detect_close=False)
+
+    def get_frame(self, symbol, timeframe):
+        """返回当前内存中的K线（与get_data同列），没有数据时返回空DataFrame"""
+        with self._lock:
+            series = self._series.get((symbol, timeframe))
+            items = sorted(series.items()) if series else []
+        if not items:
+            return pd.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df = pd.DataFrame([values for _, values in items], columns=['open', 'high', 'low', 'close', 'volume'])
+        df.insert(0, 'timestamp', pd.to_datetime([ts for ts, _ in items], unit='ms'))
+        return df
+
+    def last_timestamp(self, symbol, timeframe):
+        """最新一根K线的开盘时间（毫秒），没有数据时返回None"""
+        with self._lock:
+            return self._last_ts.get((symbol, timeframe))
+
+    def pop_closed_timeframes(self, settle_seconds=0):
+        """返回有新K线收盘、且距首次发现已超过settle_seconds（等其余币种的推送到齐）的周期"""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for timeframe, (close_ts, seen_at) in self._closes.items():
+                if self._popped.get(timeframe) != close_ts and now - seen_at >= settle_seconds:
+                    self._popped[timeframe] = close_ts
+                    due.append(timeframe)
+        return due
+
+    # ---- WebSocket ----
+
+    def _subscribe_args(self, keys):
+        return [
+            {'instType': BITGET_PRODUCT_TYPE, 'channel': BITGET_WS_CHANNELS[timeframe], 'instId': self._inst_ids[symbol]}
+            for symbol, timeframe in keys
+        ]
+
+    def _handle_message(self, payload):
+        if payload.get('event') == 'error':
+            logging.warning(f"Bitget WebSocket订阅错误: {payload.get('code')} {payload.get('msg')}")
+            return
+        arg = payload.get('arg') or {}
+        data = payload.get('data')
+        symbol = self._symbols_by_inst.get(arg.get('instId'))
+        timeframe = self._timeframes_by_channel.get(arg.get('channel'))
+        if data and symbol and timeframe:
+            self.apply_candles(symbol, timeframe, data)
+
+    async def _subscribe(self, ws, keys):
+        args = self._subscribe_args(keys)
+        for start in range(0, len(args), BITGET_WS_SUBSCRIBE_BATCH):
+            await ws.send_json({'op': 'subscribe', 'args': args[start:start + BITGET_WS_SUBSCRIBE_BATCH]})
+            await asyncio.sleep(BITGET_WS_SEND_INTERVAL)  # Bitget限制每条连接每秒最多发送10条消息
+
+    async def _consume(self, ws):
+        last_message = last_ping = time.monotonic()
+        while not self._stopping:
+            now = time.monotonic()
+            if now - last_message > self.ping_interval * 2:
+                raise asyncio.TimeoutError("WebSocket心跳超时")
+            if now - last_ping >= self.ping_interval:
+                await ws.send_str('ping')
+                last_ping = now
+            try:
+                msg = await ws.receive(timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                continue
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                last_message = time.monotonic()
+                if msg.data != 'pong':
+                    self._handle_message(json.loads(msg.data))
+            elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                return
+
+    async def _run_connection(self, session, keys):
+        delay = self.reconnect_delay
+        while not self._stopping:
+            try:
+                async with session.ws_connect(self.url, autoping=True) as ws:
+                    self.connections += 1
+                    await self._subscribe(ws, keys)
+                    logging.info(f"Bitget WebSocket已连接，订阅 {len(keys)} 个K线频道")
+                    delay = self.reconnect_delay
+                    await self._consume(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Bitget WebSocket连接异常: {e}")
+            if self._stopping:
+                return
+            logging.info(f"Bitget WebSocket断开，{delay}s后重连")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _run(self):
+        groups = [
+            self.keys[start:start + self.channels_per_connection]
+            for start in range(0, len(self.keys), self.channels_per_connection)
+        ]
+        async with aiohttp.ClientSession() as session:
+            self._tasks = [asyncio.ensure_future(self._run_connection(session, keys)) for keys in groups]
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def start(self):
+        """在后台线程启动订阅"""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._run())
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="bitget-ws", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(lambda: [task.cancel() for task in self._tasks])
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+def start_candle_stream(symbols, timeframes, max_rows=500):
+    """订阅全部币种/周期的Bitget K线推送，返回已启动的CandleStream"""
+    stream = CandleStream(symbols, timeframes, max_rows=max_rows)
+    logging.info(f"启动Bitget K线推送订阅: {len(stream.keys)} 个频道")
+    return stream.start()
+
+def clear_yahoo_cache():
+    """清空Yahoo数据缓存，每轮扫描开始时调用，保证一轮扫描内每个下载只发生一次"""
+    with _yahoo_cache_lock:
+        _yahoo_cache.clear()
+        _yahoo_key_locks.clear()
+
+def _get_yahoo_key_lock(key):
+    with _yahoo_cache_lock:
+        return _yahoo_key_locks.setdefault(key, threading.Lock())
+
+def _get_yahoo_history(yahoo_symbol, period, interval):
+    """
+    带TTL缓存的Yahoo历史数据下载，同一 (symbol, period, interval) 并发请求只下载一次。
+    返回Yahoo原始DataFrame（调用方不得修改）
+    """
+    key = (yahoo_symbol, period, interval)
+    with _get_yahoo_key_lock(key):
+        cached = _yahoo_cache.get(key)
+        if cached is not None and time.time() - cached[0] < YAHOO_CACHE_TTL:
+            logging.debug(f"Yahoo缓存命中 {yahoo_symbol} {period} {interval}")
+            YAHOO_CACHE_HITS.inc(interval=interval)
+            return cached[1]
+
+        with YAHOO_FETCH_DURATION.time(interval=interval, mode='single'), \
+                span('yahoo_download', symbol=yahoo_symbol, interval=interval):
+            hist = yf.Ticker(yahoo_symbol).history(period=period, interval=interval)
+        _yahoo_cache[key] = (time.time(), hist)
+        return hist
+
+def _split_yahoo_download(data, yahoo_symbol):
+    """从多代码下载结果中拆出单个代码的数据（列结构与Ticker.history一致）"""
+    if isinstance(data.columns, pd.MultiIndex):
+        if yahoo_symbol not in data.columns.get_level_values(0):
+            return pd.DataFrame()
+        hist = data[yahoo_symbol]
+    else:
+        hist = data
+    return hist.dropna(how='all')
+
+def prefetch_yahoo_data(symbols, timeframes=None):
+    """
+    批量预取Yahoo数据：按下载计划对所有映射的Yahoo代码各做一次多代码下载，
+    拆分后写入缓存，之后海龟交易法与参标修只从内存读取。timeframes 为空时预取所有周期。
+    预取失败的代码不写缓存，get_turtle_data 会按单代码下载兜底。返回写入缓存的条目数
+    """
+    yahoo_symbols = sorted({
+        YAHOO_SYMBOL_MAP[symbol.split('/')[0].upper()]
+        for symbol in symbols
+        if symbol.split('/')[0].upper() in YAHOO_SYMBOL_MAP
+    })
+    if not yahoo_symbols:
+        return 0
+
+    loaded = 0
+    plans = [plan for timeframe, plan in YAHOO_FETCH_PLAN.items() if timeframes is None or timeframe in timeframes]
+    for period, interval in sorted({(period, interval) for period, interval, _ in plans}):
+        start_time = time.time()
+        try:
+            with YAHOO_FETCH_DURATION.time(interval=interval, mode='batch'), \
+                    span('yahoo_batch_download', interval=interval, symbols=len(yahoo_symbols)):
+                data = yf.download(
+                    yahoo_symbols,
+                    period=period,
+                    interval=interval,
+                    group_by='ticker',
+                    auto_adjust=True,
+                    ignore_tz=False,
+                    progress=False,
+                    threads=True,
+                )
+        except Exception as e:
+            logging.error(f"Yahoo批量预取 {period} {interval} 失败: {e}")
+            continue
+        if data is None or data.empty:
+            logging.warning(f"Yahoo批量预取 {period} {interval} 返回空数据")
+            continue
+
+        for yahoo_symbol in yahoo_symbols:
+            hist = _split_yahoo_download(data, yahoo_symbol)
+            if hist.empty:
+                continue
+            key = (yahoo_symbol, period, interval)
+            with _get_yahoo_key_lock(key):
+                _yahoo_cache[key] = (time.time(), hist)
+            loaded += 1
+        logging.info(f"Yahoo批量预取 {period} {interval}: {len(yahoo_symbols)} 个代码, 耗时: {time.time() - start_time:.2f}秒")
+    return loaded
+
+def _yahoo_history_to_frame(hist):
+    # 转换为标准格式
+    df = pd.DataFrame()
+    df['timestamp'] = hist.index
+    df['open'] = hist['Open'].values
+    df['high'] = hist['High'].values
+    df['low'] = hist['Low'].values
+    df['close'] = hist['Close'].values
+    df['volume'] = hist['Volume'].values
+    return df
+
 def get_turtle_data(symbol, timeframe, limit=500):
     """
     海龟交易法专用数据获取：严格只使用Yahoo Finance数据（所有时间级别）
+    按 YAHOO_FETCH_PLAN 从缓存的下载中派生（1h与4h共用同一份1小时数据）
     如果Yahoo Finance不支持或数据不足，返回空DataFrame
     """
     # 提取币种符号
@@ -213,46 +895,27 @@ def get_turtle_data(symbol, timeframe, limit=500):
     if not yahoo_symbol:
         logging.debug(f"海龟交易法跳过 {symbol} {timeframe}: Yahoo Finance不支持此币种")
         return pd.DataFrame()
+
+    plan = YAHOO_FETCH_PLAN.get(timeframe)
+    if plan is None:
+        logging.warning(f"海龟交易法不支持时间级别: {timeframe}")
+        return pd.DataFrame()
     
     try:
         logging.debug(f"海龟交易法从Yahoo Finance获取 {yahoo_symbol} {timeframe} 数据")
-        
-        # 根据时间级别设置获取参数
-        if timeframe == '1h':
-            # 1小时需要更多数据点来满足203根K线的要求
-            period = '3mo'  # 获取3个月数据（约2200小时）
-            interval = '1h'
-        elif timeframe == '4h':
-            # 4小时需要约1年数据
-            period = '1y'   # 获取1年数据（约2190个4小时）
-            interval = '1h'  # Yahoo Finance没有4h间隔，需要从1h数据重采样
-        elif timeframe == '1d':
-            period = '2y'   # 获取2年日线数据
-            interval = '1d'
-        else:
-            logging.warning(f"海龟交易法不支持时间级别: {timeframe}")
-            return pd.DataFrame()
-        
-        ticker = yf.Ticker(yahoo_symbol)
-        hist = ticker.history(period=period, interval=interval)
+        period, interval, resample_rule = plan
+        hist = _get_yahoo_history(yahoo_symbol, period, interval)
         
         if hist.empty:
             logging.warning(f"海龟交易法 {symbol} {timeframe}: Yahoo Finance返回空数据")
             return pd.DataFrame()
         
-        # 转换为标准格式
-        df = pd.DataFrame()
-        df['timestamp'] = hist.index
-        df['open'] = hist['Open'].values
-        df['high'] = hist['High'].values  
-        df['low'] = hist['Low'].values
-        df['close'] = hist['Close'].values
-        df['volume'] = hist['Volume'].values
+        df = _yahoo_history_to_frame(hist)
         
-        # 如果是4小时，需要重采样
-        if timeframe == '4h':
+        # Yahoo Finance没有4h间隔，需要从1h数据重采样
+        if resample_rule:
             df = df.set_index('timestamp')
-            df_resampled = df.resample('4h').agg({
+            df_resampled = df.resample(resample_rule).agg({
                 'open': 'first',
                 'high': 'max',
                 'low': 'min',
@@ -298,7 +961,7 @@ def test_exchange_connection():
         return False
 
 def warmup_connection():
-    """预热连接，避免主要币种获取数据时的冷启动问题"""
+    """预热共享连接池中的Bitget连接，使后续K线请求直接复用已建立的TLS连接"""
     try:
         logging.info("正在预热Bitget连接...")
         # 先测试连接
@@ -324,22 +987,12 @@ def warmup_connection():
         return False
 
 def get_all_usdt_swap_symbols():
-    """获取所有USDT永续合约交易对，主要币种排在后面以避免并发冲突"""
+    """获取所有USDT永续合约交易对（请求速率由令牌桶统一控制，无需再调整顺序）"""
     try:
         contracts = _load_bitget_contracts(force_refresh=True)
         symbols = list(contracts.keys())
-        
-        # 将主要币种移到列表后面，避免并发时的冲突
-        major_coins = ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'BNB/USDT:USDT']
-        other_symbols = [s for s in symbols if s not in major_coins]
-        major_symbols = [s for s in symbols if s in major_coins]
-        
-        # 重新排序：其他币种在前，主要币种在后
-        reordered_symbols = other_symbols + major_symbols
-        
         logging.info(f"从Bitget获取到 {len(symbols)} 个USDT永续合约交易对")
-        logging.info(f"主要币种 {major_symbols} 已重排序到列表后部")
-        return reordered_symbols
+        return symbols
         
     except requests.RequestException as e:
         logging.error(f"获取交易对失败 - 网络错误: {e}")
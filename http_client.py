@@ -0,0 +1,122 @@
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config import HTTP_CONNECT_TIMEOUT, HTTP_DEFAULT_POOL_SIZE, HTTP_POOL_SIZES, HTTP_READ_TIMEOUT
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class ConnectionStats:
+    """单个主机的请求数与新建连接数（TCP+TLS握手次数）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused': max(0, self.requests - self.new_connections),
+            }
+
+
+def _counting_pool_class(base_cls, stats):
+    class CountingConnectionPool(base_cls):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """统计请求数与新建连接数的连接池适配器"""
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+
+def _create_session(host):
+    pool_size = HTTP_POOL_SIZES.get(host, HTTP_DEFAULT_POOL_SIZE)
+    stats = ConnectionStats()
+    adapter = CountingHTTPAdapter(stats, pool_connections=1, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.connection_stats = stats
+    logging.debug(f"创建HTTP连接池: {host}, 最大连接数 {pool_size}")
+    return session
+
+
+def get_session(url):
+    """按主机返回共享的keep-alive Session（线程安全，惰性创建）"""
+    host = urlsplit(url).hostname or ''
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _create_session(host)
+            _sessions[host] = session
+        return session
+
+
+def _resolve_timeout(timeout):
+    if timeout is None:
+        return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return timeout
+    return (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+
+
+def http_get(url, timeout=None, **kwargs):
+    return get_session(url).get(url, timeout=_resolve_timeout(timeout), **kwargs)
+
+
+def http_post(url, timeout=None, **kwargs):
+    return get_session(url).post(url, timeout=_resolve_timeout(timeout), **kwargs)
+
+
+def get_connection_stats():
+    """返回各主机的连接复用统计 {host: {'requests', 'new_connections', 'reused'}}"""
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    return {host: session.connection_stats.snapshot() for host, session in sessions.items()}
+
+
+def log_connection_stats():
+    for host, stats in get_connection_stats().items():
+        logging.info(
+            f"HTTP连接复用 {host}: 请求 {stats['requests']} 次, "
+            f"新建连接 {stats['new_connections']} 次, 复用 {stats['reused']} 次"
+        )
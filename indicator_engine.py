@@ -0,0 +1,263 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+from candle_store import to_epoch_ms
+from config import DC_PERIOD, MA_FAST, MA_LONG, MA_MID, MA_SLOW
+
+RSI_PERIOD = 6
+RSI_ALPHA = 1 / RSI_PERIOD
+MA_WINDOWS = {
+    'ma5': MA_FAST,
+    'ma10': MA_MID,
+    'ma20': MA_SLOW,
+    'ma200': MA_LONG,
+}
+INDICATOR_COLUMNS = ['highest', 'lowest', 'mid', 'ma5', 'ma10', 'ma20', 'ma200', 'rsi6']
+# 每提交这么多根K线后用窗口内原始收盘价重算一次均线累加和，抑制浮点误差累积
+RESYNC_INTERVAL = 1000
+
+
+class IndicatorState:
+    """
+    单个 (symbol, timeframe) 的增量指标状态，每根新K线 O(1) 更新：
+    DC上下轨用单调队列，均线用滑动累加和，RSI6用Wilder EWM（与pandas ewm(adjust=True)一致）
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last_timestamp = None  # 毫秒时间戳
+        self.closes = deque(maxlen=max(MA_WINDOWS.values()))
+        self.ma_sums = {name: 0.0 for name in MA_WINDOWS}
+        self.high_deque = deque()  # (index, high)，high单调递减
+        self.low_deque = deque()   # (index, low)，low单调递增
+        self.prev_close = None
+        self.gain_num = 0.0
+        self.loss_num = 0.0
+        self.ewm_den = 0.0
+        self.values = None  # 最后一根已提交K线的指标
+
+    @staticmethod
+    def _window_extreme(window, index, value, is_max):
+        start = index - DC_PERIOD + 1
+        for idx, existing in window:
+            if idx >= start:
+                return max(existing, value) if is_max else min(existing, value)
+        return value
+
+    def _compute(self, high, low, close):
+        index = self.count
+        values = {}
+
+        if index + 1 >= DC_PERIOD:
+            values['highest'] = self._window_extreme(self.high_deque, index, high, True)
+            values['lowest'] = self._window_extreme(self.low_deque, index, low, False)
+            values['mid'] = (values['highest'] + values['lowest']) / 2
+        else:
+            values['highest'] = values['lowest'] = values['mid'] = np.nan
+
+        new_sums = {}
+        for name, window in MA_WINDOWS.items():
+            leaving = self.closes[-window] if index >= window else 0.0
+            new_sums[name] = self.ma_sums[name] + close - leaving
+            values[name] = new_sums[name] / window if index + 1 >= window else np.nan
+
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        gain_num = self.gain_num * (1 - RSI_ALPHA) + max(delta, 0.0)
+        loss_num = self.loss_num * (1 - RSI_ALPHA) + max(-delta, 0.0)
+        ewm_den = self.ewm_den * (1 - RSI_ALPHA) + 1
+        if index + 1 >= RSI_PERIOD:
+            avg_gain = gain_num / ewm_den
+            avg_loss = loss_num / ewm_den or 1e-8
+            values['rsi6'] = 100 - (100 / (1 + avg_gain / avg_loss))
+        else:
+            values['rsi6'] = np.nan
+
+        return values, new_sums, (gain_num, loss_num, ewm_den)
+
+    def preview(self, high, low, close):
+        """计算追加一根K线后的指标但不修改状态（用于未收盘的最新K线）"""
+        values, _, _ = self._compute(high, low, close)
+        return values
+
+    def append(self, timestamp, high, low, close):
+        """提交一根已收盘K线"""
+        values, new_sums, ewm_state = self._compute(high, low, close)
+        index = self.count
+
+        self.ma_sums = new_sums
+        self.closes.append(close)
+        self.gain_num, self.loss_num, self.ewm_den = ewm_state
+        self.prev_close = close
+
+        while self.high_deque and self.high_deque[-1][1] <= high:
+            self.high_deque.pop()
+        self.high_deque.append((index, high))
+        while self.low_deque and self.low_deque[-1][1] >= low:
+            self.low_deque.pop()
+        self.low_deque.append((index, low))
+        start = index - DC_PERIOD + 1
+        while self.high_deque[0][0] < start:
+            self.high_deque.popleft()
+        while self.low_deque[0][0] < start:
+            self.low_deque.popleft()
+
+        self.count += 1
+        self.last_timestamp = timestamp
+        self.values = values
+        if self.count % RESYNC_INTERVAL == 0:
+            closes = list(self.closes)
+            for name, window in MA_WINDOWS.items():
+                self.ma_sums[name] = math.fsum(closes[-window:])
+        return values
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def _rebuild_state(rows):
+    state = IndicatorState()
+    for timestamp, high, low, close in rows:
+        state.append(timestamp, high, low, close)
+    return state
+
+
+def get_indicator_tail(key, df):
+    """
+    增量计算 df 最后两行的指标，返回带指标列的两行DataFrame；无法增量计算时返回None。
+
+    约定 df 按时间升序，除最后一根外均为已收盘K线：已收盘K线提交进状态（每根O(1)），
+    最后一根只做预览，下一轮被新数据覆盖也不影响状态。状态按key保存在进程内，跨扫描复用；
+    若本地状态与df对不上（首次、进程重启、数据出现缺口）则用df整体重建一次。
+    """
+    if len(df) < 2:
+        return None
+    prices = df[['high', 'low', 'close']].to_numpy(dtype=float)
+    if np.isnan(prices).any():
+        return None
+    # 内部统一用int64毫秒时间戳比对，不为每根K线创建datetime对象
+    timestamps = to_epoch_ms(df['timestamp']).tolist()
+    closed = len(df) - 1
+
+    with _states_lock:
+        state = _states.get(key)
+
+    start = None
+    if state is not None and state.last_timestamp is not None:
+        for pos in range(closed - 1, -1, -1):
+            if timestamps[pos] == state.last_timestamp:
+                start = pos + 1
+                break
+            if timestamps[pos] < state.last_timestamp:
+                break
+
+    if start is None:
+        state = _rebuild_state(
+            (timestamps[i], prices[i, 0], prices[i, 1], prices[i, 2]) for i in range(closed)
+        )
+    else:
+        for i in range(start, closed):
+            state.append(timestamps[i], prices[i, 0], prices[i, 1], prices[i, 2])
+
+    with _states_lock:
+        _states[key] = state
+
+    last_values = state.preview(prices[-1, 0], prices[-1, 1], prices[-1, 2])
+    tail = df.iloc[-2:].copy().reset_index(drop=True)
+    for column in INDICATOR_COLUMNS:
+        tail[column] = [state.values[column], last_values[column]]
+    return tail
+
+
+def stacked_shape(frames, columns=('open', 'high', 'low', 'close')):
+    """stack_frames 结果整体的形状 (columns, symbols, bars)"""
+    bars = max((len(df) for df in frames.values()), default=0)
+    return (len(columns), len(frames), bars)
+
+
+def stack_frames(frames, columns=('open', 'high', 'low', 'close'), buffer=None):
+    """
+    把 {symbol: df} 右对齐堆叠成 (symbols × bars) 的二维数组，较短的序列在左侧补NaN。
+    buffer 可传入外部内存（如共享内存），数组直接写在其中而不另外分配。
+    返回 (symbols, {column: 2D array}, 每个序列的长度)
+    """
+    symbols = list(frames)
+    lengths = np.array([len(frames[symbol]) for symbol in symbols], dtype=int)
+    shape = stacked_shape(frames, columns)
+    bars = shape[2]
+    block = np.ndarray(shape, dtype=np.float64, buffer=buffer) if buffer is not None else np.empty(shape)
+    block.fill(np.nan)
+    arrays = {column: block[i] for i, column in enumerate(columns)}
+    for row, symbol in enumerate(symbols):
+        df = frames[symbol]
+        for column in columns:
+            arrays[column][row, bars - len(df):] = df[column].to_numpy(dtype=float)
+    return symbols, arrays, lengths
+
+
+def _rolling_extreme(values, window, is_max):
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=1)
+    # 窗口内有NaN时结果为NaN，与pandas rolling(window)一致
+    out[:, window - 1:] = windows.max(axis=2) if is_max else windows.min(axis=2)
+    return out
+
+
+def _rolling_mean(values, window):
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return out
+    filled = np.where(np.isnan(values), 0.0, values)
+    sums = np.cumsum(filled, axis=1)
+    valid = np.cumsum(~np.isnan(values), axis=1)
+    window_sum = sums[:, window - 1:] - np.concatenate([np.zeros((values.shape[0], 1)), sums[:, :-window]], axis=1)
+    window_valid = valid[:, window - 1:] - np.concatenate([np.zeros((values.shape[0], 1), dtype=int), valid[:, :-window]], axis=1)
+    out[:, window - 1:] = np.where(window_valid == window, window_sum / window, np.nan)
+    return out
+
+
+def _rsi6(close, lengths):
+    symbols, bars = close.shape
+    starts = bars - lengths
+    delta = np.full(close.shape, np.nan)
+    delta[:, 1:] = np.diff(close, axis=1)
+    # 与 calculate_indicators 一致：delta为NaN时涨跌幅都记为0
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+
+    rsi = np.full(close.shape, np.nan)
+    gain_num = np.zeros(symbols)
+    loss_num = np.zeros(symbols)
+    ewm_den = np.zeros(symbols)
+    decay = 1 - RSI_ALPHA
+    for t in range(bars):
+        active = t >= starts
+        gain_num = np.where(active, gain_num * decay + gain[:, t], 0.0)
+        loss_num = np.where(active, loss_num * decay + loss[:, t], 0.0)
+        ewm_den = np.where(active, ewm_den * decay + 1, 0.0)
+        ready = active & (t - starts + 1 >= RSI_PERIOD)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_gain = gain_num / ewm_den
+            avg_loss = loss_num / ewm_den
+            avg_loss = np.where(avg_loss == 0, 1e-8, avg_loss)
+            rsi[:, t] = np.where(ready, 100 - (100 / (1 + avg_gain / avg_loss)), np.nan)
+    return rsi
+
+
+def compute_universe_indicators(arrays, lengths):
+    """对整个币种池一次性计算 DC / MA / RSI6，输入输出均为 (symbols × bars) 数组"""
+    high, low, close = arrays['high'], arrays['low'], arrays['close']
+    result = {
+        'highest': _rolling_extreme(high, DC_PERIOD, True),
+        'lowest': _rolling_extreme(low, DC_PERIOD, False),
+    }
+    result['mid'] = (result['highest'] + result['lowest']) / 2
+    for name, window in MA_WINDOWS.items():
+        result[name] = _rolling_mean(close, window)
+    result['rsi6'] = _rsi6(close, lengths)
+    return result
@@ -1,27 +1,73 @@
+import functools
 import logging
 import schedule
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 from config import (
     ALLOWED_USERS_FILE,
     BASE_DIR,
+    CANDLE_CLOSE_GRACE_SECONDS,
+    CANDLE_CLOSE_OFFSETS,
+    COMPUTE_WORKERS,
     DATA_DIR,
     DC_PERIOD,
+    FETCH_MODE,
+    INGESTION_MODE,
     LOGLEVEL,
     LOG_FILE,
     MA_LONG,
     MAX_WORKERS,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT,
+    NOTIFY_WORKERS,
+    OUTBOX_ENABLED,
+    PIPELINE_QUEUE_SIZE,
+    SIGNAL_DIGEST_ENABLED,
+    SIGNAL_EVAL_MODE,
+    STREAM_SETTLE_SECONDS,
     SYMBOLS,
+    TG_UPDATE_MODE,
     TIMEFRAMES,
     TMP_DIR,
+    TRACE_DIR,
+    TRACE_ENABLED,
+    TRACE_KEEP,
+    USER_DB_FILE,
     USER_SETTINGS_FILE,
+    YAHOO_CLOSE_OFFSETS,
+    YAHOO_SCHEDULED_TIMEFRAMES,
+)
+from exchange_utils import (
+    clear_yahoo_cache,
+    get_all_data_async,
+    get_all_usdt_swap_symbols,
+    get_data,
+    prefetch_yahoo_data,
+    start_candle_stream,
+    warmup_connection,
+)
+from strategy_sig import check_signal, check_signals_batch, check_turtle_signal, check_can_biao_xiu_signal, save_can_biao_xiu_state
+from http_client import log_connection_stats
+from metrics import SCAN_DURATION, SCAN_LAST_DURATION, SCAN_LAST_FINISHED, SIGNALS_EMITTED, start_metrics_server
+from pipeline import ScanPipeline
+from scheduler import CandleCloseScheduler, latest_close, run_due_scans, run_stream_scans
+from signal_pool import evaluate_signals_in_processes, shutdown_signal_pool
+from tracing import span, start_trace, stop_trace
+from notifier import (
+    SignalDigest,
+    handle_signals,
+    monitor_new_users,
+    rsi6_summary,
+    send_telegram_message,
+    set_bot_commands,
+    start_outbox_sender,
+    start_webhook_listener,
 )
-from exchange_utils import get_data, get_all_usdt_swap_symbols, warmup_connection
-from strategy_sig import check_signal, check_turtle_signal, check_can_biao_xiu_signal
-from notifier import monitor_new_users, send_telegram_message, set_bot_commands, rsi6_summary, handle_signals
 from utils import prepare_runtime_state
 
+CANDLE_LIMIT = max(DC_PERIOD, MA_LONG, 500)
+
 
 def configure_logging():
     logging.basicConfig(
@@ -35,55 +81,181 @@ def configure_logging():
     )
 
 
-def job():
+def process_symbol_timeframe(symbol, timeframe, df, batch_frames=None, yahoo_checks=True):
+    """
+    检测单个交易对/周期的信号并返回，不在这里发送（发送由流水线的推送阶段负责）。
+    yahoo_checks 为False时跳过只用Yahoo数据的检测（该周期按Yahoo收盘单独调度）
+    """
+    signals = []
+    if df.empty:
+        logging.warning(f"{symbol} {timeframe} 获取数据失败或数据为空")
+        return signals
+    logging.info(f"{symbol} {timeframe} K线数量: {len(df)}")
+    required_cols = {'timestamp', 'open', 'high', 'low', 'close', 'volume'}
+    if not required_cols.issubset(df.columns):
+        logging.error(f"{symbol} {timeframe} 数据缺少必要字段: {df.columns}")
+        return signals
+
+    # 1. 检测其他指标信号（使用Bitget数据）；批量模式下先收集，抓取完成后统一计算
+    if batch_frames is not None:
+        batch_frames.setdefault(timeframe, {})[symbol] = df
+    else:
+        with span('check_signal', symbol=symbol, timeframe=timeframe):
+            signals.extend(check_signal(symbol, timeframe, df, extra_signal=symbol in SYMBOLS))
+
+    if yahoo_checks:
+        signals.extend(check_yahoo_signals(symbol, timeframe))
+    return signals
+
+
+def check_yahoo_signals(symbol, timeframe):
+    """只用Yahoo Finance数据的检测：海龟交易法与参标修"""
+    signals = []
+    # 检测海龟交易法信号（严格使用Yahoo Finance数据）
+    with span('check_turtle_signal', symbol=symbol, timeframe=timeframe):
+        signals.extend(check_turtle_signal(symbol, timeframe))
+
+    # 检测参标修信号（使用Yahoo Finance数据，仅日线）
+    with span('check_can_biao_xiu_signal', symbol=symbol, timeframe=timeframe):
+        signals.extend(check_can_biao_xiu_signal(symbol, timeframe))
+    return signals
+
+
+def fetch_from_stream(stream, symbol, timeframe, limit):
+    """stream模式：优先使用内存中的推送K线；数据不够长或已过期（推送中断）时用REST抓取并回填"""
+    current_open = latest_close(timeframe, time.time(), CANDLE_CLOSE_OFFSETS) * 1000
+    df = stream.get_frame(symbol, timeframe)
+    if len(df) >= limit and (stream.last_timestamp(symbol, timeframe) or 0) >= current_open:
+        return df
+    df = get_data(symbol, timeframe, limit)
+    stream.seed(symbol, timeframe, df)
+    return df
+
+
+def job(timeframes=None, stream=None, yahoo_timeframes=None):
+    """
+    扫描一轮；timeframes 为None时扫描全部周期（含全部Yahoo检测），否则只扫描给定的（刚收盘的）Bitget周期。
+    yahoo_timeframes 为运行Yahoo检测的周期，默认为 timeframes 中不按Yahoo收盘单独调度的周期。
+    传入stream时K线从WebSocket推送的内存序列读取。每轮耗时记入扫描指标，
+    开启追踪时各阶段的时间线写入 TRACE_DIR
+    """
+    if timeframes is None:
+        timeframes = TIMEFRAMES
+        if yahoo_timeframes is None:
+            yahoo_timeframes = TIMEFRAMES
+    elif yahoo_timeframes is None:
+        yahoo_timeframes = [timeframe for timeframe in timeframes if timeframe not in YAHOO_SCHEDULED_TIMEFRAMES]
+    tracer = start_trace() if TRACE_ENABLED else None
+    started = time.perf_counter()
+    try:
+        with span('scan', timeframes=','.join(timeframes), yahoo_timeframes=','.join(yahoo_timeframes), stream=stream is not None):
+            run_scan(timeframes, yahoo_timeframes, stream)
+    finally:
+        duration = time.perf_counter() - started
+        SCAN_DURATION.observe(duration)
+        SCAN_LAST_DURATION.set(duration)
+        SCAN_LAST_FINISHED.set(time.time())
+        logging.info(f"本轮扫描耗时: {duration:.2f}秒")
+        if tracer is not None:
+            stop_trace()
+            try:
+                logging.info(f"本轮扫描追踪已写入: {tracer.write(TRACE_DIR, TRACE_KEEP)}")
+            except OSError as e:
+                logging.error(f"写入扫描追踪失败: {e}")
+
+
+def yahoo_job(timeframes):
+    """按Yahoo K线收盘触发：只运行给定周期的Yahoo检测，不抓取Bitget K线"""
+    job([], yahoo_timeframes=timeframes)
+
+
+def run_scan(timeframes, yahoo_timeframes, stream=None):
     # 预热连接，特别是为了避免主要币种数据获取失败
-    warmup_connection()
+    if timeframes:
+        with span('warmup_connection'):
+            warmup_connection()
+
+    # 每轮扫描重新下载Yahoo数据，本轮内海龟与参标修共用同一份缓存
+    clear_yahoo_cache()
 
-    all_symbols = get_all_usdt_swap_symbols()
+    with span('load_contracts'):
+        all_symbols = get_all_usdt_swap_symbols()
+    # 批量预取所有映射币种的Yahoo数据，避免在Bitget抓取过程中逐个下载
+    with span('prefetch_yahoo_data', symbols=len(all_symbols)):
+        prefetch_yahoo_data(all_symbols, yahoo_timeframes)
     rsi6_signals = []
+    limit = CANDLE_LIMIT
+    pairs = [(symbol, timeframe) for symbol in all_symbols for timeframe in timeframes]
+    # 本轮不抓取Bitget、只做Yahoo检测的周期（K线为None）
+    yahoo_only_pairs = [
+        (symbol, timeframe) for symbol in all_symbols for timeframe in yahoo_timeframes if timeframe not in timeframes
+    ]
+    batch_frames = {} if SIGNAL_EVAL_MODE in ("batch", "process") else None
+    # 汇总模式：本轮信号先按用户缓存，扫描结束后每个用户只发一条合并消息
+    digest = SignalDigest() if SIGNAL_DIGEST_ENABLED else None
+    # 参标修状态在信号交付后才保存；汇总模式下要等汇总消息写出之后
+    delivered_can_signals = []
 
-    def fetch_data(symbol, timeframe):
-        limit = max(DC_PERIOD, MA_LONG, 500)
-        df = get_data(symbol, timeframe, limit)
-        return symbol, timeframe, df
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [
-            executor.submit(fetch_data, symbol, timeframe)
-            for symbol in all_symbols
-            for timeframe in TIMEFRAMES
-        ]
-
-        for future in as_completed(futures):
-            symbol = "UNKNOWN"
-            timeframe = "UNKNOWN"
-            try:
-                symbol, timeframe, df = future.result()
-                if df.empty:
-                    logging.warning(f"{symbol} {timeframe} 获取数据失败或数据为空")
-                    continue
-                logging.info(f"{symbol} {timeframe} K线数量: {len(df)}")
-                required_cols = {'timestamp', 'open', 'high', 'low', 'close', 'volume'}
-                if not required_cols.issubset(df.columns):
-                    logging.error(f"{symbol} {timeframe} 数据缺少必要字段: {df.columns}")
-                    continue
-
-                # 1. 检测其他指标信号（使用Bitget数据）
-                for sig in check_signal(symbol, timeframe, df, extra_signal=symbol in SYMBOLS):
-                    handle_signals(sig, rsi6_signals=rsi6_signals)
-
-                # 2. 检测海龟交易法信号（严格使用Yahoo Finance数据）
-                for sig in check_turtle_signal(symbol, timeframe):
-                    handle_signals(sig, rsi6_signals=rsi6_signals)
-
-                # 3. 检测参标修信号（使用Yahoo Finance数据，仅日线）
-                for sig in check_can_biao_xiu_signal(symbol, timeframe):
-                    handle_signals(sig, rsi6_signals=rsi6_signals)
+    def fetch(symbol, timeframe):
+        with span('fetch', symbol=symbol, timeframe=timeframe):
+            if stream is not None:
+                return symbol, timeframe, fetch_from_stream(stream, symbol, timeframe, limit)
+            return symbol, timeframe, get_data(symbol, timeframe, limit)
+
+    def compute(item):
+        symbol, timeframe, df = item
+        try:
+            with span('compute', symbol=symbol, timeframe=timeframe):
+                if df is None:
+                    return check_yahoo_signals(symbol, timeframe)
+                return process_symbol_timeframe(symbol, timeframe, df, batch_frames, timeframe in yahoo_timeframes)
+        except Exception as e:
+            logging.error(f"处理{symbol} {timeframe}异常: {e}", exc_info=True)
+            return []
+
+    def notify(sig):
+        with span('handle_signals', type=sig["type"], symbol=sig.get("symbol", ""), timeframe=sig.get("timeframe", "")):
+            handle_signals(sig, rsi6_signals=rsi6_signals, digest=digest)
+        SIGNALS_EMITTED.inc(type=sig["type"], timeframe=sig.get("timeframe", ""))
+        if sig["type"] == "can_biao_xiu":
+            if digest is None:
+                save_can_biao_xiu_state(sig)
+            else:
+                delivered_can_signals.append(sig)
 
+    # 抓取 → 计算 → 推送 三个阶段并行，推送慢不会拖住抓取（队列有界，内存占用固定）
+    pipeline = ScanPipeline(compute, notify, COMPUTE_WORKERS, NOTIFY_WORKERS, PIPELINE_QUEUE_SIZE)
+    with span('fetch_all', pairs=len(pairs)):
+        if stream is None and FETCH_MODE == "async":
+            get_all_data_async(pairs, limit, on_result=pipeline.submit_frame)
+        else:
+            pipeline.fetch(pairs, fetch, MAX_WORKERS)
+        for symbol, timeframe in yahoo_only_pairs:
+            pipeline.submit_frame((symbol, timeframe, None))
+        pipeline.finish_compute()
+
+    if batch_frames is not None:
+        evaluate = evaluate_signals_in_processes if SIGNAL_EVAL_MODE == "process" else check_signals_batch
+        for timeframe, frames in batch_frames.items():
+            try:
+                with span('evaluate_signals', timeframe=timeframe, symbols=len(frames)):
+                    signals = evaluate(timeframe, frames, extra_signal_symbols=set(SYMBOLS))
+                for sig in signals:
+                    pipeline.submit_signal(sig)
             except Exception as e:
-                logging.error(f"处理{symbol} {timeframe}异常: {e}", exc_info=True)
+                logging.error(f"批量检测{timeframe}信号异常: {e}", exc_info=True)
+    with span('finish_notify'):
+        pipeline.finish()
+
+    if digest is not None:
+        with span('digest_flush'):
+            digest.flush()
+        for sig in delivered_can_signals:
+            save_can_biao_xiu_state(sig)
     if rsi6_signals:
-        rsi6_summary(rsi6_signals)
+        with span('rsi6_summary', signals=len(rsi6_signals)):
+            rsi6_summary(rsi6_signals)
+    log_connection_stats()
 
 
 def main(run_loop=True):
@@ -94,21 +266,48 @@ def main(run_loop=True):
         user_settings_file=USER_SETTINGS_FILE,
         log_file=LOG_FILE,
         legacy_base_dir=BASE_DIR,
+        user_db_file=USER_DB_FILE,
     )
     configure_logging()
-    threading.Thread(target=monitor_new_users, daemon=True).start()
+    if METRICS_ENABLED:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if TG_UPDATE_MODE == "webhook":
+        start_webhook_listener()
+    else:
+        threading.Thread(target=monitor_new_users, daemon=True).start()
+    if OUTBOX_ENABLED:
+        start_outbox_sender()
     set_bot_commands()
     logging.info("策略开始")
     send_telegram_message("策略开始")
-    schedule.every(60).minutes.do(job)
-    job()
+    # 每秒检查一次是否有周期刚收盘，只扫描到期的周期；启动时先全量扫描一次
+    scheduler = CandleCloseScheduler(TIMEFRAMES, CANDLE_CLOSE_GRACE_SECONDS, CANDLE_CLOSE_OFFSETS)
+    if INGESTION_MODE == "stream":
+        # 推送模式：K线收盘即触发扫描；定时调度保留为推送中断时的兜底
+        stream = start_candle_stream(get_all_usdt_swap_symbols(), TIMEFRAMES, max_rows=CANDLE_LIMIT)
+        scan = functools.partial(job, stream=stream)
+        schedule.every(1).seconds.do(run_stream_scans, stream, scheduler, scan, STREAM_SETTLE_SECONDS)
+    else:
+        scan = job
+    schedule.every(1).seconds.do(run_due_scans, scheduler, scan)
+    scheduler.mark_scanned(TIMEFRAMES)
+    if YAHOO_SCHEDULED_TIMEFRAMES:
+        # Yahoo日线在UTC零点收盘，海龟交易法与参标修的日线检测按该收盘单独触发
+        yahoo_scheduler = CandleCloseScheduler(YAHOO_SCHEDULED_TIMEFRAMES, CANDLE_CLOSE_GRACE_SECONDS, YAHOO_CLOSE_OFFSETS)
+        schedule.every(1).seconds.do(run_due_scans, yahoo_scheduler, yahoo_job)
+        yahoo_scheduler.mark_scanned(YAHOO_SCHEDULED_TIMEFRAMES)
+    scan()
 
     if not run_loop:
         return
 
-    while True:
-        schedule.run_pending()
-        time.sleep(0.1)
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(0.1)
+    finally:
+        # 退出主循环（如Ctrl+C）时回收信号计算子进程
+        shutdown_signal_pool()
 
 
 if __name__ == "__main__":
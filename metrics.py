@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 秒，覆盖从单次HTTP请求（几十毫秒）到整轮扫描（几分钟）的范围
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(_Metric):
+    """可任意设置的瞬时值"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    _samples = Counter._samples
+
+
+class Histogram(_Metric):
+    """累积分桶直方图（单位秒），time() 可用作计时上下文"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """进程内指标集合，render() 输出Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SCAN_DURATION = REGISTRY.histogram('ltt_scan_duration_seconds', '每轮扫描 job() 耗时')
+SCAN_LAST_DURATION = REGISTRY.gauge('ltt_scan_last_duration_seconds', '最近一轮扫描耗时')
+SCAN_LAST_FINISHED = REGISTRY.gauge('ltt_scan_last_finished_timestamp_seconds', '最近一轮扫描结束时间（Unix秒）')
+BITGET_REQUEST_DURATION = REGISTRY.histogram(
+    'ltt_bitget_request_duration_seconds', 'Bitget REST请求耗时（不含本地限流排队）', ('endpoint', 'status'),
+)
+BITGET_RATE_LIMIT_WAITS = REGISTRY.counter(
+    'ltt_bitget_rate_limit_waits_total', 'Bitget请求因本地令牌桶限流而等待的次数', ('endpoint',),
+)
+BITGET_RATE_LIMIT_WAIT_SECONDS = REGISTRY.counter(
+    'ltt_bitget_rate_limit_wait_seconds_total', 'Bitget请求在本地令牌桶上累计等待的秒数', ('endpoint',),
+)
+BITGET_RETRIES = REGISTRY.counter(
+    'ltt_bitget_candle_retries_total', 'Bitget K线抓取重试次数，按原因分类', ('timeframe', 'reason'),
+)
+BITGET_FAILURES = REGISTRY.counter(
+    'ltt_bitget_candle_failures_total', 'Bitget K线抓取放弃（返回空数据）次数', ('timeframe', 'reason'),
+)
+YAHOO_FETCH_DURATION = REGISTRY.histogram(
+    'ltt_yahoo_fetch_duration_seconds', 'Yahoo Finance下载耗时（缓存未命中）', ('interval', 'mode'),
+)
+YAHOO_CACHE_HITS = REGISTRY.counter('ltt_yahoo_cache_hits_total', 'Yahoo历史数据缓存命中次数', ('interval',))
+SIGNALS_EMITTED = REGISTRY.counter('ltt_signals_total', '检测到并交付推送的信号数', ('type', 'timeframe'))
+TELEGRAM_SENDS = REGISTRY.counter('ltt_telegram_sends_total', 'Telegram sendMessage结果', ('result',))
+TELEGRAM_SEND_DURATION = REGISTRY.histogram(
+    'ltt_telegram_send_duration_seconds', 'Telegram sendMessage耗时（含限流排队与重试）', ('result',),
+)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics {self.client_address[0]} {format % args}")
+
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """在后台线程启动 /metrics HTTP服务（Prometheus文本格式），返回server（server_address为实际监听地址）"""
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"指标服务已启动: http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
@@ -1,77 +1,82 @@
-import requests
 import logging
 import time
-import os
 import threading
-import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from config import TG_BOT_TOKEN, TG_CHAT_ID, SUBSCRIBE_PASSWORD, DEFAULT_USER_SETTINGS, USER_SETTINGS_FILE, TIMEFRAMES, MAX_MSG_LEN, ALLOWED_USERS_FILE
-from utils import ensure_file_exists
-
-USER_FILE = ALLOWED_USERS_FILE
-file_lock = threading.Lock()
+from config import (
+    TG_BOT_TOKEN, TG_CHAT_ID, SUBSCRIBE_PASSWORD, DEFAULT_USER_SETTINGS, TIMEFRAMES, MAX_MSG_LEN,
+    TG_GLOBAL_RATE_LIMIT, TG_CHAT_RATE_LIMIT, TG_SEND_MAX_RETRIES, TG_RETRY_BACKOFF,
+    OUTBOX_ENABLED, TG_SEND_WORKERS, TG_POLL_TIMEOUT, TG_POLL_ERROR_DELAY, TG_COMMAND_WORKERS,
+    TG_WEBHOOK_URL, TG_WEBHOOK_SECRET, TG_WEBHOOK_HOST, TG_WEBHOOK_PORT, TG_WEBHOOK_PATH,
+)
+from http_client import http_get, http_post
+from metrics import TELEGRAM_SEND_DURATION, TELEGRAM_SENDS
+from outbox import get_outbox
+from telegram_webhook import start_webhook_server
+from tracing import span
+from user_store import get_user_store
+from utils import TokenBucket
+
+# 订阅路由索引：(timeframe, signal_type) -> 订阅的chat_id集合，用户或设置变化时失效，下次查询时重建
+_subscription_index = None
+_subscription_index_lock = threading.Lock()
+
+# Telegram推送限流：所有发送线程共用一个全局令牌桶，每个聊天另有一个令牌桶（按需创建）
+_global_send_bucket = TokenBucket(TG_GLOBAL_RATE_LIMIT) if TG_GLOBAL_RATE_LIMIT > 0 else None
+_chat_send_buckets = {}
+_chat_send_buckets_lock = threading.Lock()
+# 收到429后所有发送暂停到该时刻（time.monotonic）
+_send_paused_until = 0.0
+_send_pause_lock = threading.Lock()
 
 def safe_write_user(user_id):
-    """安全写入用户ID到文件"""
-    with file_lock:
-        if not os.path.exists(USER_FILE):
-            with open(USER_FILE, "w") as f:
-                f.write(user_id + "\n")
-            os.chmod(USER_FILE, 0o600)
-        else:
-            with open(USER_FILE, "a") as f:
-                f.write(user_id + "\n")
+    """写入订阅用户（用户库单行插入）"""
+    try:
+        get_user_store().add_user(user_id)
+    except Exception as e:
+        logging.error(f"写入用户{user_id}失败: {e}")
+    invalidate_subscription_index()
 
 def load_user_settings():
-    ensure_file_exists(USER_SETTINGS_FILE)
     try:
-        with open(USER_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_user_store().all_settings()
     except Exception as e:
         logging.error(f"加载用户设置失败: {e}")
         return {}
 
-def save_user_settings(settings):
+def save_user_settings(user_id, settings):
     try:
-        with open(USER_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=4)
+        get_user_store().set_settings(user_id, settings)
     except Exception as e:
         logging.error(f"保存用户设置失败: {e}")
 
 def get_user_settings(user_id):
-    user_id = str(user_id)
-    settings = load_user_settings()
-    return settings.get(user_id, DEFAULT_USER_SETTINGS.copy())
+    settings = get_user_store().get_settings(user_id)
+    return settings if settings is not None else {key: list(value) for key, value in DEFAULT_USER_SETTINGS.items()}
 
 def update_user_settings(user_id, setting_type, value):
     user_id = str(user_id)
-    settings = load_user_settings()
-    if user_id not in settings:
-        settings[user_id] = DEFAULT_USER_SETTINGS.copy()
+    settings = get_user_settings(user_id)
     if setting_type == "timeframes":
         timeframes = [tf.strip() for tf in value.split(",") if tf.strip() in TIMEFRAMES]
         if timeframes:
-            settings[user_id]["enabled_timeframes"] = timeframes
+            settings["enabled_timeframes"] = timeframes
     elif setting_type == "signals":
         # 过滤掉rsi6_extreme，因为它是必选的
         signals = [s.strip() for s in value.split(',') if s.strip() and s.strip() != "rsi6_extreme"]
-        settings[user_id]["enabled_signals"] = signals
-    save_user_settings(settings)
+        settings["enabled_signals"] = signals
+    save_user_settings(user_id, settings)
+    invalidate_subscription_index()
 
 def load_allowed_users():
     """读取已授权用户集合"""
-    with file_lock:
-        if not os.path.exists(USER_FILE):
-            return set()
-        with open(USER_FILE, "r") as f:
-            return set(line.strip() for line in f if line.strip())
+    return get_user_store().list_users()
 
 def get_user_info(user_id):
     """获取用户的Telegram信息"""
     try:
         url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/getChat"
         params = {"chat_id": user_id}
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params, timeout=10)
         if resp.status_code == 200:
             data = resp.json()
             if data.get("ok"):
@@ -104,7 +109,7 @@ def check_and_clean_blocked_users():
             # 尝试发送一个测试消息（使用getChat API更轻量）
             url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/getChat"
             params = {"chat_id": user_id}
-            resp = requests.get(url, params=params, timeout=10)
+            resp = http_get(url, params=params, timeout=10)
             
             if resp.status_code != 200:
                 response_data = resp.json()
@@ -168,31 +173,88 @@ def list_all_users():
     return msg
 
 def remove_user(user_id):
-    """从文件中安全移除用户"""
-    with file_lock:
-        if not os.path.exists(USER_FILE):
-            return False
+    """从用户库中移除用户"""
+    try:
+        removed = get_user_store().remove_user(user_id)
+    except Exception as e:
+        logging.error(f"移除用户{user_id}时用户库操作异常: {e}")
+        return False
+    if removed:
+        invalidate_subscription_index()
+    return removed
+
+def _wait_send_slot(chat_id):
+    """阻塞到该聊天与全局限流都允许再发送一条消息"""
+    if TG_CHAT_RATE_LIMIT > 0:
+        with _chat_send_buckets_lock:
+            bucket = _chat_send_buckets.get(str(chat_id))
+            if bucket is None:
+                bucket = _chat_send_buckets[str(chat_id)] = TokenBucket(TG_CHAT_RATE_LIMIT, capacity=1)
+        bucket.acquire()
+    pause = _send_paused_until - time.monotonic()
+    if pause > 0:
+        time.sleep(pause)
+    if _global_send_bucket is not None:
+        _global_send_bucket.acquire()
+
+def _pause_sending(seconds):
+    global _send_paused_until
+    with _send_pause_lock:
+        _send_paused_until = max(_send_paused_until, time.monotonic() + seconds)
+
+def _retry_after(resp):
+    try:
+        return float(resp.json().get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+def _record_send(started, result):
+    """记录一次sendMessage的结果：ok 已送达 / rejected 被Telegram拒绝（如403） / failed 重试耗尽"""
+    TELEGRAM_SENDS.inc(result=result)
+    TELEGRAM_SEND_DURATION.observe(time.perf_counter() - started, result=result)
+
+def post_telegram_message(chat_id, data):
+    """
+    限流发送 sendMessage：发送前按全局 / 单聊天速率排队；429按 parameters.retry_after 暂停全部发送后重试，
+    不计入重试次数；网络异常与5xx按指数退避重试。返回最后一次响应（含403等不可重试的错误），重试耗尽时返回None
+    """
+    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        with span('telegram_wait_slot'):
+            _wait_send_slot(chat_id)
         try:
-            with open(USER_FILE, "r") as f:
-                users = [line.strip() for line in f if line.strip()]
-            if user_id not in users:
-                return False
-            users.remove(user_id)
-            with open(USER_FILE, "w") as f:
-                for u in users:
-                    f.write(u + "\n")
-            os.chmod(USER_FILE, 0o600)
-            return True
+            with span('telegram_send', attempt=attempt):
+                resp = http_post(url, data=data, timeout=10)
         except Exception as e:
-            logging.error(f"移除用户{user_id}时文件操作异常: {e}")
-            return False
+            delay = TG_RETRY_BACKOFF * 2 ** attempt
+            logging.warning(f"发送消息给{chat_id}异常: {e}，{delay:.1f}秒后重试")
+        else:
+            if resp.status_code == 429:
+                # Telegram要求等待的限流不算失败，等够retry_after后重发，避免连续限流时丢消息
+                retry_after = _retry_after(resp)
+                logging.warning(f"发送消息给{chat_id}触发Telegram限流，{retry_after:.0f}秒后重试")
+                _pause_sending(retry_after)
+                continue
+            if resp.status_code < 500:
+                _record_send(started, 'ok' if resp.status_code == 200 else 'rejected')
+                return resp
+            delay = TG_RETRY_BACKOFF * 2 ** attempt
+            logging.warning(f"发送消息给{chat_id}失败(HTTP {resp.status_code})，{delay:.1f}秒后重试")
+        if attempt >= TG_SEND_MAX_RETRIES:
+            break
+        time.sleep(delay)
+        attempt += 1
+    logging.error(f"发送消息给{chat_id}失败，已重试{TG_SEND_MAX_RETRIES}次")
+    _record_send(started, 'failed')
+    return None
 
 def send_message(chat_id, text):
     """统一发送消息接口，含异常处理"""
     if not TG_BOT_TOKEN or not chat_id:
         logging.error("TG_BOT_TOKEN 或 chat_id 未设置")
         return False
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
     
     # 检查是否是用户列表消息，如果是则使用纯文本模式
     if text.startswith("📋 订阅用户列表"):
@@ -208,7 +270,10 @@ def send_message(chat_id, text):
         }
     
     try:
-        resp = requests.post(url, data=data, timeout=10)
+        resp = post_telegram_message(chat_id, data)
+        if resp is None:
+            # 网络或服务端错误且重试已耗尽：返回None（而不是False），发件箱据此稍后重发
+            return None
         if resp.status_code != 200:
             response_data = resp.json()
             error_code = response_data.get("error_code", 0)
@@ -239,7 +304,6 @@ def send_plain_message(chat_id, text):
     if not TG_BOT_TOKEN or not chat_id:
         logging.error("TG_BOT_TOKEN 或 chat_id 未设置")
         return False
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
     
     data = {
         "chat_id": chat_id,
@@ -248,7 +312,9 @@ def send_plain_message(chat_id, text):
     }
     
     try:
-        resp = requests.post(url, data=data, timeout=10)
+        resp = post_telegram_message(chat_id, data)
+        if resp is None:
+            return False
         if resp.status_code != 200:
             response_data = resp.json()
             error_code = response_data.get("error_code", 0)
@@ -282,6 +348,29 @@ def send_long_telegram_message(text):
     for i in range(0, len(text), MAX_MSG_LEN):
         send_to_allowed_users(text[i:i+MAX_MSG_LEN])
 
+def _build_subscription_index():
+    settings = load_user_settings()
+    index = {}
+    for user_id in load_allowed_users():
+        user_settings = settings.get(user_id, DEFAULT_USER_SETTINGS)
+        for timeframe in user_settings.get("enabled_timeframes", []):
+            for signal_type in user_settings.get("enabled_signals", []):
+                index.setdefault((timeframe, signal_type), set()).add(user_id)
+    return index
+
+def invalidate_subscription_index():
+    global _subscription_index
+    with _subscription_index_lock:
+        _subscription_index = None
+
+def get_signal_subscribers(timeframe, signal_type):
+    """返回订阅了该周期、该信号类型的用户集合（与should_send_signal的判断一致）"""
+    global _subscription_index
+    with _subscription_index_lock:
+        if _subscription_index is None:
+            _subscription_index = _build_subscription_index()
+        return set(_subscription_index.get((timeframe, signal_type), ()))
+
 def should_send_signal(user_id, signal):
     settings = get_user_settings(user_id)
     # 时间周期过滤
@@ -292,40 +381,82 @@ def should_send_signal(user_id, signal):
         return False
     return True
     
-def send_to_allowed_users(msg):
-    """并发发送消息给所有授权用户"""
-    users = list(load_allowed_users())
-    if not users:
-        return
-    
-    start_time = time.time()
-    success_count = 0
-    failed_count = 0
-    
-    # 根据用户数量动态调整线程池大小
-    max_workers = min(50, max(1, len(users)))
-    
-    # 使用线程池并发发送消息
-    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="msg_send") as executor:
-        # 提交所有发送任务
-        future_to_user = {
-            executor.submit(send_message, user_id, msg): user_id
-            for user_id in users
-        }
-        
-        # 收集结果
-        for future in as_completed(future_to_user):
-            user_id = future_to_user[future]
+class TelegramSender:
+    """
+    进程内共用的Telegram发送线程池：线程数固定、长期存活，submit立即返回Future。
+    群发、定向发送与发件箱都通过它发送，不再每次调用都新建线程池
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tg_send")
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def send(self, chat_id, text):
+        """异步发送一条消息，返回Future（结果同send_message）"""
+        return self.submit(send_message, chat_id, text)
+
+    def send_many(self, items, send=None):
+        """并发发送 [(chat_id, text), ...] 并等待全部完成，返回 (成功数, 失败数)"""
+        send = send or send_message
+        futures = {self.submit(send, chat_id, text): chat_id for chat_id, text in items}
+        success_count = 0
+        failed_count = 0
+        for future in as_completed(futures):
             try:
-                result = future.result(timeout=15)  # 15秒超时
-                if result:
+                if future.result():
                     success_count += 1
                 else:
                     failed_count += 1
             except Exception as e:
                 failed_count += 1
-                logging.error(f"发送消息给用户 {user_id} 异常: {e}")
+                logging.error(f"发送消息给用户 {futures[future]} 异常: {e}")
+        return success_count, failed_count
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+_telegram_sender = None
+_telegram_sender_lock = threading.Lock()
+
+def get_telegram_sender():
+    """惰性创建进程内共用的发送线程池（TG_SEND_WORKERS个线程）"""
+    global _telegram_sender
+    with _telegram_sender_lock:
+        if _telegram_sender is None:
+            _telegram_sender = TelegramSender(TG_SEND_WORKERS)
+        return _telegram_sender
+
+def enqueue_messages(items):
+    """把 [(chat_id, text), ...] 写入持久化发件箱，由后台发送线程送达"""
+    try:
+        count = get_outbox().enqueue(items)
+        logging.debug(f"已写入发件箱 {count} 条消息")
+        return True
+    except Exception as e:
+        logging.error(f"写入发件箱失败，改为直接发送: {e}")
+        return False
+
+def start_outbox_sender():
+    """启动发件箱后台发送线程（启动时先补发上次未确认的消息）"""
+    thread = threading.Thread(
+        target=get_outbox().run, args=(send_message, get_telegram_sender()), name="outbox_sender", daemon=True
+    )
+    thread.start()
+    return thread
+
+def send_to_allowed_users(msg):
+    """并发发送消息给所有授权用户"""
+    users = list(load_allowed_users())
+    if not users:
+        return
+    if OUTBOX_ENABLED and enqueue_messages((user_id, msg) for user_id in users):
+        return
     
+    start_time = time.time()
+    success_count, failed_count = get_telegram_sender().send_many((user_id, msg) for user_id in users)
     elapsed_time = time.time() - start_time
     logging.info(f"批量发送完成: 成功 {success_count}/{len(users)}, 失败 {failed_count}, 耗时: {elapsed_time:.2f}秒")
 
@@ -337,33 +468,9 @@ def send_pinned_message_to_all(msg):
         return
     
     start_time = time.time()
-    success_count = 0
-    failed_count = 0
-    
-    # 根据用户数量动态调整线程池大小
-    max_workers = min(50, max(1, len(users)))
-    
-    # 使用线程池并发发送置顶消息
-    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pin_send") as executor:
-        # 提交所有发送任务
-        future_to_user = {
-            executor.submit(send_pinned_message_async, user_id, msg): user_id 
-            for user_id in users
-        }
-        
-        # 收集结果
-        for future in as_completed(future_to_user):
-            user_id = future_to_user[future]
-            try:
-                result = future.result(timeout=20)  # 20秒超时（置顶需要更多时间）
-                if result:
-                    success_count += 1
-                else:
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
-                logging.error(f"发送置顶消息给用户 {user_id} 异常: {e}")
-    
+    success_count, failed_count = get_telegram_sender().send_many(
+        ((user_id, msg) for user_id in users), send=send_pinned_message_async
+    )
     elapsed_time = time.time() - start_time
     logging.info(f"置顶消息发送完成: 成功 {success_count}/{len(users)}, 失败 {failed_count}, 耗时: {elapsed_time:.2f}秒")
 
@@ -384,56 +491,85 @@ def send_pinned_message_async(chat_id, text):
         logging.error(f"发送置顶消息给 {chat_id} 异常: {e}")
         return False
 
-def handle_signals(sig, rsi6_signals):
-    """处理信号发送，对符合条件的用户发送信号"""
+def handle_signals(sig, rsi6_signals, digest=None):
+    """处理信号发送，对符合条件的用户发送信号；传入digest时只记入汇总，扫描结束后统一发送"""
     # RSI6信号只收集用于汇总，不单独发送
     if sig["type"] == "rsi6_extreme":
         rsi6_signals.append(sig)
         return
     
-    # 为其他信号类型收集需要发送的用户
-    users = list(load_allowed_users())
-    target_users = []
-    
-    for user_id in users:
-        if should_send_signal(user_id, sig):
-            target_users.append(user_id)
+    # 为其他信号类型收集需要发送的用户（查内存索引，不再逐个用户读文件）
+    target_users = list(get_signal_subscribers(sig.get("timeframe"), sig["type"]))
     
     # 如果有目标用户，使用并发发送
     if target_users:
         msg = format_signal(sig)
-        send_to_target_users_concurrent(target_users, msg)
+        if digest is not None:
+            digest.add(target_users, msg)
+        else:
+            send_to_target_users_concurrent(target_users, msg)
+
+def split_records(records, limit=MAX_MSG_LEN, separator="\n"):
+    """把多条记录拼接成若干条不超过limit的消息，只在记录之间断开（单条记录超长时才按长度截断）"""
+    chunks = []
+    current = ""
+    for record in records:
+        for start in range(0, max(len(record), 1), limit):
+            piece = record[start:start + limit]
+            if current and len(current) + len(separator) + len(piece) > limit:
+                chunks.append(current)
+                current = ""
+            current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+class SignalDigest:
+    """一轮扫描内按用户缓存信号消息，扫描结束后每个用户只收到一条（超长时按记录拆分的几条）合并消息"""
+
+    def __init__(self):
+        self._messages = {}
+        self._lock = threading.Lock()
+
+    def add(self, target_users, msg):
+        with self._lock:
+            for user_id in target_users:
+                self._messages.setdefault(user_id, []).append(msg)
+
+    def flush(self):
+        """发送并清空缓存，返回发送的消息条数"""
+        with self._lock:
+            messages, self._messages = self._messages, {}
+        if not messages:
+            return 0
+
+        outbox = []
+        for user_id, records in messages.items():
+            header = f"本轮扫描信号汇总（共{len(records)}条）\n"
+            for chunk in split_records([header] + records):
+                outbox.append((user_id, chunk))
+        signal_count = sum(len(records) for records in messages.values())
+        if OUTBOX_ENABLED and enqueue_messages(outbox):
+            logging.info(f"信号汇总: {len(messages)} 个用户, {signal_count} 条信号合并为 {len(outbox)} 条消息，已写入发件箱")
+            return len(outbox)
+
+        start_time = time.time()
+        success_count, _ = get_telegram_sender().send_many(outbox)
+        logging.info(
+            f"信号汇总发送完成: {len(messages)} 个用户, {signal_count} 条信号合并为 {len(outbox)} 条消息, "
+            f"成功 {success_count}, 耗时: {time.time() - start_time:.2f}秒"
+        )
+        return len(outbox)
 
 def send_to_target_users_concurrent(target_users, msg):
     """并发发送消息给指定的用户列表"""
     if not target_users:
         return
+    if OUTBOX_ENABLED and enqueue_messages((user_id, msg) for user_id in target_users):
+        return
     
     start_time = time.time()
-    success_count = 0
-    failed_count = 0
-    
-    # 根据用户数量动态调整线程池大小
-    max_workers = min(8, max(1, len(target_users)))
-    
-    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="signal_send") as executor:
-        future_to_user = {
-            executor.submit(send_message, user_id, msg): user_id
-            for user_id in target_users
-        }
-        
-        for future in as_completed(future_to_user):
-            user_id = future_to_user[future]
-            try:
-                result = future.result(timeout=10)
-                if result:
-                    success_count += 1
-                else:
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
-                logging.error(f"发送信号给用户 {user_id} 异常: {e}")
-    
+    success_count, failed_count = get_telegram_sender().send_many((user_id, msg) for user_id in target_users)
     elapsed_time = time.time() - start_time
     logging.debug(f"信号发送完成: 成功 {success_count}/{len(target_users)}, 失败 {failed_count}, 耗时: {elapsed_time:.2f}秒")
 
@@ -567,173 +703,229 @@ def rsi6_summary(signals):
     
     send_long_telegram_message(f"RSI6极值信号汇总：\n```\n{table}```")
 
+def handle_update(update):
+    """处理一条getUpdates更新：订阅密码、退订、设置与管理员命令"""
+    # 订阅密码错误计数与锁定时间保存在用户库中，进程重启后锁定仍然有效
+    store = get_user_store()
+    message = update.get("message")
+    if not message:
+        return
+    user = message["from"]
+    user_id = str(user["id"])
+    username = user.get("username", "")
+    text = message.get("text", "").strip()
+    logging.info(f"收到用户{user_id}消息: {text}")
+
+    # 管理员命令处理
+    if user_id == str(TG_CHAT_ID):
+        if text.startswith("/adduser "):
+            target_id = text.split(" ", 1)[1].strip()
+            if target_id and not store.has_user(target_id):
+                safe_write_user(target_id)
+                send_message(user_id, f"已手动添加用户 {target_id}")
+            else:
+                send_message(user_id, f"用户 {target_id} 已存在或无效")
+            return
+        elif text.startswith("/removeuser "):
+            target_id = text.split(" ", 1)[1].strip()
+            if target_id and store.has_user(target_id):
+                if remove_user(target_id):
+                    send_message(user_id, f"已手动移除用户 {target_id}")
+                else:
+                    send_message(user_id, f"移除用户 {target_id} 失败")
+            else:
+                send_message(user_id, f"用户 {target_id} 不存在")
+            return
+        elif text == "/listusers":
+            user_list_msg = list_all_users()
+            send_message(user_id, user_list_msg)
+            return
+        elif text == "/cleanblocked":
+            removed_count, total_blocked = check_and_clean_blocked_users()
+            send_message(user_id, f"🧹 清理完成！\n发现被屏蔽用户: {total_blocked} 人\n成功移除: {removed_count} 人")
+            return
+        elif text.startswith("/pin "):
+            # 发送置顶消息给所有用户
+            pin_message = text.split(" ", 1)[1].strip()
+            if pin_message:
+                send_pinned_message_to_all(pin_message)
+                send_message(user_id, f"消息已发送给所有用户")
+            else:
+                send_message(user_id, "请提供要置顶的消息内容")
+            return
+
+
+    # 已授权用户不需重复订阅
+    if store.has_user(user_id):
+        # 支持退订命令
+        if text.startswith("/unsubscribe"):
+            if remove_user(user_id):
+                send_message(user_id, "您已成功退订推送。")
+                logging.info(f"用户{user_id}退订成功")
+            else:
+                send_message(user_id, "退订失败，您可能未订阅。")
+                logging.warning(f"用户{user_id}退订失败，未在订阅列表")
+            return
+        elif text.startswith("/settings"):
+            settings = get_user_settings(user_id)
+
+            # 显示可选信号类型
+            optional_signals = settings.get('enabled_signals', [])
+            optional_signal_names = []
+            for signal in optional_signals:
+                if signal == "turtle_buy":
+                    optional_signal_names.append("🐢买")
+                elif signal == "turtle_sell":
+                    optional_signal_names.append("🐢卖")
+                elif signal == "can_biao_xiu":
+                    optional_signal_names.append("📊参标修")
+                elif signal == "five_down":
+                    optional_signal_names.append("📉五连阴")
+                # 跳过rsi6_extreme，因为它是必选的
+
+            msg = (
+                f"当前设置：\n"
+                f"启用时间周期: {', '.join(settings.get('enabled_timeframes', []))}\n"
+                f"必选信号类型: RSI6 (自动启用)\n"
+                f"可选信号类型: {', '.join(optional_signal_names) if optional_signal_names else '无'}\n\n"
+                "PS: RSI6对所有用户必选，参标修仅启用日线可用，五连阴仅识别BTC交易对\n\n"
+                "修改设置示例:\n"
+                + escape_markdown("/set_timeframes 1h,4h,1d") + "\n"
+                + escape_markdown("/set_signals turtle_buy,turtle_sell,five_down") + "\n"
+                "注意: RSI6信号无需手动设置，系统自动为所有用户启用\n"
+            )
+            send_message(user_id, msg)
+        elif text.startswith("/set_timeframes"):
+            try:
+                timeframes = text.split(' ',1)[1]
+                update_user_settings(user_id, "timeframes", timeframes)
+                send_message(user_id, f"启用的时间周期已更新为：{timeframes}")
+            except:
+                send_message(user_id, escape_markdown("用法：/set_timeframes 1h,4h,1d"))
+        elif text.startswith("/set_signals"):
+            try:
+                signals = text.split(' ',1)[1]
+                update_user_settings(user_id, "signals", signals)
+                send_message(user_id, "启用信号类型已更新")
+            except:
+                send_message(user_id, escape_markdown("用法: /set_signals turtle_buy,turtle_sell,can_biao_xiu,five_down"))
+        # 其他消息可忽略或自定义
+        return
+
+    # 非授权用户处理订阅密码逻辑
+    # 锁定判断
+    lockout = store.get_lockout(user_id)  # (错误次数, 首次错误时间或锁定时间)
+    if lockout and lockout[0] >= 3:
+        # 判断是否锁定中
+        if time.time() - lockout[1] < 3600:
+            # 仍锁定中，忽略消息
+            return
+        else:
+            # 解锁，重置计数
+            lockout = (0, time.time())
+            store.set_lockout(user_id, *lockout)
+
+    if lockout is None:
+        # 第一次提示输入密码
+        send_message(user_id, "请输入订阅密码：")
+        store.set_lockout(user_id, 0, time.time())
+        return
+
+    # 已提示过密码，判断输入
+    if text == SUBSCRIBE_PASSWORD:
+        if not store.has_user(user_id):
+            safe_write_user(user_id)
+            send_telegram_message(f"添加新用户：{username} (ID: {user_id})")
+            send_message(user_id, "欢迎关注本机器人，您已成功订阅推送！\n使用/settings查看当前设置")
+        store.clear_lockout(user_id)
+    elif text.lower() == "/unsubscribe":
+        # 未订阅用户退订提示
+        send_message(user_id, "您尚未订阅，无需退订。")
+    else:
+        # 密码错误，增加错误次数
+        failures = lockout[0] + 1
+        if failures >= 3:
+            # 锁定一小时
+            send_message(user_id, "错误次数过多，请1小时后再试。")
+            store.set_lockout(user_id, failures, time.time())
+        else:
+            store.set_lockout(user_id, failures, lockout[1])
+            send_message(user_id, "密码错误，请重新输入订阅密码：")
+
+_command_lanes = None
+_command_lanes_lock = threading.Lock()
+
+def _get_command_lanes():
+    global _command_lanes
+    with _command_lanes_lock:
+        if _command_lanes is None:
+            _command_lanes = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"tg_command_{i}")
+                for i in range(max(1, TG_COMMAND_WORKERS))
+            ]
+        return _command_lanes
+
+def _handle_update_safely(update):
+    try:
+        handle_update(update)
+    except Exception as e:
+        logging.error(f"处理用户消息异常: {e}", exc_info=True)
+
+def dispatch_update(update):
+    """
+    把更新交给命令线程处理，不阻塞轮询；同一用户的消息总是进入同一条单线程通道，
+    保证按到达顺序处理（如先输入密码再查看设置）
+    """
+    sender = (update.get("message") or {}).get("from") or {}
+    lanes = _get_command_lanes()
+    return lanes[hash(str(sender.get("id"))) % len(lanes)].submit(_handle_update_safely, update)
+
+def _call_bot_api(method, data):
+    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/{method}"
+    try:
+        resp = http_post(url, data=data, timeout=10)
+        result = resp.json()
+        if not result.get("ok"):
+            logging.error(f"{method} 调用失败: {resp.text}")
+        return bool(result.get("ok"))
+    except Exception as e:
+        logging.error(f"{method} 调用异常: {e}")
+        return False
+
+def start_webhook_listener():
+    """webhook模式：启动本地HTTP服务并向Telegram注册推送地址，更新与轮询模式一样交给dispatch_update处理"""
+    server = start_webhook_server(dispatch_update, TG_WEBHOOK_HOST, TG_WEBHOOK_PORT, TG_WEBHOOK_PATH, TG_WEBHOOK_SECRET)
+    _call_bot_api("setWebhook", {
+        "url": TG_WEBHOOK_URL,
+        "secret_token": TG_WEBHOOK_SECRET,
+        "allowed_updates": '["message"]',
+    })
+    return server
+
 def monitor_new_users():
-    """轮询监听新用户消息，处理订阅、退订、管理员命令"""
+    """长轮询监听用户消息：服务端最多挂起TG_POLL_TIMEOUT秒，有更新立即返回并马上发起下一次轮询"""
     url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/getUpdates"
     last_update_id = None
-    known_users = load_allowed_users()
-    pending_users = {}  # user_id -> [错误次数, 首次错误时间或锁定时间]
+    # 之前以webhook模式运行过时需先删除webhook，否则getUpdates会返回409
+    _call_bot_api("deleteWebhook", {"drop_pending_updates": "false"})
 
     while True:
         try:
-            params = {"timeout": 10}
-            if last_update_id:
+            params = {"timeout": TG_POLL_TIMEOUT, "allowed_updates": '["message"]'}
+            if last_update_id is not None:
                 params["offset"] = last_update_id + 1
-            resp = requests.get(url, params=params, timeout=15)
+            resp = http_get(url, params=params, timeout=TG_POLL_TIMEOUT + 10)
             data = resp.json()
+            if not data.get("ok"):
+                logging.error(f"获取用户消息失败: {data.get('description', resp.text)}")
+                time.sleep(TG_POLL_ERROR_DELAY)
+                continue
             for update in data.get("result", []):
                 last_update_id = update["update_id"]
-                message = update.get("message")
-                if not message:
-                    continue
-                user = message["from"]
-                user_id = str(user["id"])
-                username = user.get("username", "")
-                text = message.get("text", "").strip()
-                logging.info(f"收到用户{user_id}消息: {text}")
-
-                # 管理员命令处理
-                if user_id == str(TG_CHAT_ID):
-                    if text.startswith("/adduser "):
-                        target_id = text.split(" ", 1)[1].strip()
-                        if target_id and target_id not in known_users:
-                            safe_write_user(target_id)
-                            known_users.add(target_id)
-                            send_message(user_id, f"已手动添加用户 {target_id}")
-                        else:
-                            send_message(user_id, f"用户 {target_id} 已存在或无效")
-                        continue
-                    elif text.startswith("/removeuser "):
-                        target_id = text.split(" ", 1)[1].strip()
-                        if target_id and target_id in known_users:
-                            if remove_user(target_id):
-                                known_users.remove(target_id)
-                                send_message(user_id, f"已手动移除用户 {target_id}")
-                            else:
-                                send_message(user_id, f"移除用户 {target_id} 失败")
-                        else:
-                            send_message(user_id, f"用户 {target_id} 不存在")
-                        continue
-                    elif text == "/listusers":
-                        user_list_msg = list_all_users()
-                        send_message(user_id, user_list_msg)
-                        continue
-                    elif text == "/cleanblocked":
-                        removed_count, total_blocked = check_and_clean_blocked_users()
-                        # 重新加载用户列表以同步
-                        known_users = load_allowed_users()
-                        send_message(user_id, f"🧹 清理完成！\n发现被屏蔽用户: {total_blocked} 人\n成功移除: {removed_count} 人")
-                        continue
-                    elif text.startswith("/pin "):
-                        # 发送置顶消息给所有用户
-                        pin_message = text.split(" ", 1)[1].strip()
-                        if pin_message:
-                            send_pinned_message_to_all(pin_message)
-                            send_message(user_id, f"消息已发送给所有用户")
-                        else:
-                            send_message(user_id, "请提供要置顶的消息内容")
-                        continue
-
-
-                # 已授权用户不需重复订阅
-                if user_id in known_users:
-                    # 支持退订命令
-                    if text.startswith("/unsubscribe"):
-                        if remove_user(user_id):
-                            known_users.remove(user_id)
-                            send_message(user_id, "您已成功退订推送。")
-                            logging.info(f"用户{user_id}退订成功")
-                        else:
-                            send_message(user_id, "退订失败，您可能未订阅。")
-                            logging.warning(f"用户{user_id}退订失败，未在订阅列表")
-                        continue
-                    elif text.startswith("/settings"):
-                        settings = get_user_settings(user_id)
-                        
-                        # 显示可选信号类型
-                        optional_signals = settings.get('enabled_signals', [])
-                        optional_signal_names = []
-                        for signal in optional_signals:
-                            if signal == "turtle_buy":
-                                optional_signal_names.append("🐢买")
-                            elif signal == "turtle_sell":
-                                optional_signal_names.append("🐢卖")
-                            elif signal == "can_biao_xiu":
-                                optional_signal_names.append("📊参标修")
-                            elif signal == "five_down":
-                                optional_signal_names.append("📉五连阴")
-                            # 跳过rsi6_extreme，因为它是必选的
-                        
-                        msg = (
-                            f"当前设置：\n"
-                            f"启用时间周期: {', '.join(settings.get('enabled_timeframes', []))}\n"
-                            f"必选信号类型: RSI6 (自动启用)\n"
-                            f"可选信号类型: {', '.join(optional_signal_names) if optional_signal_names else '无'}\n\n"
-                            "PS: RSI6对所有用户必选，参标修仅启用日线可用，五连阴仅识别BTC交易对\n\n"
-                            "修改设置示例:\n"
-                            + escape_markdown("/set_timeframes 1h,4h,1d") + "\n"
-                            + escape_markdown("/set_signals turtle_buy,turtle_sell,five_down") + "\n"
-                            "注意: RSI6信号无需手动设置，系统自动为所有用户启用\n"
-                        )
-                        send_message(user_id, msg)
-                    elif text.startswith("/set_timeframes"):
-                        try:
-                            timeframes = text.split(' ',1)[1]
-                            update_user_settings(user_id, "timeframes", timeframes)
-                            send_message(user_id, f"启用的时间周期已更新为：{timeframes}")
-                        except:
-                            send_message(user_id, escape_markdown("用法：/set_timeframes 1h,4h,1d"))
-                    elif text.startswith("/set_signals"):
-                        try:
-                            signals = text.split(' ',1)[1]
-                            update_user_settings(user_id, "signals", signals)
-                            send_message(user_id, "启用信号类型已更新")
-                        except:
-                            send_message(user_id, escape_markdown("用法: /set_signals turtle_buy,turtle_sell,can_biao_xiu,five_down"))
-                    # 其他消息可忽略或自定义
-                    continue
-
-                # 非授权用户处理订阅密码逻辑
-                # 锁定判断
-                if user_id in pending_users and pending_users[user_id][0] >= 3:
-                    # 判断是否锁定中
-                    if time.time() - pending_users[user_id][1] < 3600:
-                        # 仍锁定中，忽略消息
-                        continue
-                    else:
-                        # 解锁，重置计数
-                        pending_users[user_id] = [0, time.time()]
-
-                if user_id not in pending_users:
-                    # 第一次提示输入密码
-                    send_message(user_id, "请输入订阅密码：")
-                    pending_users[user_id] = [0, time.time()]
-                    continue
-
-                # 已提示过密码，判断输入
-                if text == SUBSCRIBE_PASSWORD:
-                    if user_id not in known_users:
-                        safe_write_user(user_id)
-                        known_users.add(user_id)
-                        send_telegram_message(f"添加新用户：{username} (ID: {user_id})")
-                        send_message(user_id, "欢迎关注本机器人，您已成功订阅推送！\n使用/settings查看当前设置")
-                    pending_users.pop(user_id, None)
-                elif text.lower() == "/unsubscribe":
-                    # 未订阅用户退订提示
-                    send_message(user_id, "您尚未订阅，无需退订。")
-                else:
-                    # 密码错误，增加错误次数
-                    pending_users[user_id][0] += 1
-                    if pending_users[user_id][0] >= 3:
-                        # 锁定一小时
-                        send_message(user_id, "错误次数过多，请1小时后再试。")
-                        pending_users[user_id][1] = time.time()
-                    else:
-                        send_message(user_id, "密码错误，请重新输入订阅密码：")
-
+                dispatch_update(update)
         except Exception as e:
             logging.error(f"监听新用户异常: {e}", exc_info=True)
-        time.sleep(10)  # 轮询间隔
+            time.sleep(TG_POLL_ERROR_DELAY)
 
 def escape_markdown(text):
     escape_chars = r'_*\[\]()~`>#+-=|{}.!'
@@ -754,7 +946,7 @@ def set_bot_commands():
     url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/setMyCommands"
     data = {"commands": str(commands).replace("'", '"')}
     try:
-        resp = requests.post(url, data=data)
+        resp = http_post(url, data=data, timeout=10)
         logging.info(f"设置机器人命令返回: {resp.text}")
     except Exception as e:
         logging.error(f"设置机器人命令异常: {e}")
\ No newline at end of file
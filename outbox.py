@@ -0,0 +1,171 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import OUTBOX_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_due ON messages (next_attempt_at, id);
+"""
+
+
+class Outbox:
+    """
+    待发送消息的持久化队列（SQLite，WAL模式）：消息先落库再由后台线程发送，
+    发送成功（或确认无法送达）后才删除，进程重启后未确认的消息会继续发送（至少一次）
+    """
+
+    def __init__(self, path, retry_base=1.0, retry_max=300.0):
+        self.path = path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._conn = None
+        self._wakeup = threading.Event()
+
+    def _connect(self):
+        if self._conn is None:
+            parent_dir = os.path.dirname(self.path)
+            if parent_dir:
+                os.makedirs(parent_dir, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            os.chmod(self.path, 0o600)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    def enqueue(self, items):
+        """在一个事务内写入 [(chat_id, text), ...]，返回写入条数"""
+        now = time.time()
+        rows = [(str(chat_id), text, now, now) for chat_id, text in items]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(
+                    'INSERT INTO messages (chat_id, text, created_at, next_attempt_at) VALUES (?, ?, ?, ?)',
+                    rows,
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        self._wakeup.set()
+        return len(rows)
+
+    def due(self, limit=100, now=None):
+        """到期待发送的消息 [(id, chat_id, text, attempts), ...]，按入队顺序"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._connect().execute(
+                'SELECT id, chat_id, text, attempts FROM messages WHERE next_attempt_at <= ? ORDER BY id LIMIT ?',
+                (now, limit),
+            ).fetchall()
+
+    def ack(self, message_id):
+        with self._lock:
+            self._connect().execute('DELETE FROM messages WHERE id = ?', (message_id,))
+
+    def retry(self, message_id, attempts, error=None):
+        """发送失败，按指数退避推迟下次发送时间"""
+        delay = min(self.retry_max, self.retry_base * 2 ** attempts)
+        with self._lock:
+            self._connect().execute(
+                'UPDATE messages SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                (attempts + 1, time.time() + delay, error, message_id),
+            )
+        return delay
+
+    def pending_count(self):
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def next_due_in(self, now=None):
+        """距最近一条消息到期的秒数，队列为空时返回None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._connect().execute('SELECT MIN(next_attempt_at) FROM messages').fetchone()
+        return None if row[0] is None else max(0.0, row[0] - now)
+
+    def drain(self, send, executor=None, limit=100):
+        """
+        发送一批到期消息，返回本批处理条数。send(chat_id, text) 返回True表示已送达、
+        False表示确认无法送达（如用户屏蔽机器人），两者都会确认删除；返回None或抛出异常则稍后重试。
+        传入executor（有submit方法）时本批消息并发发送
+        """
+        batch = self.due(limit)
+        if not batch:
+            return 0
+
+        def deliver(row):
+            message_id, chat_id, text, attempts = row
+            try:
+                result = send(chat_id, text)
+                error = None
+            except Exception as e:
+                result, error = None, str(e)
+            if result is None:
+                delay = self.retry(message_id, attempts, error)
+                logging.warning(f"发件箱消息 {message_id} 发送给 {chat_id} 失败（第{attempts + 1}次），{delay:.0f}秒后重试")
+            else:
+                self.ack(message_id)
+
+        if executor is not None:
+            for future in [executor.submit(deliver, row) for row in batch]:
+                future.result()
+        else:
+            for row in batch:
+                deliver(row)
+        return len(batch)
+
+    def run(self, send, executor=None, stop_event=None, idle_interval=5.0):
+        """后台发送循环：有到期消息就发送，否则等到下一条到期或有新消息入队"""
+        stop_event = stop_event or threading.Event()
+        pending = self.pending_count()
+        if pending:
+            logging.info(f"发件箱有 {pending} 条未确认消息，继续发送")
+        while not stop_event.is_set():
+            # 先清除再发送：发送期间入队的消息会重新置位，下面的wait立即返回，不会丢失唤醒
+            self._wakeup.clear()
+            try:
+                if self.drain(send, executor):
+                    continue
+                wait = self.next_due_in()
+            except Exception as e:
+                logging.error(f"发件箱发送异常: {e}", exc_info=True)
+                wait = idle_interval
+            self._wakeup.wait(idle_interval if wait is None else min(wait, idle_interval))
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """进程内共享的发件箱（OUTBOX_FILE）"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(OUTBOX_FILE)
+        return _outbox
@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+
+_STOP = object()
+
+
+class Stage:
+    """
+    一组工作线程：从inbox取任务交给handler处理，handler返回的结果逐个放入outbox。
+    队列都是有界的，下游处理不过来时put会阻塞，上游随之放慢（背压）。
+    """
+
+    def __init__(self, name, handler, workers, inbox, outbox=None):
+        self.name = name
+        self.handler = handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _STOP:
+                return
+            try:
+                results = self.handler(item)
+                if self.outbox is not None:
+                    for result in results or ():
+                        self.outbox.put(result)
+            except Exception as e:
+                logging.error(f"流水线阶段 {self.name} 处理异常: {e}", exc_info=True)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        """等待inbox中已有任务全部处理完再退出"""
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+
+class ScanPipeline:
+    """
+    扫描流水线：抓取 → 指标/信号计算 → 推送，三个阶段线程数各自独立，
+    阶段之间用有界队列连接，队列中最多同时存在queue_size根K线数据 / 信号。
+    """
+
+    def __init__(self, compute, notify, compute_workers, notify_workers, queue_size):
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.signals = queue.Queue(maxsize=queue_size)
+        self._compute = Stage('compute', compute, compute_workers, self.frames, self.signals)
+        self._notify = Stage('notify', notify, notify_workers, self.signals)
+        self._compute.start()
+        self._notify.start()
+
+    def submit_frame(self, item):
+        """提交一份抓取结果 (symbol, timeframe, df)，计算队列已满时阻塞"""
+        self.frames.put(item)
+
+    def submit_signal(self, sig):
+        self.signals.put(sig)
+
+    def fetch(self, pairs, fetch, workers):
+        """用workers个线程抓取pairs，结果直接进入计算队列"""
+        inbox = queue.Queue(maxsize=self.frames.maxsize)
+        stage = Stage('fetch', lambda pair: [fetch(*pair)], workers, inbox, self.frames)
+        stage.start()
+        for pair in pairs:
+            inbox.put(pair)
+        stage.join()
+
+    def finish_compute(self):
+        """等待已提交的K线全部计算完成（之后仍可通过submit_signal追加信号）"""
+        self._compute.join()
+
+    def finish(self):
+        """等待计算与推送全部完成"""
+        if any(thread.is_alive() for thread in self._compute._threads):
+            self._compute.join()
+        self._notify.join()
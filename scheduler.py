@@ -0,0 +1,74 @@
+import logging
+import time
+
+TIMEFRAME_SECONDS = {
+    '1h': 60 * 60,
+    '4h': 4 * 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+
+def latest_close(timeframe, now, offsets=None):
+    """返回 now 时刻之前（含）最近一次K线收盘的UTC时间戳（秒），offsets 为各周期收盘时刻相对UTC零点的偏移"""
+    period = TIMEFRAME_SECONDS[timeframe]
+    offset = (offsets or {}).get(timeframe, 0)
+    return int((now - offset) // period * period + offset)
+
+
+class CandleCloseScheduler:
+    """
+    按K线收盘对齐的多周期调度：每个周期在其K线收盘 grace_seconds 秒后到期一次，
+    只扫描刚收盘的周期，不随扫描耗时漂移。
+    """
+
+    def __init__(self, timeframes, grace_seconds=0, offsets=None):
+        self.timeframes = list(timeframes)
+        self.grace_seconds = grace_seconds
+        self.offsets = offsets or {}
+        self.last_scanned = {}
+
+    def _latest_due_close(self, timeframe, now):
+        return latest_close(timeframe, now - self.grace_seconds, self.offsets)
+
+    def due_timeframes(self, now=None):
+        now = time.time() if now is None else now
+        return [
+            timeframe for timeframe in self.timeframes
+            if self.last_scanned.get(timeframe) != self._latest_due_close(timeframe, now)
+        ]
+
+    def mark_scanned(self, timeframes, now=None):
+        now = time.time() if now is None else now
+        for timeframe in timeframes:
+            self.last_scanned[timeframe] = self._latest_due_close(timeframe, now)
+
+    def next_run(self, now=None):
+        """下一次有周期到期的时间戳（秒）"""
+        now = time.time() if now is None else now
+        return min(
+            self._latest_due_close(timeframe, now) + TIMEFRAME_SECONDS[timeframe] + self.grace_seconds
+            for timeframe in self.timeframes
+        )
+
+
+def run_due_scans(scheduler, scan):
+    """检查到期的周期并只扫描这些周期，由主循环定时调用"""
+    now = time.time()
+    due = scheduler.due_timeframes(now)
+    if not due:
+        return
+    scheduler.mark_scanned(due, now)
+    logging.info(f"K线收盘触发扫描: {', '.join(due)}")
+    scan(due)
+    logging.info(f"下一次扫描时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(scheduler.next_run()))} UTC")
+
+
+def run_stream_scans(stream, scheduler, scan, settle_seconds=0):
+    """stream模式：WebSocket推送发现K线收盘后立即扫描对应周期（由主循环定时调用）"""
+    due = stream.pop_closed_timeframes(settle_seconds)
+    if not due:
+        return
+    # 标记为已扫描，避免定时调度在宽限期到达后重复扫描同一根K线
+    scheduler.mark_scanned(due, time.time() + scheduler.grace_seconds)
+    logging.info(f"K线推送收盘触发扫描: {', '.join(due)}")
+    scan(due)
@@ -0,0 +1,41 @@
+"""
+参标修检测微基准：对比逐行实现与向量化实现在 500 / 5000 根K线上的耗时
+
+用法：python scripts/bench_can_biao_xiu.py [重复次数]
+"""
+import logging
+import os
+import sys
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import strategy_sig  # noqa: E402
+from can_biao_xiu_reference import find_can_biao_xiu_reference, make_trending_frame  # noqa: E402
+
+
+def pick_frame(bars):
+    """选一个参出现在前60%的样本，使逐行实现需要扫描较长的区间"""
+    for seed in range(200):
+        df = make_trending_frame(strategy_sig, bars, seed)
+        can_idx, _, _ = strategy_sig.find_can_biao_xiu(df)
+        if can_idx is None or can_idx < bars * 0.6:
+            return df
+    return df
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logging.disable(logging.ERROR)
+    print(f"{'K线数':>6} {'逐行(ms)':>10} {'向量化(ms)':>11} {'加速比':>8}")
+    for bars in (500, 5000):
+        df = pick_frame(bars)
+        assert strategy_sig.find_can_biao_xiu(df) == find_can_biao_xiu_reference(strategy_sig, df)
+        loop_ms = min(timeit.repeat(lambda: find_can_biao_xiu_reference(strategy_sig, df), number=1, repeat=repeat)) * 1000
+        vec_ms = min(timeit.repeat(lambda: strategy_sig.find_can_biao_xiu(df), number=1, repeat=repeat)) * 1000
+        print(f"{bars:>6} {loop_ms:>10.3f} {vec_ms:>11.3f} {loop_ms / vec_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+参标修检测的逐行参考实现与随机K线生成器：测试用它校验向量化实现的等价性，
+基准脚本 bench_can_biao_xiu.py 用它对比耗时
+"""
+import numpy as np
+import pandas as pd
+
+
+def find_can_biao_xiu_reference(strategy_sig, df):
+    """向量化之前的逐行实现，用作等价性基准"""
+    is_strong_uptrend = strategy_sig.is_strong_uptrend
+    can_idx = biao_idx = xiu_idx = None
+    for i in range(len(df) - 2, 0, -1):
+        if any(np.isnan([df['close'].iloc[i], df['open'].iloc[i], df['high'].iloc[i - 1]])):
+            continue
+        if (
+            df['close'].iloc[i] > df['open'].iloc[i] and
+            df['high'].iloc[i] == df['highest'].iloc[i] and
+            is_strong_uptrend(df, i)
+        ):
+            can_idx = i
+            break
+    if can_idx is None:
+        return None, None, None
+    can_low = df['low'].iloc[can_idx]
+    for j in range(can_idx + 1, len(df) - 1):
+        if any(np.isnan([df['close'].iloc[j], df['open'].iloc[j], df['high'].iloc[j]])):
+            continue
+        if df['close'].iloc[j] > df['open'].iloc[j] and df['high'].iloc[j] < can_low:
+            biao_idx = j
+            break
+    if biao_idx is None:
+        return can_idx, None, None
+    biao_low = df['low'].iloc[biao_idx]
+    for k in range(biao_idx + 1, len(df) - 1):
+        if any(np.isnan([df['close'].iloc[k], df['open'].iloc[k], df['high'].iloc[k]])):
+            continue
+        if df['close'].iloc[k] > df['open'].iloc[k] and df['high'].iloc[k] < biao_low:
+            xiu_idx = k
+            break
+    return can_idx, biao_idx, xiu_idx
+
+
+def make_trending_frame(strategy_sig, bars, seed, nan_rate=0.0):
+    """先上涨再回落的随机K线，足以触发参/标/修的各种组合"""
+    rng = np.random.default_rng(seed)
+    split = int(bars * rng.uniform(0.5, 0.99))
+    drift = np.where(np.arange(bars) < split, rng.uniform(-0.004, 0.005), rng.uniform(-0.006, 0.003))
+    close = 100 * np.exp(np.cumsum(drift + rng.normal(0, 0.01, bars)))
+    open_ = close * (1 + rng.normal(0, 0.006, bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, bars)))
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=bars, freq="D"),
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "volume": np.ones(bars),
+    })
+    if nan_rate:
+        for col in ("open", "high", "close"):
+            df.loc[rng.random(bars) < nan_rate, col] = np.nan
+    return strategy_sig.calculate_indicators(df)
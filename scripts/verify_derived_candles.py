@@ -0,0 +1,74 @@
+"""
+本地聚合K线校验：用Bitget 1h K线在本地聚合出 4h / 1d，与Bitget原生 4H / 1D K线逐根对比
+
+用法：python scripts/verify_derived_candles.py [币种 ...] [--hours 1000] [--tolerance 1e-9]
+例：python scripts/verify_derived_candles.py BTC/USDT:USDT ETH/USDT:USDT
+有不一致的K线时以非0状态码退出
+"""
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import exchange_utils  # noqa: E402
+from candle_store import DERIVED_TIMEFRAME_HOURS, aggregate_candles  # noqa: E402
+from config import CANDLE_CLOSE_OFFSETS  # noqa: E402
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+def compare_candles(derived, native, tolerance=1e-9, volume_tolerance=1e-6):
+    """按时间戳对齐比较两组K线（忽略双方最后一根未收盘K线），返回 (比较根数, 不一致的行)"""
+    derived = derived.iloc[:-1]
+    native = native.iloc[:-1]
+    merged = derived.merge(native, on='timestamp', suffixes=('_derived', '_native'))
+    bad = np.zeros(len(merged), dtype=bool)
+    for column in PRICE_COLUMNS:
+        bad |= ~np.isclose(merged[f'{column}_derived'], merged[f'{column}_native'], rtol=tolerance, atol=0)
+    bad |= ~np.isclose(merged['volume_derived'], merged['volume_native'], rtol=volume_tolerance, atol=0)
+    return len(merged), merged[bad]
+
+
+def verify_symbol(symbol, hours, tolerance):
+    base = exchange_utils._fetch_bitget_candles(symbol, '1h', min(hours, exchange_utils.BITGET_CANDLES_MAX_LIMIT))
+    if base.empty:
+        print(f"{symbol}: 获取1h K线失败，跳过")
+        return True
+
+    ok = True
+    for timeframe, period_hours in DERIVED_TIMEFRAME_HOURS.items():
+        derived = aggregate_candles(base, timeframe, CANDLE_CLOSE_OFFSETS.get(timeframe, 0) * 1000)
+        native = exchange_utils._fetch_bitget_candles(symbol, timeframe, max(2, len(base) // period_hours + 1))
+        if derived.empty or native.empty:
+            print(f"{symbol} {timeframe}: 数据不足，跳过")
+            continue
+        compared, mismatches = compare_candles(derived, native, tolerance)
+        status = "一致" if mismatches.empty else f"{len(mismatches)} 根不一致"
+        print(f"{symbol} {timeframe}: 比较 {compared} 根已收盘K线，{status}")
+        if not mismatches.empty:
+            ok = False
+            with pd.option_context('display.width', 200, 'display.max_columns', None):
+                print(mismatches.head(10).to_string(index=False))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比本地聚合的4h/1d K线与Bitget原生K线")
+    parser.add_argument('symbols', nargs='*', default=exchange_utils.DEFAULT_FALLBACK_SYMBOLS)
+    parser.add_argument('--hours', type=int, default=1000, help="用于聚合的1h K线根数")
+    parser.add_argument('--tolerance', type=float, default=1e-9, help="价格相对误差容忍度")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = [verify_symbol(symbol, args.hours, args.tolerance) for symbol in args.symbols]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import SIGNAL_PROCESS_WORKERS
+from indicator_engine import stack_frames, stacked_shape
+from strategy_sig import evaluate_signal_arrays, select_signal_frames
+
+SIGNAL_COLUMNS = ('open', 'high', 'low', 'close')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_signal_pool():
+    """惰性创建进程池，整个进程生命周期内复用（spawn方式启动，避免fork带上主进程的线程与连接）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=SIGNAL_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            logging.info(f"信号计算进程池已启动，进程数 {SIGNAL_PROCESS_WORKERS}")
+        return _executor
+
+
+def shutdown_signal_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def _evaluate_shared_chunk(shm_name, shape, start, stop, timeframe, symbols, lengths, last_timestamps, extra_signal_symbols):
+    """子进程入口：挂载共享内存，只读取 [start, stop) 行的K线数组并检测信号"""
+    # 子进程与主进程共用同一个资源跟踪器，这里只挂载不释放，由主进程负责unlink
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        arrays = {column: block[i, start:stop] for i, column in enumerate(SIGNAL_COLUMNS)}
+        signals = evaluate_signal_arrays(timeframe, symbols, arrays, lengths, last_timestamps, extra_signal_symbols)
+        del block, arrays
+        return signals
+    finally:
+        shm.close()
+
+
+def evaluate_signals_in_processes(timeframe, frames, extra_signal_symbols=(), executor=None):
+    """
+    进程池版 check_signals_batch：OHLC数组写入共享内存后按行切块分发给子进程，
+    子进程直接在共享内存上计算，不序列化DataFrame。返回信号列表（与check_signal字段一致）
+    """
+    frames = select_signal_frames(frames)
+    if not frames:
+        return []
+    executor = executor or get_signal_pool()
+    shape = stacked_shape(frames, SIGNAL_COLUMNS)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        symbols, arrays, lengths = stack_frames(frames, SIGNAL_COLUMNS, buffer=shm.buf)
+        del arrays
+        last_timestamps = [frames[symbol]['timestamp'].iloc[-1] for symbol in symbols]
+        extra = set(extra_signal_symbols) & set(symbols)
+
+        chunks = np.array_split(np.arange(len(symbols)), min(SIGNAL_PROCESS_WORKERS, len(symbols)))
+        futures = []
+        for rows in chunks:
+            start, stop = int(rows[0]), int(rows[-1]) + 1
+            futures.append(executor.submit(
+                _evaluate_shared_chunk, shm.name, shape, start, stop, timeframe,
+                symbols[start:stop], lengths[start:stop], last_timestamps[start:stop], extra,
+            ))
+        signals = []
+        for future in futures:
+            signals.extend(future.result())
+        return signals
+    finally:
+        shm.close()
+        shm.unlink()
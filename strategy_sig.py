@@ -1,8 +1,11 @@
 import logging
 import numpy as np
 import os
-from config import DC_PERIOD, MA_FAST, MA_MID, MA_SLOW, MA_LONG, TMP_DIR
+import pandas as pd
+from config import DC_PERIOD, DISPLAY_TIMEZONE, INDICATOR_MODE, MA_FAST, MA_MID, MA_SLOW, MA_LONG, TMP_DIR
 from exchange_utils import get_turtle_data
+from indicator_engine import compute_universe_indicators, get_indicator_tail, stack_frames
+from tracing import span
 
 
 def get_can_biao_xiu_state_path(symbol_short):
@@ -26,14 +29,29 @@ def calculate_indicators(df):
     rs = avg_gain / avg_loss
     df['rsi6'] = 100 - (100 / (1 + rs))
     
-    # 时区处理：检查是否已经有时区信息
-    if df['timestamp'].dt.tz is None:
-        df['timestamp'] = df['timestamp'].dt.tz_localize('UTC').dt.tz_convert('Asia/Shanghai')
-    else:
-        df['timestamp'] = df['timestamp'].dt.tz_convert('Asia/Shanghai')
-    
     return df
 
+def to_display_time(timestamp):
+    """把单个时间（毫秒时间戳、无时区UTC时间或带时区时间）转换为显示时区，只在生成信号时调用"""
+    if isinstance(timestamp, (int, np.integer)):
+        return pd.Timestamp(int(timestamp), unit='ms', tz='UTC').tz_convert(DISPLAY_TIMEZONE)
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tz is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.tz_convert(DISPLAY_TIMEZONE)
+
+def calculate_signal_indicators(symbol, timeframe, df):
+    """
+    check_signal 用的指标计算：增量模式下只返回带指标的最后两行（状态跨扫描保留），
+    无法增量计算时退回 calculate_indicators 全量计算
+    """
+    with span('calculate_indicators', symbol=symbol, timeframe=timeframe):
+        if INDICATOR_MODE == 'incremental':
+            tail = get_indicator_tail((symbol, timeframe), df)
+            if tail is not None:
+                return tail
+        return calculate_indicators(df)
+
 def is_strong_uptrend(df, idx):
     if idx < MA_SLOW:
         return False
@@ -134,53 +152,61 @@ def calculate_rsi_top_prediction(df):
         logging.error(f"RSI顶部预测计算异常: {e}", exc_info=True)
         return None, None
 
+def _strong_uptrend_mask(close, ma5, ma10, ma20):
+    """is_strong_uptrend 的数组版本：逐行判断 MA5 > MA10 > MA20 且收盘价 > MA5（NaN视为不满足）"""
+    mask = (ma5 > ma10) & (ma10 > ma20) & (close > ma5)
+    mask[:MA_SLOW] = False
+    return mask
+
+def _first_bullish_below(bullish, high, threshold, start, end):
+    """在 [start, end) 中查找第一根最高价低于threshold的阳线"""
+    if start >= end or np.isnan(threshold):
+        return None
+    hits = np.flatnonzero(bullish[start:end] & (high[start:end] < threshold))
+    return int(start + hits[0]) if hits.size else None
+
 def find_can_biao_xiu(df):
     try:
-        can_idx = biao_idx = xiu_idx = None
-        # 从后往前找参
-        for i in range(len(df)-2, 0, -1):
-            # 防止NaN
-            if i < 1 or i >= len(df):
-                continue
-            if any(np.isnan([df['close'].iloc[i], df['open'].iloc[i], df['high'].iloc[i-1]])):
-                continue
-            # 参：阳线，最高价突破DC通道上轨，且上涨趋势
-            if (
-                df['close'].iloc[i] > df['open'].iloc[i] and
-                df['high'].iloc[i] == df['highest'].iloc[i] and
-                is_strong_uptrend(df, i)
-            ):
-                logging.info(f"找到参: idx={i}, close={df['close'].iloc[i]}, open={df['open'].iloc[i]}, high_pre={df['high'].iloc[i-1]}")
-                can_idx = i
-                break
-        if can_idx is None:
+        n = len(df)
+        if n < 3:
+            return None, None, None
+        close = df['close'].to_numpy(dtype=float)
+        open_ = df['open'].to_numpy(dtype=float)
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        bullish = close > open_
+
+        # 参：阳线，最高价触及DC通道上轨，且上涨趋势；前一根最高价为NaN时跳过
+        can_mask = (
+            bullish &
+            (high == df['highest'].to_numpy(dtype=float)) &
+            _strong_uptrend_mask(
+                close,
+                df['ma5'].to_numpy(dtype=float),
+                df['ma10'].to_numpy(dtype=float),
+                df['ma20'].to_numpy(dtype=float),
+            )
+        )
+        can_mask[1:] &= ~np.isnan(high[:-1])
+        # 与逐行扫描保持一致：只在 [1, n-2] 范围内从后往前找
+        can_mask[0] = False
+        can_mask[n - 1] = False
+        candidates = np.flatnonzero(can_mask)
+        if not candidates.size:
             return None, None, None
-        can_low = df['low'].iloc[can_idx]
-        # 标：参的低点后，最高价低于参
-        for j in range(can_idx+1, len(df)-1):
-            if any(np.isnan([df['close'].iloc[j], df['open'].iloc[j], df['high'].iloc[j]])):
-                continue
-            if (
-                df['close'].iloc[j] > df['open'].iloc[j] and
-                df['high'].iloc[j] < can_low
-            ):
-                logging.info(f"找到标: idx={j}, close={df['close'].iloc[j]}, open={df['open'].iloc[j]}, high={df['high'].iloc[j]}")
-                biao_idx = j
-                break
+        can_idx = int(candidates[-1])
+        logging.info(f"找到参: idx={can_idx}, close={close[can_idx]}, open={open_[can_idx]}, high_pre={high[can_idx - 1]}")
+
+        # 标：参之后第一根最高价低于参低点的阳线
+        biao_idx = _first_bullish_below(bullish, high, low[can_idx], can_idx + 1, n - 1)
         if biao_idx is None:
             return can_idx, None, None
-        biao_low = df['low'].iloc[biao_idx]
-        # 修：标的低点后，最高价低于标
-        for k in range(biao_idx+1, len(df)-1):
-            if any(np.isnan([df['close'].iloc[k], df['open'].iloc[k], df['high'].iloc[k]])):
-                continue
-            if (
-                df['close'].iloc[k] > df['open'].iloc[k] and
-                df['high'].iloc[k] < biao_low
-            ):
-                logging.info(f"找到修: idx={k}, close={df['close'].iloc[k]}, open={df['open'].iloc[k]}, high={df['high'].iloc[k]}")
-                xiu_idx = k
-                break
+        logging.info(f"找到标: idx={biao_idx}, close={close[biao_idx]}, open={open_[biao_idx]}, high={high[biao_idx]}")
+
+        # 修：标之后第一根最高价低于标低点的阳线
+        xiu_idx = _first_bullish_below(bullish, high, low[biao_idx], biao_idx + 1, n - 1)
+        if xiu_idx is not None:
+            logging.info(f"找到修: idx={xiu_idx}, close={close[xiu_idx]}, open={open_[xiu_idx]}, high={high[xiu_idx]}")
         return can_idx, biao_idx, xiu_idx
     except Exception as e:
         logging.error(f"find_can_biao_xiu异常: {e}", exc_info=True)
@@ -200,6 +226,11 @@ def set_last_can_signal(symbol_short, signal_state):
     with open(fname, "w") as f:
         f.write(str(signal_state))
 
+def save_can_biao_xiu_state(sig):
+    """参标修信号交付（写入发件箱或发送）之后保存其状态，之后相同状态不再推送"""
+    if sig.get("type") == "can_biao_xiu" and sig.get("state"):
+        set_last_can_signal(sig["symbol"], sig["state"])
+
 def check_signal(symbol, timeframe, df, extra_signal=False):
     """
     检查并返回各种信号（除海龟交易法和参标修外的信号）
@@ -208,12 +239,12 @@ def check_signal(symbol, timeframe, df, extra_signal=False):
     signals = []
     try:
         symbol_short = symbol.split('/')[0].upper()
-        df = calculate_indicators(df)
         if df.empty or len(df) < 30:
             logging.warning(f"{symbol_short} {timeframe} 数据不足，跳过本次信号检测")
             return signals
+        ind = calculate_signal_indicators(symbol, timeframe, df)
 
-        last_row = df.iloc[-1]
+        last_row = ind.iloc[-1]
         if any(np.isnan([last_row.get(k, np.nan) for k in ['rsi6', 'close', 'open']])):
             logging.warning(f"RSI6 {symbol_short} {timeframe} 最后一行有NaN，跳过本次信号检测")
             return signals
@@ -227,13 +258,13 @@ def check_signal(symbol, timeframe, df, extra_signal=False):
             rsi_slope = None
             prediction_type = None
             
-            if last_row['rsi6'] < 5 and len(df) >= 2:
+            if last_row['rsi6'] < 5 and len(ind) >= 2:
                 # RSI接针预测（当RSI < 5时预测底部）
-                predicted_price, rsi_slope = calculate_rsi_bottom_prediction(df)
+                predicted_price, rsi_slope = calculate_rsi_bottom_prediction(ind)
                 prediction_type = "bottom"
-            elif last_row['rsi6'] > 95 and len(df) >= 2:
+            elif last_row['rsi6'] > 95 and len(ind) >= 2:
                 # RSI顶部预测（当RSI > 95时预测顶部）
-                predicted_price, rsi_slope = calculate_rsi_top_prediction(df)
+                predicted_price, rsi_slope = calculate_rsi_top_prediction(ind)
                 prediction_type = "top"
             
             signal_data = {
@@ -241,7 +272,7 @@ def check_signal(symbol, timeframe, df, extra_signal=False):
                 "symbol": symbol_short,
                 "timeframe": timeframe,
                 "rsi6": last_row['rsi6'],
-                "time": last_row['timestamp']
+                "time": to_display_time(last_row['timestamp'])
             }
             
             # 如果有预测结果，添加到信号中
@@ -268,7 +299,7 @@ def check_signal(symbol, timeframe, df, extra_signal=False):
                     "type": "five_down",
                     "symbol": symbol_short,
                     "timeframe": timeframe,
-                    "time": last_row['timestamp'],
+                    "time": to_display_time(last_row['timestamp']),
                     "closes": list(df['close'][-5:]),
                     "opens": list(df['open'][-5:])
                 })
@@ -277,6 +308,89 @@ def check_signal(symbol, timeframe, df, extra_signal=False):
         return signals
     return signals
 
+def _rsi_prediction_arrays(rsi_last, rsi_prev, close_last, close_prev):
+    """calculate_rsi_bottom/top_prediction 的数组版本，返回 (斜率, 预测底部, 预测顶部)，无法预测处为NaN"""
+    rsi_change = rsi_last - rsi_prev
+    price_change = close_last - close_prev
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(np.abs(rsi_change) < 0.01, np.nan, price_change / rsi_change)
+    return slope, close_last - rsi_last * slope, close_last + (100 - rsi_last) * slope
+
+def select_signal_frames(frames):
+    """过滤掉check_signal会因数据不足跳过的币种"""
+    return {symbol: df for symbol, df in frames.items() if not df.empty and len(df) >= 30}
+
+def check_signals_batch(timeframe, frames, extra_signal_symbols=()):
+    """
+    批量版 check_signal：把同一周期的全部币种堆叠成二维数组，一次性计算指标，
+    再用列掩码判断RSI6极值与五连阴。frames为 {symbol: df}，返回信号列表（字段与check_signal一致）
+    """
+    frames = select_signal_frames(frames)
+    if not frames:
+        return []
+    symbols, arrays, lengths = stack_frames(frames)
+    last_timestamps = [frames[symbol]['timestamp'].iloc[-1] for symbol in symbols]
+    return evaluate_signal_arrays(timeframe, symbols, arrays, lengths, last_timestamps, extra_signal_symbols)
+
+def evaluate_signal_arrays(timeframe, symbols, arrays, lengths, last_timestamps, extra_signal_symbols=()):
+    """check_signals_batch 的数组部分：arrays 为 stack_frames 格式的 open/high/low/close 二维数组"""
+    signals = []
+    try:
+        ind = compute_universe_indicators(arrays, lengths)
+        close, open_, rsi = arrays['close'], arrays['open'], ind['rsi6']
+
+        rsi_last, rsi_prev = rsi[:, -1], rsi[:, -2]
+        close_last, close_prev = close[:, -1], close[:, -2]
+        valid_last = ~(np.isnan(rsi_last) | np.isnan(close_last) | np.isnan(open_[:, -1]))
+        for row in np.flatnonzero(~valid_last):
+            logging.warning(f"RSI6 {symbols[row].split('/')[0].upper()} {timeframe} 最后一行有NaN，跳过本次信号检测")
+
+        slope, bottom, top = _rsi_prediction_arrays(rsi_last, rsi_prev, close_last, close_prev)
+        has_prediction = ~np.isnan(slope)
+        extreme = valid_last & ((rsi_last > 95) | (rsi_last < 5))
+        extra = np.array([symbol in extra_signal_symbols for symbol in symbols])
+        five_down = valid_last & extra & (close[:, -5:] < open_[:, -5:]).all(axis=1)
+
+        for row in np.flatnonzero(extreme | five_down):
+            symbol = symbols[row]
+            symbol_short = symbol.split('/')[0].upper()
+            timestamp = to_display_time(last_timestamps[row])
+            if extreme[row]:
+                logging.info(f"{symbol_short} {timeframe} 检测到极值RSI6: {rsi_last[row]}")
+                signal_data = {
+                    "type": "rsi6_extreme",
+                    "symbol": symbol_short,
+                    "timeframe": timeframe,
+                    "rsi6": rsi_last[row],
+                    "time": timestamp
+                }
+                if has_prediction[row]:
+                    signal_data["rsi_slope"] = slope[row]
+                    signal_data["current_price"] = close_last[row]
+                    if rsi_last[row] < 5:
+                        signal_data["prediction_type"] = "bottom"
+                        signal_data["predicted_bottom"] = bottom[row]
+                        signal_data["potential_drop"] = close_last[row] - bottom[row]
+                        logging.info(f"{symbol_short} {timeframe} RSI接针预测: 当前价格={close_last[row]:.2f}, 预测底部={bottom[row]:.2f}, 预计跌幅={close_last[row] - bottom[row]:.2f}, RSI斜率={slope[row]:.2f}")
+                    else:
+                        signal_data["prediction_type"] = "top"
+                        signal_data["predicted_top"] = top[row]
+                        signal_data["potential_rise"] = top[row] - close_last[row]
+                        logging.info(f"{symbol_short} {timeframe} RSI顶部预测: 当前价格={close_last[row]:.2f}, 预测顶部={top[row]:.2f}, 预计涨幅={top[row] - close_last[row]:.2f}, RSI斜率={slope[row]:.2f}")
+                signals.append(signal_data)
+            if five_down[row]:
+                signals.append({
+                    "type": "five_down",
+                    "symbol": symbol_short,
+                    "timeframe": timeframe,
+                    "time": timestamp,
+                    "closes": list(close[row, -5:]),
+                    "opens": list(open_[row, -5:])
+                })
+    except Exception as e:
+        logging.error(f"{timeframe} 批量检测信号异常: {e}", exc_info=True)
+    return signals
+
 def check_can_biao_xiu_signal(symbol, timeframe):
     """
     专门检测参标修信号（使用Yahoo Finance数据获得更多历史数据）
@@ -304,9 +418,9 @@ def check_can_biao_xiu_signal(symbol, timeframe):
         
         # 添加详细的搜索状态日志
         if can_idx is not None:
-            can_time = str(df['timestamp'].iloc[can_idx])
-            biao_time = str(df['timestamp'].iloc[biao_idx]) if biao_idx is not None else None
-            xiu_time = str(df['timestamp'].iloc[xiu_idx]) if xiu_idx is not None else None
+            can_time = str(to_display_time(df['timestamp'].iloc[can_idx]))
+            biao_time = str(to_display_time(df['timestamp'].iloc[biao_idx])) if biao_idx is not None else None
+            xiu_time = str(to_display_time(df['timestamp'].iloc[xiu_idx])) if xiu_idx is not None else None
             
             # 构建当前信号状态字符串
             current_state = f"{can_time},{biao_time},{xiu_time}"
@@ -328,8 +442,9 @@ def check_can_biao_xiu_signal(symbol, timeframe):
                     "can_time": can_time,
                     "biao_time": biao_time,
                     "xiu_time": xiu_time,
+                    # 状态在消息写入发件箱（或发送）之后才由 save_can_biao_xiu_state 保存，避免信号丢失后不再重发
+                    "state": current_state,
                 })
-                set_last_can_signal(symbol_short, current_state)
             else:
                 logging.debug(f"参标修 {symbol_short} {timeframe}: 信号状态未变化 {current_state}")
         else:
@@ -378,7 +493,7 @@ def check_turtle_signal(symbol, timeframe):
                     "type": "turtle_buy",
                     "symbol": symbol_short,
                     "timeframe": timeframe,
-                    "time": last_row['timestamp'],
+                    "time": to_display_time(last_row['timestamp']),
                     "open": last_row['open'],
                     "close": last_row['close'],
                     "ma200": last_row['ma200'],
@@ -392,7 +507,7 @@ def check_turtle_signal(symbol, timeframe):
                     "type": "turtle_sell",
                     "symbol": symbol_short,
                     "timeframe": timeframe,
-                    "time": last_row['timestamp'],
+                    "time": to_display_time(last_row['timestamp']),
                     "open": last_row['open'],
                     "close": last_row['close'],
                     "ma200": last_row['ma200'],
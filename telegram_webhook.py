@@ -0,0 +1,68 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 1 << 20
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    # 由 start_webhook_server 在子类上设置
+    path_prefix = '/'
+    secret = ''
+    dispatch = None
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0] != self.path_prefix:
+            self._reply(404)
+            return
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ''), self.secret):
+            logging.warning(f"Webhook请求密钥校验失败，来源 {self.client_address[0]}")
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length <= 0 or length > MAX_BODY_SIZE:
+                raise ValueError(f"请求体长度异常: {length}")
+            update = json.loads(self.rfile.read(length))
+            if not isinstance(update, dict):
+                raise ValueError("请求体不是JSON对象")
+        except ValueError as e:
+            logging.warning(f"Webhook请求解析失败: {e}")
+            self._reply(400)
+            return
+        # 先交给命令线程再立即应答，Telegram只需要知道更新已送达
+        type(self).dispatch(update)
+        self._reply(200)
+
+    def do_GET(self):
+        self._reply(404)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Webhook {self.client_address[0]} {format % args}")
+
+
+def start_webhook_server(dispatch, host, port, path, secret):
+    """
+    在后台线程启动接收Telegram推送的HTTP服务：只接受 path 上携带正确
+    X-Telegram-Bot-Api-Secret-Token 的POST请求，每条更新交给 dispatch(update)。返回server（server_address为实际监听地址）
+    """
+    if not secret:
+        raise ValueError("webhook模式必须设置 TG_WEBHOOK_SECRET")
+    handler = type('WebhookRequestHandler', (_WebhookRequestHandler,), {
+        'path_prefix': path,
+        'secret': secret,
+        'dispatch': staticmethod(dispatch),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='telegram_webhook', daemon=True).start()
+    logging.info(f"Telegram Webhook服务已启动: {server.server_address[0]}:{server.server_address[1]}{path}")
+    return server
@@ -0,0 +1,46 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def load_repo_modules(test, names, env):
+    """
+    用给定环境变量（清空原有环境）按顺序重新加载仓库根目录下的模块，
+    测试结束时恢复原有模块与环境变量。返回 {模块名: 模块}
+    """
+    previous_modules = {name: sys.modules.pop(name, None) for name in names}
+
+    def restore_modules():
+        for name in names:
+            sys.modules.pop(name, None)
+        for name, module in previous_modules.items():
+            if module is not None:
+                sys.modules[name] = module
+
+    test.addCleanup(restore_modules)
+
+    env_patcher = mock.patch.dict(os.environ, env, clear=True)
+    env_patcher.start()
+    test.addCleanup(env_patcher.stop)
+
+    modules = {}
+    for name in names:
+        spec = importlib.util.spec_from_file_location(name, REPO_ROOT / f"{name}.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        modules[name] = module
+    return modules
+
+
+def make_data_dir(test):
+    """测试专用的临时 DATA_DIR，测试结束时删除"""
+    tmpdir = tempfile.TemporaryDirectory()
+    test.addCleanup(tmpdir.cleanup)
+    return tmpdir.name
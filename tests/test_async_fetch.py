@@ -0,0 +1,146 @@
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from aiohttp import web
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils")
+
+
+class FakeBitgetServer:
+    """本地Bitget K线接口替身，按请求参数返回固定K线"""
+
+    def __init__(self, fail_first=0):
+        self.fail_first = fail_first
+        self.requests = []
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _candles(self, request):
+        self.requests.append(dict(request.query))
+        if len(self.requests) <= self.fail_first:
+            return web.Response(status=502)
+        start = 1_700_000_000_000
+        rows = [
+            [str(start + i * 3_600_000), "1", "2", "0.5", str(1 + i), "10", "10"]
+            for i in range(int(request.query["limit"]))
+        ]
+        return web.json_response({"code": "00000", "msg": "success", "data": rows})
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get("/api/v2/mix/market/candles", self._candles)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+class AsyncFetchTests(unittest.TestCase):
+    def _load_exchange_utils(self, env):
+        load_repo_modules(self, MODULE_NAMES, env)
+        return sys.modules["exchange_utils"]
+
+    def test_fetches_every_pair_over_shared_session(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir, "CANDLE_STORE_ENABLED": "false"})
+            pairs = [(f"C{i}/USDT:USDT", tf) for i in range(20) for tf in ("1h", "4h")]
+
+            with FakeBitgetServer() as base_url, \
+                 mock.patch.object(exchange_utils, "BITGET_BASE_URL", base_url), \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                results = exchange_utils.get_all_data_async(pairs, limit=50, concurrency=8)
+
+            self.assertEqual([(symbol, tf) for symbol, tf, _ in results], pairs)
+            for _, _, df in results:
+                self.assertEqual(len(df), 50)
+                self.assertEqual(list(df.columns), ["timestamp", "open", "high", "low", "close", "volume"])
+
+    def test_streams_results_to_callback_without_accumulating_frames(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir, "CANDLE_STORE_ENABLED": "false"})
+            pairs = [(f"C{i}/USDT:USDT", "1h") for i in range(12)]
+            received = []
+
+            with FakeBitgetServer() as base_url, \
+                 mock.patch.object(exchange_utils, "BITGET_BASE_URL", base_url), \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                results = exchange_utils.get_all_data_async(pairs, limit=10, concurrency=3, on_result=received.append)
+
+            self.assertEqual(sorted(results), sorted(pairs))
+            self.assertEqual(sorted((symbol, tf) for symbol, tf, _ in received), sorted(pairs))
+            self.assertTrue(all(len(df) == 10 for _, _, df in received))
+
+    def test_retries_network_errors_like_sync_fetch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir, "CANDLE_STORE_ENABLED": "false"})
+            original_delay = exchange_utils._candle_retry_delay
+
+            def no_wait(*args, **kwargs):
+                delay = original_delay(*args, **kwargs)
+                return None if delay is None else 0
+
+            with FakeBitgetServer(fail_first=2) as base_url, \
+                 mock.patch.object(exchange_utils, "BITGET_BASE_URL", base_url), \
+                 mock.patch.object(exchange_utils, "_candle_retry_delay", side_effect=no_wait), \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                results = exchange_utils.get_all_data_async([("DOGE/USDT:USDT", "1h")], limit=5)
+
+            self.assertEqual(len(results[0][2]), 5)
+
+    def test_slow_candle_store_does_not_serialize_fetches(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir, "CANDLE_STORE_ENABLED": "true"})
+            pairs = [(f"C{i}/USDT:USDT", "1h") for i in range(5)]
+            store_delay = 0.2
+
+            def slow_load(symbol, timeframe):
+                time.sleep(store_delay)
+                return pd.DataFrame()
+
+            def slow_save(symbol, timeframe, df):
+                time.sleep(store_delay)
+
+            with FakeBitgetServer() as base_url, \
+                 mock.patch.object(exchange_utils, "BITGET_BASE_URL", base_url), \
+                 mock.patch.object(exchange_utils, "load_candles", side_effect=slow_load), \
+                 mock.patch.object(exchange_utils, "save_candles", side_effect=slow_save), \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                started = time.monotonic()
+                results = exchange_utils.get_all_data_async(pairs, limit=10, concurrency=5)
+                elapsed = time.monotonic() - started
+
+            self.assertTrue(all(len(df) == 10 for _, _, df in results))
+            # 在事件循环上串行读写本地存储至少需要 5 * 2 * 0.2 = 2 秒
+            self.assertLess(elapsed, len(pairs) * 2 * store_delay / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import logging
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+from can_biao_xiu_reference import find_can_biao_xiu_reference, make_trending_frame  # noqa: E402
+from module_loader import load_repo_modules, make_data_dir  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils", "strategy_sig")
+
+
+class FindCanBiaoXiuTests(unittest.TestCase):
+    def setUp(self):
+        data_dir = make_data_dir(self)
+        load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir})
+        self.strategy_sig = sys.modules["strategy_sig"]
+
+        logging.disable(logging.ERROR)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_matches_reference_on_random_series(self):
+        outcomes = set()
+        for seed in range(40):
+            for bars, nan_rate in ((500, 0.0), (500, 0.02), (120, 0.0)):
+                df = make_trending_frame(self.strategy_sig, bars, seed, nan_rate)
+                expected = find_can_biao_xiu_reference(self.strategy_sig, df)
+                self.assertEqual(self.strategy_sig.find_can_biao_xiu(df), expected, f"seed={seed} bars={bars}")
+                outcomes.add(tuple(idx is not None for idx in expected))
+
+        # 随机样本应覆盖 无参 / 仅参 / 参标 / 参标修 四种结果
+        self.assertEqual(len(outcomes), 4)
+
+    def test_short_or_malformed_frames_return_none(self):
+        self.assertEqual(self.strategy_sig.find_can_biao_xiu(pd.DataFrame()), (None, None, None))
+        df = make_trending_frame(self.strategy_sig, 60, seed=1).drop(columns=["highest"])
+        self.assertEqual(self.strategy_sig.find_can_biao_xiu(df), (None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils")
+HOUR_MS = 60 * 60 * 1000
+
+
+def make_candles(start_ms, count, interval_ms=HOUR_MS, base_price=100.0):
+    timestamps = [start_ms + i * interval_ms for i in range(count)]
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(timestamps, unit="ms"),
+        "open": [base_price + i for i in range(count)],
+        "high": [base_price + i + 1 for i in range(count)],
+        "low": [base_price + i - 1 for i in range(count)],
+        "close": [base_price + i + 0.5 for i in range(count)],
+        "volume": [10.0] * count,
+    })
+
+
+class CandleStoreTests(unittest.TestCase):
+    def _load_modules(self, data_dir, env=None):
+        modules = load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir, **(env or {})})
+        return modules["config"], modules["candle_store"], modules["exchange_utils"]
+
+    def test_save_and_load_round_trip_under_data_dir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, candle_store, _ = self._load_modules(tmpdir)
+            df = make_candles(1_700_000_000_000, 5)
+
+            candle_store.save_candles("BTC/USDT:USDT", "1h", df)
+
+            path = Path(candle_store.get_candle_store_path("BTC/USDT:USDT", "1h"))
+            self.assertEqual(path, Path(config.CANDLE_STORE_DIR) / "BTCUSDT_1h.csv")
+            self.assertTrue(path.is_file())
+            loaded = candle_store.load_candles("BTC/USDT:USDT", "1h")
+            pd.testing.assert_frame_equal(
+                loaded.reset_index(drop=True),
+                df,
+                check_dtype=False,
+            )
+
+    def test_merge_prefers_fresh_rows_and_trims_to_limit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, candle_store, _ = self._load_modules(tmpdir)
+            stored = make_candles(1_700_000_000_000, 5)
+            fresh = make_candles(1_700_000_000_000 + 4 * HOUR_MS, 3, base_price=200.0)
+
+            merged = candle_store.merge_candles(stored, fresh, max_rows=6)
+
+            self.assertEqual(len(merged), 6)
+            self.assertTrue(merged["timestamp"].is_monotonic_increasing)
+            self.assertEqual(merged["open"].iloc[3], 200.0)
+            self.assertEqual(merged["open"].iloc[-1], 202.0)
+
+    def test_incremental_fetch_requests_only_new_candles(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, candle_store, exchange_utils = self._load_modules(tmpdir)
+            now_ms = int(time.time() * 1000) // HOUR_MS * HOUR_MS
+            stored = make_candles(now_ms - 9 * HOUR_MS, 8)
+            candle_store.save_candles("ETH/USDT:USDT", "1h", stored)
+            fresh = make_candles(now_ms - 2 * HOUR_MS, 3, base_price=300.0)
+
+            with mock.patch.object(exchange_utils, "_fetch_bitget_candles", return_value=fresh) as fetch, \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                df = exchange_utils.get_incremental_bitget_data("ETH/USDT:USDT", "1h", limit=500)
+
+            _, _, fetch_limit, _ = fetch.call_args.args
+            self.assertLessEqual(fetch_limit, 5)
+            self.assertEqual(fetch.call_args.kwargs["start_time"], now_ms - 3 * HOUR_MS)
+            self.assertEqual(len(df), 10)
+            self.assertEqual(df["open"].iloc[-1], 302.0)
+            self.assertEqual(len(candle_store.load_candles("ETH/USDT:USDT", "1h")), 10)
+
+    def test_incremental_fetch_falls_back_to_full_fetch_without_history(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, _, exchange_utils = self._load_modules(tmpdir)
+            full = make_candles(1_700_000_000_000, 10)
+
+            with mock.patch.object(exchange_utils, "_fetch_bitget_candles", return_value=full) as fetch, \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                df = exchange_utils.get_incremental_bitget_data("SOL/USDT:USDT", "1h", limit=500)
+
+            self.assertEqual(fetch.call_args.args[2], 500)
+            self.assertIsNone(fetch.call_args.kwargs["start_time"])
+            self.assertEqual(len(df), 10)
+
+    def test_aggregate_uses_exchange_boundaries_and_ohlcv_rules(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, candle_store, _ = self._load_modules(tmpdir)
+            # 从 13:00 UTC 开始：第一根4h（12:00）与第一根日线（前一天16:00）都不完整，应被丢弃
+            start = int(pd.Timestamp("2024-03-05 13:00").value // 1_000_000)
+            base = make_candles(start, 60)
+
+            four_hour = candle_store.aggregate_candles(base, "4h")
+            daily = candle_store.aggregate_candles(base, "1d", offset_ms=16 * HOUR_MS)
+
+            self.assertEqual(four_hour["timestamp"].iloc[0], pd.Timestamp("2024-03-05 16:00"))
+            first = base.iloc[3:7]
+            self.assertEqual(four_hour["open"].iloc[0], first["open"].iloc[0])
+            self.assertEqual(four_hour["high"].iloc[0], first["high"].max())
+            self.assertEqual(four_hour["low"].iloc[0], first["low"].min())
+            self.assertEqual(four_hour["close"].iloc[0], first["close"].iloc[-1])
+            self.assertEqual(four_hour["volume"].iloc[0], first["volume"].sum())
+            self.assertEqual(
+                list(daily["timestamp"]),
+                [pd.Timestamp("2024-03-05 16:00"), pd.Timestamp("2024-03-06 16:00"), pd.Timestamp("2024-03-07 16:00")],
+            )
+            self.assertEqual(daily["volume"].iloc[0], 10.0 * 24)
+            # 最后一根未收盘日线只包含已有的小时
+            self.assertEqual(daily["volume"].iloc[-1], 10.0 * (60 - 3 - 48))
+
+    def test_derived_mode_refreshes_one_base_series_per_hour(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, candle_store, exchange_utils = self._load_modules(tmpdir, {"DERIVED_CANDLES_ENABLED": "true", "DERIVED_BASE_HOURS": "240"})
+            now_ms = int(time.time() * 1000) // HOUR_MS * HOUR_MS
+            history = make_candles(now_ms - 239 * HOUR_MS, 238)
+            fresh = make_candles(now_ms - 2 * HOUR_MS, 3, base_price=500.0)
+
+            with mock.patch.object(exchange_utils, "_fetch_bitget_history_candles", return_value=history) as backfill, \
+                 mock.patch.object(exchange_utils, "_fetch_bitget_candles", return_value=fresh) as fetch, \
+                 mock.patch.object(exchange_utils, "_should_skip_flat_rwa_symbol", return_value=False):
+                frames = {tf: exchange_utils.get_data("BTC/USDT:USDT", tf, 500) for tf in ("1h", "4h", "1d")}
+
+            backfill.assert_called_once()
+            fetch.assert_called_once()
+            self.assertEqual(fetch.call_args.args[1], "1h")
+            self.assertEqual(len(frames["1h"]), 240)
+            self.assertEqual(frames["1h"]["open"].iloc[-1], 502.0)
+            self.assertEqual(frames["4h"]["close"].iloc[-1], frames["1h"]["close"].iloc[-1])
+            self.assertEqual(frames["1d"]["timestamp"].dt.hour.unique().tolist(), [16])
+            self.assertEqual(len(candle_store.load_candles("BTC/USDT:USDT", "1h")), 240)
+
+
+if __name__ == "__main__":
+    unittest.main()
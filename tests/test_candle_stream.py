@@ -0,0 +1,178 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from aiohttp import WSMsgType, web
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules, make_data_dir  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils")
+HOUR_MS = 60 * 60 * 1000
+START_MS = 1_700_000_000_000 // HOUR_MS * HOUR_MS
+
+
+def candle(ts, close):
+    return [str(ts), "1", str(close + 1), "0.5", str(close), "10", "10", "10"]
+
+
+class FakeBitgetWebSocket:
+    """本地Bitget公共WebSocket替身：记录订阅、回应ping，并可向所有连接推送K线"""
+
+    def __init__(self):
+        self.subscriptions = []
+        self.pings = 0
+        self.clients = []
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.clients.append(ws)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            if msg.data == "ping":
+                self.pings += 1
+                await ws.send_str("pong")
+                continue
+            payload = json.loads(msg.data)
+            if payload.get("op") == "subscribe":
+                self.subscriptions.append(payload["args"])
+                for arg in payload["args"]:
+                    await ws.send_json({"event": "subscribe", "arg": arg})
+        return ws
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get("/v2/ws/public", self._handler)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(5)
+
+    def push(self, inst_id, channel, rows, action="update"):
+        async def send():
+            for ws in list(self.clients):
+                if not ws.closed:
+                    await ws.send_json({
+                        "action": action,
+                        "arg": {"instType": "USDT-FUTURES", "channel": channel, "instId": inst_id},
+                        "data": rows,
+                    })
+        self._call(send())
+
+    def drop_connections(self):
+        async def close():
+            for ws in list(self.clients):
+                await ws.close()
+            self.clients.clear()
+        self._call(close())
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return f"ws://127.0.0.1:{self.port}/v2/ws/public"
+
+    def __exit__(self, *exc):
+        self.drop_connections()
+        self._call(self._runner.cleanup())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class CandleStreamTests(unittest.TestCase):
+    def setUp(self):
+        data_dir = make_data_dir(self)
+        load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir})
+        self.exchange_utils = sys.modules["exchange_utils"]
+
+    def _run_stream(self, **kwargs):
+        fake = FakeBitgetWebSocket()
+        url = fake.__enter__()
+        self.addCleanup(fake.__exit__, None, None, None)
+        stream = self.exchange_utils.CandleStream(
+            ["BTC/USDT:USDT", "ETH/USDT:USDT"], ["1h", "4h"], url=url, **kwargs
+        )
+        self.addCleanup(stream.stop)
+        return fake, stream.start()
+
+    def test_subscribes_universe_and_reports_candle_close(self):
+        fake, stream = self._run_stream(channels_per_connection=3)
+
+        self.assertTrue(wait_for(lambda: sum(len(args) for args in fake.subscriptions) == 4))
+        self.assertEqual(stream.connections, 2)
+        channels = sorted((arg["instId"], arg["channel"]) for args in fake.subscriptions for arg in args)
+        self.assertEqual(channels, [("BTCUSDT", "candle1H"), ("BTCUSDT", "candle4H"), ("ETHUSDT", "candle1H"), ("ETHUSDT", "candle4H")])
+
+        fake.push("BTCUSDT", "candle1H", [candle(START_MS + i * HOUR_MS, 100 + i) for i in range(5)], action="snapshot")
+        self.assertTrue(wait_for(lambda: len(stream.get_frame("BTC/USDT:USDT", "1h")) == 5))
+        self.assertEqual(stream.pop_closed_timeframes(), [])
+
+        # 同一根K线的更新只改价格，不算收盘
+        fake.push("BTCUSDT", "candle1H", [candle(START_MS + 4 * HOUR_MS, 200)])
+        self.assertTrue(wait_for(lambda: stream.get_frame("BTC/USDT:USDT", "1h")["close"].iloc[-1] == 200))
+        self.assertEqual(stream.pop_closed_timeframes(), [])
+
+        fake.push("BTCUSDT", "candle1H", [candle(START_MS + 5 * HOUR_MS, 201)])
+        self.assertTrue(wait_for(lambda: stream.last_timestamp("BTC/USDT:USDT", "1h") == START_MS + 5 * HOUR_MS))
+        self.assertEqual(stream.pop_closed_timeframes(), ["1h"])
+        self.assertEqual(stream.pop_closed_timeframes(), [])
+        df = stream.get_frame("BTC/USDT:USDT", "1h")
+        self.assertEqual(list(df.columns), ["timestamp", "open", "high", "low", "close", "volume"])
+        self.assertEqual(len(df), 6)
+        self.assertEqual(df["close"].iloc[-2], 200.0)
+
+    def test_reconnects_and_resubscribes_after_disconnect(self):
+        fake, stream = self._run_stream(reconnect_delay=0.05)
+        self.assertTrue(wait_for(lambda: len(fake.subscriptions) == 1))
+
+        fake.drop_connections()
+
+        self.assertTrue(wait_for(lambda: len(fake.subscriptions) == 2))
+        self.assertEqual(stream.connections, 2)
+        self.assertEqual(fake.subscriptions[0], fake.subscriptions[1])
+        fake.push("ETHUSDT", "candle4H", [candle(START_MS, 50)])
+        self.assertTrue(wait_for(lambda: len(stream.get_frame("ETH/USDT:USDT", "4h")) == 1))
+
+    def test_sends_ping_when_idle(self):
+        fake, stream = self._run_stream(ping_interval=0.1)
+
+        self.assertTrue(wait_for(lambda: fake.pings >= 2))
+        self.assertEqual(stream.connections, 1)
+
+    def test_seed_trims_to_max_rows_without_close_event(self):
+        stream = self.exchange_utils.CandleStream(["BTC/USDT:USDT"], ["1h"], max_rows=3)
+        rows = [candle(START_MS + i * HOUR_MS, 100 + i) for i in range(5)]
+        stream.apply_candles("BTC/USDT:USDT", "1h", rows, detect_close=False)
+
+        self.assertEqual(len(stream.get_frame("BTC/USDT:USDT", "1h")), 3)
+        self.assertEqual(stream.pop_closed_timeframes(), [])
+
+if __name__ == "__main__":
+    unittest.main()
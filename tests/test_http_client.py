@@ -0,0 +1,64 @@
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules  # noqa: E402
+
+MODULE_NAMES = ("config", "http_client")
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTests(unittest.TestCase):
+    def setUp(self):
+        load_repo_modules(self, MODULE_NAMES, {"BITGET_HTTP_POOL_SIZE": "4"})
+        self.http_client = sys.modules["http_client"]
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_sequential_requests_reuse_one_connection(self):
+        for _ in range(5):
+            resp = self.http_client.http_get(f"{self.base_url}/ping", timeout=5)
+            self.assertEqual(resp.json(), {"ok": True})
+
+        stats = self.http_client.get_connection_stats()["127.0.0.1"]
+        self.assertEqual(stats, {"requests": 5, "new_connections": 1, "reused": 4})
+
+    def test_session_is_shared_per_host_and_sized_from_config(self):
+        session = self.http_client.get_session(f"{self.base_url}/a")
+
+        self.assertIs(session, self.http_client.get_session(f"{self.base_url}/b"))
+        self.assertIsNot(session, self.http_client.get_session("https://api.bitget.com/x"))
+        bitget_adapter = self.http_client.get_session("https://api.bitget.com/x").get_adapter("https://api.bitget.com")
+        self.assertEqual(bitget_adapter._pool_maxsize, 4)
+
+    def test_numeric_timeout_is_split_into_connect_and_read(self):
+        self.assertEqual(self.http_client._resolve_timeout(10), (5.0, 10))
+        self.assertEqual(self.http_client._resolve_timeout(None), (5.0, 30.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
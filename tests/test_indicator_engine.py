@@ -0,0 +1,162 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules, make_data_dir  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils", "indicator_engine", "strategy_sig")
+INDICATOR_COLUMNS = ["highest", "lowest", "mid", "ma5", "ma10", "ma20", "ma200", "rsi6"]
+
+
+def make_candles(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=bars, freq="h"),
+        "open": open_,
+        "high": np.maximum(open_, close) * 1.01,
+        "low": np.minimum(open_, close) * 0.99,
+        "close": close,
+        "volume": np.ones(bars),
+    })
+
+
+def replay_indicator_frame(engine, df):
+    """对整段df逐根增量计算全部指标，返回与calculate_indicators同列的DataFrame"""
+    state = engine.IndicatorState()
+    rows = []
+    prices = df[["high", "low", "close"]].to_numpy(dtype=float)
+    for i, timestamp in enumerate(engine.to_epoch_ms(df["timestamp"]).tolist()):
+        rows.append(state.append(timestamp, prices[i, 0], prices[i, 1], prices[i, 2]))
+    out = df.copy()
+    for column in INDICATOR_COLUMNS:
+        out[column] = [row[column] for row in rows]
+    return out
+
+
+class IndicatorEngineTests(unittest.TestCase):
+    def setUp(self):
+        data_dir = make_data_dir(self)
+        load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir})
+        self.engine = sys.modules["indicator_engine"]
+        self.strategy_sig = sys.modules["strategy_sig"]
+
+    def assert_indicators_close(self, actual, expected):
+        for column in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(
+                actual[column].to_numpy(dtype=float),
+                expected[column].to_numpy(dtype=float),
+                rtol=1e-9,
+                atol=1e-9,
+                equal_nan=True,
+                err_msg=column,
+            )
+
+    def test_full_replay_matches_calculate_indicators(self):
+        df = make_candles(2500, seed=3)
+        expected = self.strategy_sig.calculate_indicators(df.copy())
+
+        self.assert_indicators_close(replay_indicator_frame(self.engine, df), expected)
+
+    def test_tail_tracks_rolling_scans_with_revised_last_candle(self):
+        history = make_candles(800, seed=5)
+        key = ("BTC/USDT:USDT", "1h")
+
+        for end in range(500, 520):
+            window = history.iloc[end - 500:end].copy().reset_index(drop=True)
+            # 最新一根K线尚未收盘：本轮看到的是中途价格，下一轮会被覆盖
+            window.loc[window.index[-1], "close"] *= 1.003
+            before = self.engine._states.get(key)
+            count_before = before.count if before else 0
+
+            tail = self.engine.get_indicator_tail(key, window)
+
+            expected = self.strategy_sig.calculate_indicators(window.copy()).iloc[-2:].reset_index(drop=True)
+            self.assert_indicators_close(tail, expected)
+            if before is not None:
+                self.assertEqual(self.engine._states[key].count, count_before + 1)
+
+    def test_returns_none_when_prices_contain_nan(self):
+        df = make_candles(100)
+        df.loc[50, "high"] = np.nan
+
+        self.assertIsNone(self.engine.get_indicator_tail(("X", "1h"), df))
+
+    def test_indicators_keep_raw_timestamps_and_signals_convert_lazily(self):
+        df = make_candles(50)
+        raw = df["timestamp"].copy()
+
+        out = self.strategy_sig.calculate_indicators(df)
+
+        pd.testing.assert_series_equal(out["timestamp"], raw)
+        expected = pd.Timestamp("2024-01-01 08:00", tz="Asia/Shanghai")
+        self.assertEqual(self.strategy_sig.to_display_time(raw.iloc[0]), expected)
+        self.assertEqual(self.strategy_sig.to_display_time(1_704_067_200_000), expected)
+        self.assertEqual(str(self.strategy_sig.to_display_time(pd.Timestamp("2024-01-01", tz="UTC"))), "2024-01-01 08:00:00+08:00")
+        with mock.patch.object(self.strategy_sig, "DISPLAY_TIMEZONE", "Europe/London"):
+            self.assertEqual(str(self.strategy_sig.to_display_time(raw.iloc[0])), "2024-01-01 00:00:00+00:00")
+
+    def test_universe_kernel_matches_calculate_indicators_for_ragged_lengths(self):
+        frames = {f"C{i}/USDT:USDT": make_candles(bars, seed=i) for i, bars in enumerate((500, 320, 45, 500))}
+
+        symbols, arrays, lengths = self.engine.stack_frames(frames)
+        result = self.engine.compute_universe_indicators(arrays, lengths)
+
+        for row, symbol in enumerate(symbols):
+            expected = self.strategy_sig.calculate_indicators(frames[symbol].copy())
+            for column in INDICATOR_COLUMNS:
+                np.testing.assert_allclose(
+                    result[column][row, -lengths[row]:],
+                    expected[column].to_numpy(dtype=float),
+                    rtol=1e-9,
+                    atol=1e-9,
+                    equal_nan=True,
+                    err_msg=f"{symbol} {column}",
+                )
+
+    def test_batch_signals_match_per_symbol_check_signal(self):
+        frames = {}
+        for i in range(12):
+            df = make_candles(300 - i * 20, seed=10 + i)
+            # 末尾制造连续上涨/下跌，让部分币种出现RSI6极值与五连阴
+            if i % 3 == 0:
+                df.loc[df.index[-15:], "close"] = df["close"].iloc[-16] * np.cumprod(np.full(15, 1.05))
+            elif i % 3 == 1:
+                df.loc[df.index[-15:], "close"] = df["close"].iloc[-16] * np.cumprod(np.full(15, 0.95))
+                df.loc[df.index[-15:], "open"] = df["close"].iloc[-15:] * 1.01
+            frames[f"C{i}/USDT:USDT"] = df
+        frames["SHORT/USDT:USDT"] = make_candles(20)
+        extra = {"C1/USDT:USDT", "C4/USDT:USDT", "C6/USDT:USDT"}
+
+        with mock.patch.object(self.strategy_sig, "INDICATOR_MODE", "full"):
+            expected = [
+                sig
+                for symbol, df in frames.items()
+                for sig in self.strategy_sig.check_signal(symbol, "1h", df.copy(), extra_signal=symbol in extra)
+            ]
+        actual = self.strategy_sig.check_signals_batch("1h", frames, extra_signal_symbols=extra)
+
+        self.assertEqual({sig["type"] for sig in expected}, {"rsi6_extreme", "five_down"})
+        self.assertEqual(len(actual), len(expected))
+        for got, want in zip(actual, expected):
+            self.assertEqual(got.keys(), want.keys())
+            for key, value in want.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(got[key], value, places=6, msg=key)
+                elif isinstance(value, list):
+                    np.testing.assert_allclose(got[key], value)
+                else:
+                    self.assertEqual(got[key], value, msg=key)
+
+
+if __name__ == "__main__":
+    unittest.main()
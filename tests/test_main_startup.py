@@ -1,17 +1,22 @@
 import importlib.util
+import json
+import os
 import sys
+import tempfile
 import types
 import unittest
 from pathlib import Path
 from unittest import mock
 
+import pandas as pd
+
 
 MAIN_PATH = Path(__file__).resolve().parents[1] / "main.py"
 
 
 class MainStartupTests(unittest.TestCase):
     def _load_main_module(self):
-        module_names = ["config", "exchange_utils", "strategy_sig", "notifier", "utils", "schedule"]
+        module_names = ["config", "exchange_utils", "http_client", "pipeline", "scheduler", "signal_pool", "strategy_sig", "notifier", "utils", "schedule"]
         previous_modules = {name: sys.modules.pop(name, None) for name in module_names}
 
         def restore_modules():
@@ -26,33 +31,70 @@ class MainStartupTests(unittest.TestCase):
         config = types.ModuleType("config")
         config.LOGLEVEL = "INFO"
         config.TIMEFRAMES = ["1h", "1d"]
+        config.CANDLE_CLOSE_GRACE_SECONDS = 30
+        config.CANDLE_CLOSE_OFFSETS = {"1d": 16 * 60 * 60}
+        config.YAHOO_CLOSE_OFFSETS = {"1h": 0, "1d": 0}
+        config.YAHOO_SCHEDULED_TIMEFRAMES = ["1d"]
         config.MAX_WORKERS = 2
+        config.METRICS_ENABLED = False
+        config.METRICS_HOST = "127.0.0.1"
+        config.METRICS_PORT = 0
+        config.COMPUTE_WORKERS = 1
+        config.NOTIFY_WORKERS = 1
+        config.PIPELINE_QUEUE_SIZE = 4
         config.DC_PERIOD = 28
+        config.FETCH_MODE = "thread"
+        config.INGESTION_MODE = "poll"
+        config.STREAM_SETTLE_SECONDS = 3
+        config.SIGNAL_EVAL_MODE = "per_symbol"
+        config.SIGNAL_DIGEST_ENABLED = False
+        config.OUTBOX_ENABLED = True
+        config.TG_UPDATE_MODE = "polling"
         config.SYMBOLS = []
         config.MA_LONG = 200
         config.DATA_DIR = "/tmp/ltt-data"
         config.TMP_DIR = "/tmp/ltt-data/tmp"
+        config.TRACE_ENABLED = False
+        config.TRACE_DIR = "/tmp/ltt-data/traces"
+        config.TRACE_KEEP = 3
         config.ALLOWED_USERS_FILE = "/tmp/ltt-data/allowed_users.txt"
         config.USER_SETTINGS_FILE = "/tmp/ltt-data/user_settings.json"
+        config.USER_DB_FILE = "/tmp/ltt-data/users.db"
         config.LOG_FILE = "/tmp/ltt-data/strategy.log"
         config.BASE_DIR = "/tmp/ltt-base"
 
         exchange_utils = types.ModuleType("exchange_utils")
+        exchange_utils.clear_yahoo_cache = lambda: None
         exchange_utils.get_data = lambda *args, **kwargs: None
+        exchange_utils.get_all_data_async = lambda *args, **kwargs: []
         exchange_utils.get_all_usdt_swap_symbols = lambda: []
+        exchange_utils.prefetch_yahoo_data = lambda symbols, timeframes=None: 0
+        exchange_utils.start_candle_stream = lambda *args, **kwargs: None
         exchange_utils.warmup_connection = lambda: None
 
+        http_client = types.ModuleType("http_client")
+        http_client.log_connection_stats = lambda: None
+
+        signal_pool = types.ModuleType("signal_pool")
+        signal_pool.evaluate_signals_in_processes = lambda *args, **kwargs: []
+        signal_pool.shutdown_signal_pool = lambda: None
+
         strategy_sig = types.ModuleType("strategy_sig")
         strategy_sig.check_signal = lambda *args, **kwargs: []
+        strategy_sig.check_signals_batch = lambda *args, **kwargs: []
         strategy_sig.check_turtle_signal = lambda *args, **kwargs: []
         strategy_sig.check_can_biao_xiu_signal = lambda *args, **kwargs: []
+        strategy_sig.save_can_biao_xiu_state = lambda sig: None
 
         notifier = types.ModuleType("notifier")
         notifier.monitor_new_users = lambda: None
         notifier.send_telegram_message = lambda message: None
         notifier.set_bot_commands = lambda: None
         notifier.rsi6_summary = lambda signals: None
-        notifier.handle_signals = lambda signal, rsi6_signals=None: None
+        notifier.handle_signals = lambda signal, rsi6_signals=None, digest=None: None
+        notifier.start_outbox_sender = lambda: None
+        notifier.start_webhook_listener = lambda: None
+        notifier.SignalDigest = type("SignalDigest", (), {"add": lambda self, users, msg: None, "flush": lambda self: 0})
 
         utils = types.ModuleType("utils")
         utils.prepare_runtime_state = lambda **kwargs: None
@@ -63,10 +105,10 @@ class MainStartupTests(unittest.TestCase):
                 self.callback = None
 
             @property
-            def minutes(self):
+            def seconds(self):
                 return self
 
-            def do(self, callback):
+            def do(self, callback, *args):
                 self.callback = callback
                 return callback
 
@@ -76,6 +118,18 @@ class MainStartupTests(unittest.TestCase):
 
         sys.modules["config"] = config
         sys.modules["exchange_utils"] = exchange_utils
+        sys.modules["http_client"] = http_client
+        sys.modules["signal_pool"] = signal_pool
+
+        pipeline_spec = importlib.util.spec_from_file_location("pipeline", MAIN_PATH.parent / "pipeline.py")
+        pipeline = importlib.util.module_from_spec(pipeline_spec)
+        pipeline_spec.loader.exec_module(pipeline)
+        sys.modules["pipeline"] = pipeline
+
+        scheduler_spec = importlib.util.spec_from_file_location("scheduler", MAIN_PATH.parent / "scheduler.py")
+        scheduler = importlib.util.module_from_spec(scheduler_spec)
+        scheduler_spec.loader.exec_module(scheduler)
+        sys.modules["scheduler"] = scheduler
         sys.modules["strategy_sig"] = strategy_sig
         sys.modules["notifier"] = notifier
         sys.modules["utils"] = utils
@@ -114,11 +168,12 @@ class MainStartupTests(unittest.TestCase):
                 events.append(("schedule.every", interval))
 
             @property
-            def minutes(self):
+            def seconds(self):
                 return self
 
-            def do(self, callback):
+            def do(self, callback, *args):
                 events.append(("schedule.do", callback))
+                events.append(("schedule.do.args", args))
                 return callback
 
         job_mock = mock.Mock(side_effect=lambda: events.append(("job", None)))
@@ -160,15 +215,102 @@ class MainStartupTests(unittest.TestCase):
         self.assertEqual(prepare_call["user_settings_file"], module.USER_SETTINGS_FILE)
         self.assertEqual(prepare_call["log_file"], module.LOG_FILE)
         self.assertEqual(prepare_call["legacy_base_dir"], module.BASE_DIR)
+        self.assertEqual(prepare_call["user_db_file"], module.USER_DB_FILE)
 
         file_handler_path = next(payload for name, payload in events if name == "logging.FileHandler")
         self.assertEqual(file_handler_path, module.LOG_FILE)
         self.assertIn(("send_telegram_message", "策略开始"), events)
         self.assertIn(("thread_start", None), events)
-        self.assertIn(("schedule.every", 60), events)
-        self.assertIn(("schedule.do", job_mock), events)
+        self.assertIn(("schedule.every", 1), events)
+        self.assertIn(("schedule.do", module.run_due_scans), events)
+        scheduler, scan = next(payload for name, payload in events if name == "schedule.do.args")
+        self.assertIs(scan, job_mock)
+        self.assertEqual(scheduler.timeframes, ["1h", "1d"])
+        self.assertEqual(scheduler.due_timeframes(), [])
         job_mock.assert_called_once_with()
 
+        # Yahoo日线按UTC零点收盘单独调度
+        yahoo_scheduler, yahoo_scan = [payload for name, payload in events if name == "schedule.do.args"][1]
+        self.assertIs(yahoo_scan, module.yahoo_job)
+        self.assertEqual(yahoo_scheduler.timeframes, ["1d"])
+        self.assertEqual(yahoo_scheduler.offsets, {"1h": 0, "1d": 0})
+        self.assertEqual(yahoo_scheduler.due_timeframes(), [])
+
+    def test_main_loop_shuts_down_signal_pool_on_exit(self):
+        module = self._load_main_module()
+
+        with mock.patch.object(module, "job"), \
+             mock.patch.object(module.threading, "Thread"), \
+             mock.patch.object(module, "configure_logging"), \
+             mock.patch.object(module.schedule, "run_pending", side_effect=KeyboardInterrupt), \
+             mock.patch.object(module, "shutdown_signal_pool") as shutdown:
+            with self.assertRaises(KeyboardInterrupt):
+                module.main()
+
+        shutdown.assert_called_once_with()
+
+    def test_yahoo_daily_checks_follow_yahoo_close_not_bitget_close(self):
+        module = self._load_main_module()
+        fetched, yahoo_checked = [], []
+        frame = pd.DataFrame({"timestamp": [1], "open": [1.0], "high": [1.0], "low": [1.0], "close": [1.0], "volume": [1.0]})
+
+        def get_data(symbol, timeframe, limit):
+            fetched.append(timeframe)
+            return frame
+
+        def check_turtle_signal(symbol, timeframe):
+            yahoo_checked.append(timeframe)
+            return []
+
+        with mock.patch.object(module, "get_all_usdt_swap_symbols", return_value=["BTC/USDT:USDT"]), \
+             mock.patch.object(module, "get_data", side_effect=get_data), \
+             mock.patch.object(module, "check_turtle_signal", side_effect=check_turtle_signal):
+            # Bitget日线收盘（UTC 16点）：只抓取Bitget K线，不在Yahoo日线中途做Yahoo检测
+            module.job(["1h", "1d"])
+            self.assertEqual(sorted(fetched), ["1d", "1h"])
+            self.assertEqual(yahoo_checked, ["1h"])
+
+            # Yahoo日线收盘（UTC 0点）：只做Yahoo检测，不抓取Bitget
+            fetched.clear()
+            yahoo_checked.clear()
+            module.yahoo_job(["1d"])
+            self.assertEqual(fetched, [])
+            self.assertEqual(yahoo_checked, ["1d"])
+
+            # 启动时的全量扫描包含全部检测
+            fetched.clear()
+            yahoo_checked.clear()
+            module.job()
+            self.assertEqual(sorted(fetched), ["1d", "1h"])
+            self.assertEqual(sorted(yahoo_checked), ["1d", "1h"])
+
+    def test_traced_job_writes_stage_and_unit_spans(self):
+        module = self._load_main_module()
+        pairs_seen = []
+
+        def get_data(symbol, timeframe, limit):
+            pairs_seen.append((symbol, timeframe))
+            return pd.DataFrame()
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             mock.patch.object(module, "TRACE_ENABLED", True), \
+             mock.patch.object(module, "TRACE_DIR", tmpdir), \
+             mock.patch.object(module, "get_all_usdt_swap_symbols", return_value=["BTC/USDT:USDT", "ETH/USDT:USDT"]), \
+             mock.patch.object(module, "get_data", side_effect=get_data):
+            module.job()
+            trace_files = os.listdir(tmpdir)
+            self.assertEqual(len(trace_files), 1)
+            with open(os.path.join(tmpdir, trace_files[0]), encoding="utf-8") as f:
+                trace = json.load(f)
+
+        spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        names = {event["name"] for event in spans}
+        self.assertTrue({"scan", "warmup_connection", "load_contracts", "prefetch_yahoo_data", "fetch_all", "finish_notify"} <= names)
+        fetched = sorted((event["args"]["symbol"], event["args"]["timeframe"]) for event in spans if event["name"] == "fetch")
+        self.assertEqual(fetched, sorted(pairs_seen))
+        self.assertEqual(len([event for event in spans if event["name"] == "compute"]), len(pairs_seen))
+        self.assertTrue(all({"ts", "dur", "pid", "tid"} <= set(event) for event in spans))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import sys
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from metrics import CONTENT_TYPE, Registry, start_metrics_server
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_counters_and_gauges_render_in_prometheus_text_format(self):
+        registry = Registry()
+        sends = registry.counter("ltt_test_sends_total", "发送次数", ("result",))
+        last = registry.gauge("ltt_test_last_seconds", "最近耗时")
+
+        sends.inc(result="ok")
+        sends.inc(2, result="ok")
+        sends.inc(result='fa"il')
+        last.set(1.5)
+
+        text = registry.render()
+        self.assertIn("# HELP ltt_test_sends_total 发送次数\n# TYPE ltt_test_sends_total counter\n", text)
+        self.assertIn('ltt_test_sends_total{result="ok"} 3\n', text)
+        self.assertIn('ltt_test_sends_total{result="fa\\"il"} 1\n', text)
+        self.assertIn("# TYPE ltt_test_last_seconds gauge\nltt_test_last_seconds 1.5\n", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.histogram("ltt_test_latency_seconds", "耗时", ("endpoint",), buckets=(0.1, 1))
+
+        for value in (0.05, 0.5, 0.7, 3):
+            latency.observe(value, endpoint="/candles")
+
+        text = registry.render()
+        self.assertIn('ltt_test_latency_seconds_bucket{endpoint="/candles",le="0.1"} 1\n', text)
+        self.assertIn('ltt_test_latency_seconds_bucket{endpoint="/candles",le="1"} 3\n', text)
+        self.assertIn('ltt_test_latency_seconds_bucket{endpoint="/candles",le="+Inf"} 4\n', text)
+        self.assertIn('ltt_test_latency_seconds_sum{endpoint="/candles"} 4.25\n', text)
+        self.assertIn('ltt_test_latency_seconds_count{endpoint="/candles"} 4\n', text)
+        self.assertEqual(latency.count(endpoint="/candles"), 4)
+
+    def test_wrong_labels_and_duplicate_names_are_rejected(self):
+        registry = Registry()
+        counter = registry.counter("ltt_test_total", "计数", ("type",))
+
+        with self.assertRaises(ValueError):
+            counter.inc(timeframe="1h")
+        with self.assertRaises(ValueError):
+            registry.counter("ltt_test_total", "重复")
+
+    def test_server_exposes_registry_on_metrics_path(self):
+        registry = Registry()
+        registry.counter("ltt_test_scans_total", "扫描次数").inc()
+        server = start_metrics_server("127.0.0.1", 0, registry)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as resp:
+            self.assertEqual(resp.headers["Content-Type"], CONTENT_TYPE)
+            body = resp.read().decode("utf-8")
+        self.assertIn("ltt_test_scans_total 1\n", body)
+
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(f"http://{host}:{port}/", timeout=5)
+        self.assertEqual(ctx.exception.code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
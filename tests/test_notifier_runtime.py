@@ -2,6 +2,8 @@ import importlib.util
 import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest import mock
@@ -12,14 +14,23 @@ sys.path.insert(0, str(REPO_ROOT))
 
 CONFIG_PATH = REPO_ROOT / "config.py"
 NOTIFIER_PATH = REPO_ROOT / "notifier.py"
+STORE_MODULES = {"user_store": "_store", "outbox": "_outbox"}
 
 
 class NotifierRuntimeTests(unittest.TestCase):
-    def _load_modules(self, data_dir):
+    def _load_modules(self, data_dir, env=None):
         previous_config = sys.modules.pop("config", None)
         previous_notifier = sys.modules.pop("notifier", None)
+        # 用户库与发件箱在导入时读取配置中的文件路径，每个测试重新加载
+        previous_stores = {name: sys.modules.pop(name, None) for name in STORE_MODULES}
 
         def restore_modules():
+            for name, attribute in STORE_MODULES.items():
+                module = sys.modules.pop(name, None)
+                if module is not None and getattr(module, attribute) is not None:
+                    getattr(module, attribute).close()
+                if previous_stores[name] is not None:
+                    sys.modules[name] = previous_stores[name]
             sys.modules.pop("notifier", None)
             sys.modules.pop("config", None)
             if previous_config is not None:
@@ -29,7 +40,7 @@ class NotifierRuntimeTests(unittest.TestCase):
 
         self.addCleanup(restore_modules)
 
-        env_patcher = mock.patch.dict(os.environ, {"DATA_DIR": data_dir}, clear=True)
+        env_patcher = mock.patch.dict(os.environ, {"DATA_DIR": data_dir, **(env or {})}, clear=True)
         env_patcher.start()
         self.addCleanup(env_patcher.stop)
 
@@ -48,28 +59,322 @@ class NotifierRuntimeTests(unittest.TestCase):
         notifier_spec.loader.exec_module(notifier_module)
         return config_module, notifier_module
 
-    def test_allowed_user_persistence_uses_configured_allowed_users_file(self):
+    def test_user_persistence_uses_configured_user_db(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             config, notifier = self._load_modules(tmpdir)
-            allowed_users_path = Path(config.ALLOWED_USERS_FILE)
+            db_path = Path(config.USER_DB_FILE)
 
-            self.assertEqual(allowed_users_path, Path(tmpdir) / "allowed_users.txt")
-            self.assertFalse(allowed_users_path.exists())
+            self.assertEqual(db_path, Path(tmpdir) / "users.db")
+            self.assertFalse(db_path.exists())
 
             notifier.safe_write_user("1001")
             notifier.safe_write_user("1002")
+            notifier.update_user_settings("1002", "timeframes", "1d")
 
-            self.assertTrue(allowed_users_path.exists())
+            self.assertTrue(db_path.exists())
             self.assertEqual(notifier.load_allowed_users(), {"1001", "1002"})
+            self.assertTrue(notifier.remove_user("1001"))
+            self.assertFalse(notifier.remove_user("1001"))
+            self.assertFalse(Path(config.ALLOWED_USERS_FILE).exists())
+            self.assertFalse(Path(config.USER_SETTINGS_FILE).exists())
+
+            # 新连接（模拟进程重启）读到的是同样的数据
+            store = sys.modules["user_store"].UserStore(str(db_path))
+            self.addCleanup(store.close)
+            self.assertEqual(store.list_users(), {"1002"})
+            self.assertEqual(store.get_settings("1002")["enabled_timeframes"], ["1d"])
+            self.assertIsNone(store.get_settings("1001"))
+            self.assertEqual(notifier.get_user_settings("1001"), config.DEFAULT_USER_SETTINGS)
+
+    def test_user_store_imports_legacy_files_once_and_persists_lockouts(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir)
+            user_store = sys.modules["user_store"]
+            allowed_users_path = Path(tmpdir) / "allowed_users.txt"
+            user_settings_path = Path(tmpdir) / "user_settings.json"
+            allowed_users_path.write_text("1001\n1002\n\n1001\n", encoding="utf-8")
+            user_settings_path.write_text(
+                '{"1002": {"enabled_timeframes": ["4h"], "enabled_signals": []}, "broken": true}',
+                encoding="utf-8",
+            )
+
+            store = user_store.UserStore(str(Path(tmpdir) / "users.db"))
+            self.addCleanup(store.close)
+            self.assertTrue(store.import_legacy_files(str(allowed_users_path), str(user_settings_path)))
+            allowed_users_path.write_text("9999\n", encoding="utf-8")
+            self.assertFalse(store.import_legacy_files(str(allowed_users_path), str(user_settings_path)))
+
+            self.assertEqual(store.list_users(), {"1001", "1002"})
+            self.assertEqual(store.all_settings(), {"1002": {"enabled_timeframes": ["4h"], "enabled_signals": []}})
+            self.assertEqual(notifier.get_signal_subscribers("4h", "turtle_buy"), {"1001"})
+
+            store.set_lockout("2001", 3, 1000.0)
+            store.set_lockout("2002", 1, 1000.0)
+            store.clear_lockout("2002")
+            store.close()
+            self.assertEqual(store.get_lockout("2001"), (3, 1000.0))
+            self.assertIsNone(store.get_lockout("2002"))
+
+    def test_signal_routing_uses_index_rebuilt_only_on_changes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir)
+            notifier.safe_write_user("1001")
+            notifier.safe_write_user("1002")
+            notifier.update_user_settings("1002", "timeframes", "1d")
+            sent = []
+            signal = {"type": "turtle_buy", "timeframe": "1h", "symbol": "BTC"}
+
+            with mock.patch.object(notifier, "load_user_settings", wraps=notifier.load_user_settings) as load_settings, \
+                 mock.patch.object(notifier, "format_signal", return_value="msg"), \
+                 mock.patch.object(notifier, "send_to_target_users_concurrent", side_effect=lambda users, msg: sent.append(sorted(users))):
+                for _ in range(5):
+                    notifier.handle_signals(signal, rsi6_signals=[])
+                self.assertEqual(load_settings.call_count, 1)
+
+                notifier.update_user_settings("1002", "timeframes", "1h,1d")
+                notifier.handle_signals(signal, rsi6_signals=[])
+                notifier.remove_user("1001")
+                notifier.handle_signals(signal, rsi6_signals=[])
+                notifier.update_user_settings("1002", "signals", "five_down")
+                notifier.handle_signals(signal, rsi6_signals=[])
+
+            self.assertEqual(sent, [["1001"]] * 5 + [["1001", "1002"], ["1002"]])
+            for user_id in ("1001", "1002"):
+                expected = notifier.should_send_signal(user_id, signal) and user_id in notifier.load_allowed_users()
+                self.assertEqual(user_id in notifier.get_signal_subscribers("1h", "turtle_buy"), expected)
+
+    def test_send_message_honors_retry_after_and_retries_server_errors(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {
+                "TG_BOT_TOKEN": "token",
+                "TG_CHAT_RATE_LIMIT": "0",
+                "TG_GLOBAL_RATE_LIMIT": "0",
+                "TG_RETRY_BACKOFF": "0.5",
+            })
+
+            def response(status_code, payload):
+                return mock.Mock(status_code=status_code, json=mock.Mock(return_value=payload), text=str(payload))
+
+            responses = [
+                response(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 7}}),
+                response(502, {"ok": False}),
+                response(200, {"ok": True}),
+            ]
+            sleeps = []
+            with mock.patch.object(notifier, "http_post", side_effect=responses) as post, \
+                 mock.patch.object(notifier.time, "sleep", side_effect=sleeps.append):
+                self.assertTrue(notifier.send_message("1001", "hello"))
+
+            self.assertEqual(post.call_count, 3)
+            self.assertAlmostEqual(sleeps[0], 7, delta=0.5)  # 429后全局暂停retry_after秒
+            self.assertEqual(sleeps[1], 0.5)  # 429不计入重试次数，首次5xx按初始退避
+
+            limited = [response(429, {"ok": False, "parameters": {"retry_after": 1}})] * 8 + [response(200, {"ok": True})]
+            with mock.patch.object(notifier, "TG_SEND_MAX_RETRIES", 1), \
+                 mock.patch.object(notifier, "http_post", side_effect=limited) as post, \
+                 mock.patch.object(notifier.time, "sleep"):
+                self.assertTrue(notifier.send_message("1001", "hello"))  # 连续429不会耗尽重试次数
+            self.assertEqual(post.call_count, 9)
+
+            with mock.patch.object(notifier, "http_post", return_value=response(400, {"ok": False, "description": "bad"})) as post, \
+                 mock.patch.object(notifier.time, "sleep"):
+                self.assertFalse(notifier.send_message("1001", "hello"))
+            self.assertEqual(post.call_count, 1)
+
+    def test_per_chat_limit_paces_repeated_messages_to_one_chat(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {"TG_CHAT_RATE_LIMIT": "20", "TG_GLOBAL_RATE_LIMIT": "0"})
+            start = time.monotonic()
+            for _ in range(4):
+                notifier._wait_send_slot("1001")
+            notifier._wait_send_slot("1002")
+            # 同一聊天第2~4条各等1/20秒，其他聊天不受影响
+            self.assertGreaterEqual(time.monotonic() - start, 0.14)
+            self.assertEqual(set(notifier._chat_send_buckets), {"1001", "1002"})
+
+    def test_digest_sends_one_message_per_user_split_at_record_boundaries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {"OUTBOX_ENABLED": "false"})
+            notifier.safe_write_user("1001")
+            notifier.safe_write_user("1002")
+            notifier.update_user_settings("1002", "signals", "five_down")
+            digest = notifier.SignalDigest()
+            signals = [
+                {"type": "five_down", "timeframe": "1h", "symbol": f"S{i}", "time": "-",
+                 "closes": [1.0] * 5, "opens": [2.0] * 5}
+                for i in range(40)
+            ] + [{"type": "turtle_buy", "timeframe": "1h", "symbol": "BTC", "time": "-",
+                  "open": 1, "close": 2, "ma200": 1, "mid": 1}]
+
+            sent = []
+            with mock.patch.object(notifier, "send_message", side_effect=lambda user_id, text: sent.append((user_id, text)) or True), \
+                 mock.patch.object(notifier, "send_to_target_users_concurrent") as send_now:
+                for sig in signals:
+                    notifier.handle_signals(sig, rsi6_signals=[], digest=digest)
+                send_now.assert_not_called()
+                self.assertEqual(digest.flush(), len(sent))
+                self.assertEqual(digest.flush(), 0)
+
+            by_user = {}
+            for user_id, text in sent:
+                self.assertLessEqual(len(text), notifier.MAX_MSG_LEN)
+                by_user.setdefault(user_id, []).append(text)
+            self.assertGreater(len(by_user["1001"]), 1)
+            self.assertLess(len(by_user["1001"]), len(signals))
+            self.assertEqual("\n".join(by_user["1001"]).count("[五连阴]"), 40)
+            self.assertEqual("\n".join(by_user["1001"]).count("[海龟交易法]"), 1)
+            self.assertNotIn("[海龟交易法]", "\n".join(by_user["1002"]))
+            # 每条消息都以完整记录开头，记录不会被拆到两条消息里
+            for text in by_user["1001"][1:]:
+                self.assertTrue(text.startswith("["))
+
+    def test_outbox_persists_signals_until_delivery_is_acknowledged(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, notifier = self._load_modules(tmpdir)
+            outbox_module = sys.modules["outbox"]
+            notifier.send_to_target_users_concurrent(["1001", "1002"], "signal")
+            notifier.send_to_target_users_concurrent(["1001"], "second")
+
+            # 模拟进程重启：新的连接读到全部未确认消息，且按入队顺序
+            outbox = outbox_module.Outbox(config.OUTBOX_FILE, retry_base=60)
+            self.addCleanup(outbox.close)
             self.assertEqual(
-                allowed_users_path.read_text(encoding="utf-8").splitlines(),
-                ["1001", "1002"],
+                [(chat_id, text) for _, chat_id, text, _ in outbox.due()],
+                [("1001", "signal"), ("1002", "signal"), ("1001", "second")],
             )
 
-            self.assertTrue(notifier.remove_user("1001"))
-            self.assertEqual(notifier.load_allowed_users(), {"1002"})
-            self.assertEqual(allowed_users_path.read_text(encoding="utf-8"), "1002\n")
-            self.assertFalse((Path(tmpdir).parent / "allowed_users.txt").exists())
+            results = {"1001": True, "1002": None}
+            delivered = []
+            send = lambda chat_id, text: delivered.append((chat_id, text)) or results[chat_id]
+            self.assertEqual(outbox.drain(send), 3)
+            # 1002 暂时无法送达：保留并推迟重试，其余已确认删除
+            self.assertEqual(outbox.pending_count(), 1)
+            self.assertEqual(outbox.due(), [])
+            self.assertGreater(outbox.next_due_in(), 50)
+
+            _, chat_id, text, attempts = outbox.due(now=time.time() + 61)[0]
+            self.assertEqual((chat_id, text, attempts), ("1002", "signal", 1))
+            results["1002"] = False  # 确认无法送达（如用户屏蔽机器人）也会确认删除
+            with mock.patch.object(outbox_module.time, "time", return_value=time.time() + 61):
+                self.assertEqual(outbox.drain(send), 1)
+            self.assertEqual(outbox.pending_count(), 0)
+            self.assertEqual(len(delivered), 4)
+
+    def test_outbox_loop_sends_messages_enqueued_while_draining_without_idle_wait(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, _ = self._load_modules(tmpdir)
+            outbox = sys.modules["outbox"].Outbox(config.OUTBOX_FILE)
+            self.addCleanup(outbox.close)
+            stop_event = threading.Event()
+            delivered = []
+            done = threading.Event()
+
+            def send(chat_id, text):
+                delivered.append(text)
+                if text == "first":
+                    # 发送过程中又有新消息入队
+                    outbox.enqueue([("1001", "second")])
+                else:
+                    done.set()
+                return True
+
+            outbox.enqueue([("1001", "first")])
+            worker = threading.Thread(target=outbox.run, args=(send,), kwargs={"stop_event": stop_event, "idle_interval": 30})
+            worker.start()
+            self.addCleanup(worker.join, 5)
+            self.addCleanup(outbox._wakeup.set)
+            self.addCleanup(stop_event.set)
+
+            self.assertTrue(done.wait(2))
+            self.assertEqual(delivered, ["first", "second"])
+
+            # 空闲等待中入队的消息立即发送，不等 idle_interval
+            done.clear()
+            time.sleep(0.1)
+            outbox.enqueue([("1001", "third")])
+            self.assertTrue(done.wait(2))
+            self.assertEqual(delivered, ["first", "second", "third"])
+
+    def test_sends_share_one_long_lived_sender_pool(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {"OUTBOX_ENABLED": "false", "TG_SEND_WORKERS": "3"})
+            notifier.safe_write_user("1001")
+            notifier.safe_write_user("1002")
+            threads = set()
+
+            def fake_send(chat_id, text):
+                threads.add(threading.current_thread().name)
+                return chat_id != "1002"
+
+            with mock.patch.object(notifier, "send_message", side_effect=fake_send), \
+                 mock.patch.object(notifier, "send_plain_message", side_effect=fake_send):
+                for i in range(10):
+                    notifier.send_to_target_users_concurrent([f"{i}-{j}" for j in range(5)], "signal")
+                notifier.send_to_allowed_users("broadcast")
+                notifier.send_pinned_message_to_all("pin")
+                future = notifier.get_telegram_sender().send("1002", "single")
+                self.assertFalse(future.result(timeout=5))
+                self.assertEqual(notifier.get_telegram_sender().send_many([("1001", "a"), ("1002", "b")]), (1, 1))
+
+            sender = notifier.get_telegram_sender()
+            self.addCleanup(sender.shutdown)
+            self.assertIs(sender, notifier.get_telegram_sender())
+            self.assertLessEqual(len(threads), 3)
+            self.assertTrue(all(name.startswith("tg_send") for name in threads))
+
+    def test_monitor_long_polls_without_sleeping_and_dispatches_updates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {"TG_BOT_TOKEN": "token"})
+
+            class StopPolling(BaseException):
+                pass
+
+            def update(update_id, user_id, text):
+                return {"update_id": update_id, "message": {"from": {"id": user_id}, "text": text}}
+
+            batches = [
+                {"ok": True, "result": [update(5, 1001, "hi"), update(6, 1002, "hi")]},
+                {"ok": True, "result": []},
+                {"ok": True, "result": [update(7, 1001, "pw")]},
+            ]
+            calls = []
+
+            def fake_get(url, params=None, timeout=None):
+                calls.append((dict(params), timeout))
+                if not batches:
+                    raise StopPolling()
+                return mock.Mock(json=mock.Mock(return_value=batches.pop(0)))
+
+            with mock.patch.object(notifier, "http_get", side_effect=fake_get), \
+                 mock.patch.object(notifier, "_call_bot_api") as call_bot_api, \
+                 mock.patch.object(notifier, "dispatch_update") as dispatch, \
+                 mock.patch.object(notifier.time, "sleep", side_effect=AssertionError("long polling must not sleep")):
+                with self.assertRaises(StopPolling):
+                    notifier.monitor_new_users()
+
+            self.assertEqual([params.get("offset") for params, _ in calls], [None, 7, 7, 8])
+            self.assertTrue(all(params["timeout"] == 50 and timeout > 50 for params, timeout in calls))
+            self.assertEqual([call.args[0]["update_id"] for call in dispatch.call_args_list], [5, 6, 7])
+            call_bot_api.assert_called_once_with("deleteWebhook", {"drop_pending_updates": "false"})
+
+    def test_handle_update_runs_subscription_flow_on_per_user_lanes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, notifier = self._load_modules(tmpdir, {"SUBSCRIBE_PASSWORD": "secret", "TG_CHAT_ID": "1"})
+            replies = []
+
+            def update(user_id, text):
+                return {"update_id": 0, "message": {"from": {"id": user_id}, "text": text}}
+
+            with mock.patch.object(notifier, "send_message", side_effect=lambda chat_id, text: replies.append((chat_id, text))), \
+                 mock.patch.object(notifier, "send_telegram_message"):
+                futures = [notifier.dispatch_update(update(1001, text)) for text in ("hi", "wrong", "secret", "/set_timeframes 1d")]
+                for future in futures:
+                    future.result(timeout=5)
+
+            self.assertEqual(notifier.load_allowed_users(), {"1001"})
+            self.assertEqual(notifier.get_user_settings("1001")["enabled_timeframes"], ["1d"])
+            self.assertIsNone(notifier.get_user_store().get_lockout("1001"))
+            self.assertEqual([text for _, text in replies][:2], ["请输入订阅密码：", "密码错误，请重新输入订阅密码："])
 
 
 if __name__ == "__main__":
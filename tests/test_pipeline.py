@@ -0,0 +1,79 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from pipeline import ScanPipeline
+
+
+class ScanPipelineTests(unittest.TestCase):
+    def test_every_frame_is_computed_and_every_signal_notified(self):
+        notified = []
+        pipeline = ScanPipeline(
+            compute=lambda item: [f"{item[0]}-{item[1]}"],
+            notify=notified.append,
+            compute_workers=2,
+            notify_workers=2,
+            queue_size=3,
+        )
+        pairs = [(f"C{i}", tf) for i in range(20) for tf in ("1h", "4h")]
+
+        pipeline.fetch(pairs, lambda symbol, tf: (symbol, tf, None), workers=4)
+        pipeline.finish_compute()
+        pipeline.submit_signal("batch")
+        pipeline.finish()
+
+        self.assertEqual(sorted(notified), sorted([f"{s}-{tf}" for s, tf in pairs] + ["batch"]))
+
+    def test_slow_notify_does_not_stall_fetching(self):
+        release = threading.Event()
+        fetched = []
+        pipeline = ScanPipeline(
+            compute=lambda item: [item[0]] if item[0] == "C0" else [],
+            notify=lambda sig: release.wait(5),
+            compute_workers=1,
+            notify_workers=1,
+            queue_size=2,
+        )
+
+        start = time.monotonic()
+        pipeline.fetch([(f"C{i}", "1h") for i in range(30)], lambda s, tf: fetched.append(s) or (s, tf, None), workers=2)
+        pipeline.finish_compute()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(len(fetched), 30)
+
+        release.set()
+        pipeline.finish()
+
+    def test_full_compute_queue_applies_backpressure_to_fetch(self):
+        release = threading.Event()
+        fetched = []
+        pipeline = ScanPipeline(
+            compute=lambda item: release.wait(5) and [],
+            notify=lambda sig: None,
+            compute_workers=1,
+            notify_workers=1,
+            queue_size=2,
+        )
+        fetcher = threading.Thread(
+            target=pipeline.fetch,
+            args=([(f"C{i}", "1h") for i in range(30)], lambda s, tf: fetched.append(s) or (s, tf, None), 2),
+        )
+        fetcher.start()
+        time.sleep(0.3)
+
+        # 1个在计算 + 计算队列2个 + 每个抓取线程各卡住1个
+        self.assertLessEqual(len(fetched), 1 + 2 + 2)
+        release.set()
+        fetcher.join(5)
+        pipeline.finish()
+        self.assertEqual(len(fetched), 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules  # noqa: E402
+
+from utils import TokenBucket
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils")
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_is_free_then_requests_are_paced_at_rate(self):
+        bucket = TokenBucket(rate=50, capacity=2)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 1 / 50, delta=0.005)
+        self.assertAlmostEqual(bucket.reserve(), 2 / 50, delta=0.005)
+
+    def test_acquire_blocks_until_token_is_available(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+
+class BitgetRateLimiterTests(unittest.TestCase):
+    def _load_exchange_utils(self, env):
+        load_repo_modules(self, MODULE_NAMES, env)
+        return sys.modules["config"], sys.modules["exchange_utils"]
+
+    def test_each_endpoint_has_its_own_configured_bucket(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config, exchange_utils = self._load_exchange_utils({
+                "DATA_DIR": tmpdir,
+                "BITGET_CANDLES_RATE_LIMIT": "15",
+            })
+
+            self.assertEqual(config.BITGET_RATE_LIMITS["candles"], 15.0)
+            self.assertEqual(exchange_utils._rate_limiters["candles"].rate, 15.0)
+            self.assertEqual(exchange_utils._rate_limiters["contracts"].rate, 20.0)
+            self.assertIsNot(
+                exchange_utils._get_rate_limiter("/api/v2/mix/market/candles"),
+                exchange_utils._get_rate_limiter("/api/v2/mix/market/contracts"),
+            )
+
+    def test_bitget_get_acquires_token_before_request(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir})
+            events = []
+            response = mock.Mock()
+            response.json.return_value = {"code": "00000", "data": [["1"]]}
+
+            with mock.patch.object(exchange_utils._rate_limiters["candles"], "acquire", side_effect=lambda: events.append("acquire")), \
+                 mock.patch.object(exchange_utils, "http_get", side_effect=lambda *a, **k: events.append("get") or response):
+                data = exchange_utils._bitget_get("/api/v2/mix/market/candles", {"symbol": "BTCUSDT"})
+
+            self.assertEqual(data, [["1"]])
+            self.assertEqual(events, ["acquire", "get"])
+
+    def test_bitget_get_records_latency_and_rate_limit_waits(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir})
+            path = "/api/v2/mix/market/tickers"
+            waits = exchange_utils.BITGET_RATE_LIMIT_WAITS.value(endpoint=path)
+            ok = exchange_utils.BITGET_REQUEST_DURATION.count(endpoint=path, status="ok")
+            errors = exchange_utils.BITGET_REQUEST_DURATION.count(endpoint=path, status="error")
+            response = mock.Mock()
+            response.json.side_effect = [
+                {"code": "00000", "data": []},
+                {"code": "429", "msg": "rate limit"},
+            ]
+
+            with mock.patch.object(exchange_utils._rate_limiters["tickers"], "acquire", side_effect=[0.0, 0.25]), \
+                 mock.patch.object(exchange_utils, "http_get", return_value=response):
+                exchange_utils._bitget_get(path)
+                with self.assertRaises(ValueError):
+                    exchange_utils._bitget_get(path)
+
+            self.assertEqual(exchange_utils.BITGET_RATE_LIMIT_WAITS.value(endpoint=path), waits + 1)
+            self.assertEqual(exchange_utils.BITGET_REQUEST_DURATION.count(endpoint=path, status="ok"), ok + 1)
+            self.assertEqual(exchange_utils.BITGET_REQUEST_DURATION.count(endpoint=path, status="error"), errors + 1)
+
+    def test_candle_retries_are_counted_by_reason(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, exchange_utils = self._load_exchange_utils({"DATA_DIR": tmpdir})
+            retries = exchange_utils.BITGET_RETRIES.value(timeframe="4h", reason="rate_limit")
+            failures = exchange_utils.BITGET_FAILURES.value(timeframe="4h", reason="exchange")
+
+            error = ValueError("Bitget API错误 429: rate limit")
+            self.assertEqual(exchange_utils._candle_retry_delay("BTC/USDT:USDT", "4h", error, 0, 5), 3)
+            self.assertIsNone(exchange_utils._candle_retry_delay("BTC/USDT:USDT", "4h", ValueError("参数错误"), 0, 5))
+
+            self.assertEqual(exchange_utils.BITGET_RETRIES.value(timeframe="4h", reason="rate_limit"), retries + 1)
+            self.assertEqual(exchange_utils.BITGET_FAILURES.value(timeframe="4h", reason="exchange"), failures + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
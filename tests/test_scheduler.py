@@ -0,0 +1,71 @@
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import scheduler
+from scheduler import CandleCloseScheduler, latest_close, run_due_scans, run_stream_scans
+
+OFFSETS = {"1d": 16 * 60 * 60}
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class CandleCloseSchedulerTests(unittest.TestCase):
+    def test_latest_close_is_aligned_to_utc_and_daily_offset(self):
+        now = utc(2024, 3, 5, 13, 47, 12)
+
+        self.assertEqual(latest_close("1h", now), utc(2024, 3, 5, 13))
+        self.assertEqual(latest_close("4h", now), utc(2024, 3, 5, 12))
+        self.assertEqual(latest_close("1d", now, OFFSETS), utc(2024, 3, 4, 16))
+        self.assertEqual(latest_close("1d", utc(2024, 3, 5, 16), OFFSETS), utc(2024, 3, 5, 16))
+
+    def test_only_timeframes_that_just_closed_are_due_after_grace(self):
+        sched = CandleCloseScheduler(["1h", "4h", "1d"], grace_seconds=30, offsets=OFFSETS)
+        sched.mark_scanned(["1h", "4h", "1d"], now=utc(2024, 3, 5, 11, 5))
+
+        self.assertEqual(sched.due_timeframes(utc(2024, 3, 5, 12, 0, 10)), [])
+        self.assertEqual(sched.due_timeframes(utc(2024, 3, 5, 12, 0, 30)), ["1h", "4h"])
+        sched.mark_scanned(["1h", "4h"], now=utc(2024, 3, 5, 12, 0, 30))
+        self.assertEqual(sched.due_timeframes(utc(2024, 3, 5, 12, 59)), [])
+        self.assertEqual(sched.due_timeframes(utc(2024, 3, 5, 13, 1)), ["1h"])
+        self.assertEqual(sched.due_timeframes(utc(2024, 3, 5, 16, 1)), ["1h", "4h", "1d"])
+        self.assertEqual(sched.next_run(utc(2024, 3, 5, 12, 0, 30)), utc(2024, 3, 5, 13, 0, 30))
+
+    def test_run_due_scans_scans_due_timeframes_once(self):
+        sched = CandleCloseScheduler(["1h", "4h"], grace_seconds=30)
+        sched.mark_scanned(["1h", "4h"], now=utc(2024, 3, 5, 10, 30))
+        scan = mock.Mock()
+
+        with mock.patch.object(scheduler.time, "time", return_value=utc(2024, 3, 5, 11, 0, 45)):
+            run_due_scans(sched, scan)
+            run_due_scans(sched, scan)
+
+        scan.assert_called_once_with(["1h"])
+
+    def test_stream_close_scans_immediately_and_suppresses_timer_scan(self):
+        sched = CandleCloseScheduler(["1h", "4h"], grace_seconds=30)
+        sched.mark_scanned(["1h", "4h"], now=utc(2024, 3, 5, 10, 30))
+        stream = mock.Mock()
+        stream.pop_closed_timeframes.side_effect = [["1h"], []]
+        scan = mock.Mock()
+
+        with mock.patch.object(scheduler.time, "time", return_value=utc(2024, 3, 5, 11, 0, 3)):
+            run_stream_scans(stream, sched, scan, settle_seconds=3)
+        with mock.patch.object(scheduler.time, "time", return_value=utc(2024, 3, 5, 11, 0, 31)):
+            run_stream_scans(stream, sched, scan, settle_seconds=3)
+            run_due_scans(sched, scan)
+
+        scan.assert_called_once_with(["1h"])
+        stream.pop_closed_timeframes.assert_called_with(3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import multiprocessing
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules, make_data_dir  # noqa: E402
+sys.path.insert(0, str(REPO_ROOT / "tests"))
+
+from test_indicator_engine import make_candles
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils", "indicator_engine", "strategy_sig", "signal_pool")
+
+
+class SignalPoolTests(unittest.TestCase):
+    def setUp(self):
+        data_dir = make_data_dir(self)
+        load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir, "SIGNAL_PROCESS_WORKERS": "2"})
+        self.strategy_sig = sys.modules["strategy_sig"]
+        self.signal_pool = sys.modules["signal_pool"]
+
+    def test_process_pool_matches_in_process_batch(self):
+        frames = {}
+        for i in range(9):
+            df = make_candles(260 - i * 15, seed=40 + i)
+            if i % 2 == 0:
+                df.loc[df.index[-15:], "close"] = df["close"].iloc[-16] * np.cumprod(np.full(15, 0.95))
+                df.loc[df.index[-15:], "open"] = df["close"].iloc[-15:] * 1.01
+            frames[f"C{i}/USDT:USDT"] = df
+        extra = {"C2/USDT:USDT", "C4/USDT:USDT"}
+
+        expected = self.strategy_sig.check_signals_batch("4h", frames, extra_signal_symbols=extra)
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as executor:
+            actual = self.signal_pool.evaluate_signals_in_processes("4h", frames, extra_signal_symbols=extra, executor=executor)
+
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(
+            [(sig["type"], sig["symbol"], sig["time"]) for sig in actual],
+            [(sig["type"], sig["symbol"], sig["time"]) for sig in expected],
+        )
+        for got, want in zip(actual, expected):
+            self.assertEqual(got.keys(), want.keys())
+            if "rsi6" in want:
+                self.assertAlmostEqual(got["rsi6"], want["rsi6"], places=9)
+
+    def test_empty_universe_does_not_start_pool(self):
+        with mock.patch.object(self.signal_pool, "get_signal_pool") as get_pool:
+            self.assertEqual(self.signal_pool.evaluate_signals_in_processes("1h", {"X/USDT:USDT": make_candles(10)}), [])
+        get_pool.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
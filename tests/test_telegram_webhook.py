@@ -0,0 +1,85 @@
+import json
+import sys
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from telegram_webhook import SECRET_HEADER, start_webhook_server
+
+WEBHOOK_PATH = "/telegram/webhook"
+SECRET = "s3cret"
+
+
+class FakeTelegram:
+    """本地模拟Telegram：像Telegram服务器一样把更新POST到webhook地址"""
+
+    def __init__(self, url, secret):
+        self.url = url
+        self.secret = secret
+        self.update_id = 0
+
+    def post(self, body, secret=None, path=None):
+        url = self.url if path is None else self.url.rsplit("/", 2)[0] + path
+        request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        if secret is not None:
+            request.add_header(SECRET_HEADER, secret)
+        try:
+            with urllib.request.urlopen(request, timeout=5) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def send_message(self, user_id, text, secret=None):
+        self.update_id += 1
+        update = {"update_id": self.update_id, "message": {"from": {"id": user_id}, "text": text}}
+        return self.post(json.dumps(update).encode(), self.secret if secret is None else secret)
+
+
+class TelegramWebhookTests(unittest.TestCase):
+    def _start_server(self):
+        self.updates = []
+        self.received = threading.Event()
+
+        def dispatch(update):
+            self.updates.append(update)
+            self.received.set()
+
+        server = start_webhook_server(dispatch, "127.0.0.1", 0, WEBHOOK_PATH, SECRET)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address[:2]
+        return FakeTelegram(f"http://{host}:{port}{WEBHOOK_PATH}", SECRET)
+
+    def test_verified_updates_are_dispatched(self):
+        telegram = self._start_server()
+
+        self.assertEqual(telegram.send_message(1001, "/settings"), 200)
+        self.assertEqual(telegram.send_message(1002, "hi"), 200)
+
+        self.assertTrue(self.received.wait(5))
+        self.assertEqual([update["update_id"] for update in self.updates], [1, 2])
+        self.assertEqual(self.updates[0]["message"]["text"], "/settings")
+
+    def test_rejects_bad_secret_path_and_body(self):
+        telegram = self._start_server()
+
+        self.assertEqual(telegram.send_message(1001, "hi", secret="wrong"), 403)
+        self.assertEqual(telegram.post(b'{"update_id": 1}', secret=None), 403)
+        self.assertEqual(telegram.post(b'{"update_id": 1}', SECRET, path="/other"), 404)
+        self.assertEqual(telegram.post(b"not json", SECRET), 400)
+        self.assertEqual(telegram.post(b"[1, 2]", SECRET), 400)
+        self.assertEqual(self.updates, [])
+
+    def test_secret_is_required(self):
+        with self.assertRaises(ValueError):
+            start_webhook_server(lambda update: None, "127.0.0.1", 0, WEBHOOK_PATH, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
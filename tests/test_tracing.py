@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+import tracing
+
+
+class TracerTests(unittest.TestCase):
+    def test_spans_record_timestamps_threads_and_args(self):
+        tracer = tracing.Tracer()
+
+        with tracer.span("scan"):
+            with tracer.span("fetch", symbol="BTC/USDT:USDT", timeframe="1h"):
+                time.sleep(0.01)
+            worker = threading.Thread(target=self._record, args=(tracer, "compute"), name="compute_0")
+            worker.start()
+            worker.join()
+
+        trace = tracer.to_dict()
+        spans = {event["name"]: event for event in trace["traceEvents"] if event["ph"] == "X"}
+        self.assertEqual(spans["fetch"]["args"], {"symbol": "BTC/USDT:USDT", "timeframe": "1h"})
+        self.assertGreaterEqual(spans["fetch"]["dur"], 10000)
+        self.assertLessEqual(spans["scan"]["ts"], spans["fetch"]["ts"])
+        self.assertGreaterEqual(spans["scan"]["ts"] + spans["scan"]["dur"], spans["fetch"]["ts"] + spans["fetch"]["dur"])
+        self.assertNotEqual(spans["compute"]["tid"], spans["scan"]["tid"])
+        thread_names = {
+            event["tid"]: event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"
+        }
+        self.assertEqual(thread_names[spans["compute"]["tid"]], "compute_0")
+
+    @staticmethod
+    def _record(tracer, name):
+        with tracer.span(name):
+            pass
+
+    def test_async_spans_pair_begin_and_end_per_coroutine(self):
+        tracer = tracing.Tracer()
+
+        async def fetch(symbol):
+            with tracer.async_span("fetch", symbol=symbol):
+                await asyncio.sleep(0.01)
+
+        async def fetch_all():
+            await asyncio.gather(fetch("BTC"), fetch("ETH"))
+
+        asyncio.run(fetch_all())
+
+        events = [event for event in tracer.to_dict()["traceEvents"] if event.get("cat") == "async"]
+        begins = {event["id"]: event for event in events if event["ph"] == "b"}
+        ends = {event["id"]: event for event in events if event["ph"] == "e"}
+        self.assertEqual(len(begins), 2)
+        self.assertEqual(set(begins), set(ends))
+        self.assertEqual({event["args"]["symbol"] for event in begins.values()}, {"BTC", "ETH"})
+
+    def test_write_produces_compact_json_and_keeps_latest_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory = os.path.join(tmpdir, "traces")
+            paths = []
+            for index in range(4):
+                tracer = tracing.Tracer()
+                tracer.started_at = 1700000000 + index
+                with tracer.span("scan"):
+                    pass
+                paths.append(tracer.write(directory, keep=2))
+
+            self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(path) for path in paths[-2:]))
+            with open(paths[-1], encoding="utf-8") as f:
+                raw = f.read()
+            self.assertNotIn(", ", raw)
+            self.assertEqual(json.loads(raw)["displayTimeUnit"], "ms")
+
+    def test_module_span_is_noop_without_active_trace(self):
+        self.assertIsNone(tracing.stop_trace())
+        with tracing.span("fetch", symbol="BTC"):
+            pass
+
+        tracer = tracing.start_trace()
+        try:
+            with tracing.span("fetch", symbol="BTC"):
+                pass
+        finally:
+            self.assertIs(tracing.stop_trace(), tracer)
+        with tracing.span("after"):
+            pass
+
+        names = [event["name"] for event in tracer.to_dict()["traceEvents"] if event["ph"] == "X"]
+        self.assertEqual(names, ["fetch"])
+
+
+if __name__ == "__main__":
+    unittest.main()
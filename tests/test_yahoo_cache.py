@@ -0,0 +1,105 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from module_loader import load_repo_modules  # noqa: E402
+
+MODULE_NAMES = ("config", "candle_store", "exchange_utils")
+
+
+def make_history(periods, freq):
+    index = pd.date_range("2024-01-01", periods=periods, freq=freq, tz="UTC")
+    prices = np.linspace(100, 200, periods)
+    return pd.DataFrame({
+        "Open": prices,
+        "High": prices + 1,
+        "Low": prices - 1,
+        "Close": prices + 0.5,
+        "Volume": np.ones(periods),
+    }, index=index)
+
+
+class YahooCacheTests(unittest.TestCase):
+    def _load_exchange_utils(self, data_dir):
+        load_repo_modules(self, MODULE_NAMES, {"DATA_DIR": data_dir})
+        return sys.modules["exchange_utils"]
+
+    def _fake_ticker(self, calls):
+        histories = {"1h": make_history(24 * 365, "h"), "1d": make_history(730, "D")}
+
+        def ticker(yahoo_symbol):
+            fake = mock.Mock()
+
+            def history(period, interval):
+                calls.append((yahoo_symbol, period, interval))
+                return histories[interval]
+
+            fake.history.side_effect = history
+            return fake
+
+        return ticker
+
+    def test_each_download_happens_once_per_scan(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils(tmpdir)
+            calls = []
+
+            with mock.patch.object(exchange_utils.yf, "Ticker", side_effect=self._fake_ticker(calls)):
+                frames = {
+                    tf: exchange_utils.get_turtle_data("BTC/USDT:USDT", tf)
+                    for tf in ("1h", "4h", "1d")
+                }
+                again = exchange_utils.get_turtle_data("BTC/USDT:USDT", "1d")
+
+            self.assertEqual(sorted(calls), [("BTC-USD", "1y", "1h"), ("BTC-USD", "2y", "1d")])
+            for df in frames.values():
+                self.assertEqual(len(df), 500)
+            pd.testing.assert_frame_equal(again, frames["1d"])
+            self.assertEqual(frames["4h"]["timestamp"].diff().dropna().unique().tolist(), [pd.Timedelta(hours=4)])
+
+    def test_clear_yahoo_cache_forces_new_download(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils(tmpdir)
+            calls = []
+
+            with mock.patch.object(exchange_utils.yf, "Ticker", side_effect=self._fake_ticker(calls)):
+                exchange_utils.get_turtle_data("ETH/USDT:USDT", "1d")
+                exchange_utils.clear_yahoo_cache()
+                exchange_utils.get_turtle_data("ETH/USDT:USDT", "1d")
+
+            self.assertEqual(len(calls), 2)
+
+    def test_prefetch_splits_one_batched_download_per_interval(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exchange_utils = self._load_exchange_utils(tmpdir)
+            histories = {"1h": make_history(24 * 365, "h"), "1d": make_history(730, "D")}
+            download_calls = []
+
+            def download(tickers, period, interval, **kwargs):
+                download_calls.append((tuple(tickers), period, interval))
+                return pd.concat({ticker: histories[interval] for ticker in tickers}, axis=1)
+
+            with mock.patch.object(exchange_utils.yf, "download", side_effect=download), \
+                 mock.patch.object(exchange_utils.yf, "Ticker", side_effect=AssertionError("should read from cache")):
+                loaded = exchange_utils.prefetch_yahoo_data(["BTC/USDT:USDT", "ETH/USDT:USDT", "PEPE/USDT:USDT"])
+                df = exchange_utils.get_turtle_data("ETH/USDT:USDT", "4h")
+
+            self.assertEqual(loaded, 4)
+            self.assertEqual(
+                sorted(download_calls),
+                [(("BTC-USD", "ETH-USD"), "1y", "1h"), (("BTC-USD", "ETH-USD"), "2y", "1d")],
+            )
+            self.assertEqual(len(df), 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
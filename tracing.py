@@ -0,0 +1,132 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+TRACE_FILE_PREFIX = 'scan-'
+
+
+class Tracer:
+    """
+    单轮扫描的轻量追踪：记录带开始 / 结束时间与线程ID的命名区间，
+    导出为Chrome trace-event JSON（chrome://tracing 或 ui.perfetto.dev 可直接打开）
+    """
+
+    def __init__(self, name='scan'):
+        self.name = name
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._events = []
+        self._threads = {}
+        self._async_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _now_us(self):
+        return round((time.perf_counter() - self._origin) * 1e6, 1)
+
+    def _append(self, event):
+        thread = threading.current_thread()
+        event['pid'] = self._pid
+        event['tid'] = thread.ident
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    @contextmanager
+    def span(self, name, **args):
+        """线程内的同步区间（complete事件），同一线程上的区间按调用关系嵌套显示"""
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            event = {'name': name, 'ph': 'X', 'ts': start, 'dur': round(self._now_us() - start, 1)}
+            if args:
+                event['args'] = args
+            self._append(event)
+
+    @contextmanager
+    def async_span(self, name, **args):
+        """协程区间（async begin/end事件）：同一事件循环线程上交错执行的协程各占一条轨道"""
+        event_id = next(self._async_ids)
+        begin = {'name': name, 'cat': 'async', 'ph': 'b', 'id': event_id, 'ts': self._now_us()}
+        if args:
+            begin['args'] = args
+        self._append(begin)
+        try:
+            yield
+        finally:
+            self._append({'name': name, 'cat': 'async', 'ph': 'e', 'id': event_id, 'ts': self._now_us()})
+
+    def to_dict(self):
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in threads.items()
+        ]
+        return {
+            'traceEvents': metadata + events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'name': self.name, 'started_at': self.started_at},
+        }
+
+    def write(self, directory, keep=None):
+        """写入 directory/scan-<UTC时间>.json（紧凑JSON），keep为保留的最近文件数，返回文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(self.started_at))
+        millis = int(self.started_at * 1000) % 1000
+        path = os.path.join(directory, f"{TRACE_FILE_PREFIX}{stamp}-{millis:03d}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        if keep:
+            prune_traces(directory, keep)
+        return path
+
+
+def prune_traces(directory, keep):
+    """只保留最近 keep 个追踪文件"""
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(TRACE_FILE_PREFIX) and name.endswith('.json')
+    )
+    for name in names[:-keep]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError as e:
+            logging.warning(f"删除旧追踪文件{name}失败: {e}")
+
+
+# 当前扫描的追踪器；未开启追踪或不在扫描中时为None，span() 退化为空操作
+_active = None
+
+
+def start_trace(name='scan'):
+    global _active
+    _active = Tracer(name)
+    return _active
+
+
+def stop_trace():
+    """结束当前追踪并返回追踪器（没有进行中的追踪时返回None）"""
+    global _active
+    tracer, _active = _active, None
+    return tracer
+
+
+def span(name, **args):
+    """在当前扫描的追踪中记录一个区间，没有进行中的追踪时不做任何事"""
+    tracer = _active
+    return tracer.span(name, **args) if tracer is not None else nullcontext()
+
+
+def async_span(name, **args):
+    """span() 的协程版本"""
+    tracer = _active
+    return tracer.async_span(name, **args) if tracer is not None else nullcontext()
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import USER_DB_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id TEXT PRIMARY KEY,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lockouts (
+    user_id TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    since REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+LEGACY_IMPORT_KEY = 'legacy_files_imported'
+
+
+class UserStore:
+    """
+    订阅用户、用户设置与订阅密码锁定状态的SQLite存储（WAL模式）。
+    首次读取时整表载入进程内缓存，之后读操作只查内存；写操作先写库（单行）再更新缓存。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._users = None
+        self._settings = None
+        self._lockouts = None
+
+    def _connect(self):
+        if self._conn is None:
+            parent_dir = os.path.dirname(self.path)
+            if parent_dir:
+                os.makedirs(parent_dir, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            os.chmod(self.path, 0o600)
+        return self._conn
+
+    def _load(self):
+        if self._users is not None:
+            return
+        conn = self._connect()
+        self._users = {row[0] for row in conn.execute('SELECT user_id FROM users')}
+        self._settings = {}
+        for user_id, raw in conn.execute('SELECT user_id, settings FROM user_settings'):
+            try:
+                self._settings[user_id] = json.loads(raw)
+            except ValueError:
+                logging.error(f"用户{user_id}的设置无法解析，已忽略")
+        self._lockouts = {
+            user_id: (failures, since)
+            for user_id, failures, since in conn.execute('SELECT user_id, failures, since FROM lockouts')
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._users = self._settings = self._lockouts = None
+
+    # 订阅用户
+    def list_users(self):
+        with self._lock:
+            self._load()
+            return set(self._users)
+
+    def has_user(self, user_id):
+        with self._lock:
+            self._load()
+            return str(user_id) in self._users
+
+    def add_user(self, user_id):
+        """添加订阅用户，已存在时返回False"""
+        user_id = str(user_id)
+        with self._lock:
+            self._load()
+            if user_id in self._users:
+                return False
+            self._conn.execute('INSERT OR IGNORE INTO users (user_id, added_at) VALUES (?, ?)', (user_id, time.time()))
+            self._users.add(user_id)
+            return True
+
+    def remove_user(self, user_id):
+        """移除订阅用户（保留其设置，重新订阅后沿用），不存在时返回False"""
+        user_id = str(user_id)
+        with self._lock:
+            self._load()
+            if user_id not in self._users:
+                return False
+            self._conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+            self._users.discard(user_id)
+            return True
+
+    # 用户设置
+    def get_settings(self, user_id):
+        """返回用户设置的副本，未设置过时返回None"""
+        with self._lock:
+            self._load()
+            settings = self._settings.get(str(user_id))
+            return json.loads(json.dumps(settings)) if settings is not None else None
+
+    def all_settings(self):
+        with self._lock:
+            self._load()
+            return json.loads(json.dumps(self._settings))
+
+    def set_settings(self, user_id, settings):
+        user_id = str(user_id)
+        raw = json.dumps(settings, ensure_ascii=False)
+        with self._lock:
+            self._load()
+            self._conn.execute(
+                'INSERT INTO user_settings (user_id, settings) VALUES (?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET settings = excluded.settings',
+                (user_id, raw),
+            )
+            self._settings[user_id] = json.loads(raw)
+
+    # 订阅密码错误计数 / 锁定状态
+    def get_lockout(self, user_id):
+        """返回 (错误次数, 首次提示或锁定时间)，没有记录时返回None"""
+        with self._lock:
+            self._load()
+            return self._lockouts.get(str(user_id))
+
+    def set_lockout(self, user_id, failures, since):
+        user_id = str(user_id)
+        with self._lock:
+            self._load()
+            self._conn.execute(
+                'INSERT INTO lockouts (user_id, failures, since) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET failures = excluded.failures, since = excluded.since',
+                (user_id, int(failures), float(since)),
+            )
+            self._lockouts[user_id] = (int(failures), float(since))
+
+    def clear_lockout(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._load()
+            if self._lockouts.pop(user_id, None) is not None:
+                self._conn.execute('DELETE FROM lockouts WHERE user_id = ?', (user_id,))
+
+    def import_legacy_files(self, allowed_users_file, user_settings_file):
+        """
+        一次性导入旧版 allowed_users.txt / user_settings.json，导入后在meta表记录标记，
+        之后不再读取旧文件。返回是否执行了导入
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn.execute('SELECT 1 FROM meta WHERE key = ?', (LEGACY_IMPORT_KEY,)).fetchone():
+                return False
+
+            users = []
+            if os.path.exists(allowed_users_file):
+                with open(allowed_users_file, 'r', encoding='utf-8') as f:
+                    users = [line.strip() for line in f if line.strip()]
+            settings = {}
+            if os.path.exists(user_settings_file):
+                try:
+                    with open(user_settings_file, 'r', encoding='utf-8') as f:
+                        settings = json.load(f)
+                except ValueError as e:
+                    logging.error(f"旧版用户设置文件解析失败，跳过导入设置: {e}")
+            settings = {
+                str(user_id): value for user_id, value in settings.items() if isinstance(value, dict)
+            } if isinstance(settings, dict) else {}
+
+            now = time.time()
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO users (user_id, added_at) VALUES (?, ?)',
+                    [(user_id, now) for user_id in users],
+                )
+                conn.executemany(
+                    'INSERT OR IGNORE INTO user_settings (user_id, settings) VALUES (?, ?)',
+                    [(user_id, json.dumps(value, ensure_ascii=False)) for user_id, value in settings.items()],
+                )
+                conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (LEGACY_IMPORT_KEY, str(now)))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            # 缓存在下次读取时按导入后的表重新载入
+            self._users = self._settings = self._lockouts = None
+            logging.info(f"已从旧版文件导入 {len(set(users))} 个用户、{len(settings)} 份用户设置")
+            return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """进程内共享的用户存储（USER_DB_FILE）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UserStore(USER_DB_FILE)
+        return _store
@@ -1,6 +1,8 @@
 import errno
 import os
 import shutil
+import threading
+import time
 
 
 def ensure_dir_exists(directory):
@@ -61,6 +63,7 @@ def prepare_runtime_state(
     user_settings_file,
     log_file,
     legacy_base_dir,
+    user_db_file=None,
 ):
     ensure_dir_exists(data_dir)
     ensure_dir_exists(tmp_dir)
@@ -72,3 +75,45 @@ def prepare_runtime_state(
 
     ensure_file_exists(allowed_users_file)
     ensure_file_exists(user_settings_file)
+
+    if user_db_file:
+        # 旧版用户文件一次性导入SQLite用户库，之后只读写用户库
+        from user_store import UserStore
+
+        store = UserStore(user_db_file)
+        try:
+            store.import_legacy_files(allowed_users_file, user_settings_file)
+        finally:
+            store.close()
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器，rate为每秒补充的令牌数，capacity为允许的突发量"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        立即扣除令牌并返回调用方还需等待的秒数（令牌不足时允许透支，
+        后来者排在透支之后），同步与异步调用方都可以用它来排队
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """阻塞直到获得令牌，返回实际等待的秒数"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay